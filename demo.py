@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 """Demo file showing how to use the mitemp library."""
+# The library and the backends are only imported when a command needs them,
+# so that the command line starts quickly.
+# pylint: disable=import-outside-toplevel
 
 import argparse
+from collections import OrderedDict
+import importlib
 import re
-import logging
 import sys
+import time
 
-from btlewrap import available_backends, BluepyBackend, GatttoolBackend, PygattBackend
-from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, \
-    MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY
+BACKENDS = OrderedDict([
+    ('gatttool', ('btlewrap.gatttool', 'GatttoolBackend')),
+    ('bluepy', ('btlewrap.bluepy', 'BluepyBackend')),
+    ('pygatt', ('btlewrap.pygatt', 'PygattBackend')),
+])
+
+# the keys of MiTempBtPoller.read_all() and the details of the read
+FIELDS = ['mac', 'temperature', 'humidity', 'battery', 'firmware', 'name', 'latency', 'error']
 
 
 def valid_mitemp_mac(mac, pat=re.compile(r"[0-9A-F]{2}:[0-9A-F]{2}:[0-9A-F]{2}:[0-9A-F]{2}:[0-9A-F]{2}:[0-9A-F]{2}")):
@@ -18,10 +28,31 @@ def valid_mitemp_mac(mac, pat=re.compile(r"[0-9A-F]{2}:[0-9A-F]{2}:[0-9A-F]{2}:[
     return mac
 
 
+def read_macs(path):
+    """Read MAC addresses from a file, one per line, "-" is stdin. Empty lines and # comments are ignored."""
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, encoding='utf-8') as mac_file:
+            lines = mac_file.readlines()
+    macs = [line.split('#', 1)[0].strip() for line in lines]
+    return [valid_mitemp_mac(mac) for mac in macs if mac]
+
+
 def poll(args):
-    """Poll data from the sensor."""
+    """Poll data from the sensors."""
     backend = _get_backend(args)
-    poller = MiTempBtPoller(args.mac, backend)
+    macs = list(args.mac)
+    if args.file:
+        macs.extend(read_macs(args.file))
+    if not macs:
+        print('No MAC address given', file=sys.stderr)
+        sys.exit(2)
+    if len(macs) > 1 or args.format != 'text':
+        sys.exit(poll_many(macs, backend, args))
+
+    from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY
+    poller = MiTempBtPoller(macs[0], backend, adapter=args.adapter[0])
     print("Getting data from Mi Temperature and Humidity Sensor")
     print("FW: {}".format(poller.firmware_version()))
     print("Name: {}".format(poller.name()))
@@ -30,32 +61,83 @@ def poll(args):
     print("Humidity: {}".format(poller.parameter_value(MI_HUMIDITY)))
 
 
-# def scan(args):
-#     """Scan for sensors."""
-#     backend = _get_backend(args)
-#     print('Scanning for 10 seconds...')
-#     devices = mitemp_scanner.scan(backend, 10)
-#     devices = []
-#     print('Found {} devices:'.format(len(devices)))
-#     for device in devices:
-#         print('  {}'.format(device))
+def poll_many(macs, backend, args):
+    """Read the sensors concurrently and print one record per sensor as soon as it is read.
+
+    Returns the exit code, 1 if any sensor could not be read.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    write = _record_writer(args.format)
+    failed = False
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(_read_sensor, mac, backend, args.adapter[index % len(args.adapter)], args.timeout)
+                   for index, mac in enumerate(macs)]
+        for future in as_completed(futures):
+            record = future.result()
+            failed = failed or record['error'] is not None
+            write(record)
+            sys.stdout.flush()
+    return 1 if failed else 0
+
+
+def _read_sensor(mac, backend, adapter, timeout):
+    """Read all values of a sensor and return them as record, with the error if it failed."""
+    from mitemp_bt.mitemp_bt_poller import MiTempBtPoller
+    record = OrderedDict((field, None) for field in FIELDS)
+    record['mac'] = mac
+    start = time.monotonic()
+    try:
+        record.update(MiTempBtPoller(mac, backend, adapter=adapter).read_all(timeout=timeout))
+    # any failure is reported in the record of the sensor, the other sensors are still read
+    except Exception as exception:  # pylint: disable=broad-except
+        record['error'] = str(exception) or type(exception).__name__
+    record['latency'] = round(time.monotonic() - start, 3)
+    return record
+
+
+def _record_writer(output_format):
+    """Return a function printing a record in the given format."""
+    if output_format == 'json':
+        import json
+        return lambda record: print(json.dumps(record))
+    if output_format == 'csv':
+        import csv
+        writer = csv.DictWriter(sys.stdout, FIELDS)
+        writer.writeheader()
+        return writer.writerow
+
+    def write_text(record):
+        """Print a record as human readable text."""
+        if record['error'] is not None:
+            print('{mac}: error: {error} ({latency} s)'.format(**record))
+        else:
+            print('{mac}: temperature={temperature} humidity={humidity} battery={battery} ({latency} s)'.format(
+                **record))
+    return write_text
+
+
+def scan(args):
+    """Scan for sensors."""
+    from mitemp_bt import mitemp_scanner
+    backend = _get_backend(args)
+    print('Scanning for {} seconds...'.format(args.timeout))
+    devices = mitemp_scanner.scan(backend, args.timeout, adapter=args.adapter)
+    print('Found {} devices:'.format(len(devices)))
+    for device in devices:
+        print('  {}'.format(device))
 
 
 def _get_backend(args):
-    """Extract the backend class from the command line arguments."""
-    if args.backend == 'gatttool':
-        backend = GatttoolBackend
-    elif args.backend == 'bluepy':
-        backend = BluepyBackend
-    elif args.backend == 'pygatt':
-        backend = PygattBackend
-    else:
+    """Import the backend class chosen on the command line."""
+    if args.backend not in BACKENDS:
         raise Exception('unknown backend: {}'.format(args.backend))
-    return backend
+    module, name = BACKENDS[args.backend]
+    return getattr(importlib.import_module(module), name)
 
 
 def list_backends(_):
     """List all available backends."""
+    from btlewrap import available_backends
     backends = [b.__name__ for b in available_backends()]
     print('\n'.join(backends))
 
@@ -66,23 +148,35 @@ def main():
     Mostly parsing the command line arguments.
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument('--backend', choices=['gatttool', 'bluepy', 'pygatt'], default='gatttool')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='gatttool')
     parser.add_argument('-v', '--verbose', action='store_const', const=True)
     subparsers = parser.add_subparsers(help='sub-command help', )
 
-    parser_poll = subparsers.add_parser('poll', help='poll data from a sensor')
-    parser_poll.add_argument('mac', type=valid_mitemp_mac)
+    parser_poll = subparsers.add_parser('poll', help='poll data from sensors')
+    parser_poll.add_argument('mac', type=valid_mitemp_mac, nargs='*')
+    parser_poll.add_argument('-f', '--file', help='file with one MAC address per line, - for stdin')
+    parser_poll.add_argument('--format', choices=['text', 'json', 'csv'], default='text',
+                             help='output format, json gives one line per sensor')
+    parser_poll.add_argument('--workers', type=int, default=4, help='number of sensors read at the same time')
+    parser_poll.add_argument('--timeout', type=float, help='seconds to spend on each sensor')
+    parser_poll.add_argument('--adapter', action='append',
+                             help='Bluetooth adapter to use, repeat to spread the sensors over several adapters')
     parser_poll.set_defaults(func=poll)
 
-    # parser_scan = subparsers.add_parser('scan', help='scan for devices')
-    # parser_scan.set_defaults(func=scan)
+    parser_scan = subparsers.add_parser('scan', help='scan for devices')
+    parser_scan.add_argument('--timeout', type=int, default=10, help='scan duration in seconds')
+    parser_scan.add_argument('--adapter', default='hci0', help='Bluetooth adapter to scan with')
+    parser_scan.set_defaults(func=scan)
 
     parser_scan = subparsers.add_parser('backends', help='list the available backends')
     parser_scan.set_defaults(func=list_backends)
 
     args = parser.parse_args()
+    if getattr(args, 'func', None) is poll and not args.adapter:
+        args.adapter = ['hci0']
 
     if args.verbose:
+        import logging
         logging.basicConfig(level=logging.DEBUG)
 
     if not hasattr(args, "func"):
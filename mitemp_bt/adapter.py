@@ -0,0 +1,198 @@
+""""
+Process-wide coordination of the connections on each Bluetooth adapter.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import count
+import logging
+from threading import Condition, Lock, local
+import time
+from weakref import WeakSet
+from btlewrap.base import BluetoothBackendException
+
+_LOGGER = logging.getLogger(__name__)
+
+AdapterStats = namedtuple('AdapterStats', ['adapter', 'pollers', 'queue_depth', 'active', 'connections',
+                                           'timeouts', 'total_wait', 'max_wait'])
+AdapterStats.__doc__ = """Statistics of an adapter, wait times in seconds."""
+
+# lower values connect first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_PRIORITY = local()
+
+
+def current_priority():
+    """Return the priority the current thread connects with."""
+    return getattr(_PRIORITY, 'value', PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def read_priority(priority):
+    """Connect with "priority" in the with block, in the current thread.
+
+    Reads run with PRIORITY_INTERACTIVE unless they are wrapped in this, the
+    background helpers of this package use PRIORITY_BACKGROUND.
+    """
+    previous = current_priority()
+    _PRIORITY.value = priority
+    try:
+        yield
+    finally:
+        _PRIORITY.value = previous
+
+
+class _Ticket:  # pylint: disable=too-few-public-methods
+    """A caller waiting in an AdapterQueue."""
+
+    def __init__(self, priority, number, start):
+        self.priority = priority
+        self.number = number
+        self.start = start
+
+
+class AdapterQueue:
+    """"
+    Connection queue of one adapter.
+
+    At most "max_connections" connections are open at a time, the others
+    wait by priority and then in the order they arrived. Open connections
+    are never interrupted, a waiting caller with a higher priority gets the
+    next free connection. Every "aging" seconds of waiting raise the
+    priority of a caller by one, so background reads are not starved by a
+    steady stream of interactive ones.
+    """
+
+    def __init__(self, adapter, max_connections=1, aging=30):
+        self.adapter = adapter
+        self.max_connections = max_connections
+        self.aging = aging
+        self._condition = Condition(Lock())
+        self._waiting = []
+        self._numbers = count()
+        self._active = 0
+        self._connections = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _next(self):
+        """Return the ticket of the caller whose turn it is, the lock must be held."""
+        now = time.monotonic()
+        return min(self._waiting, key=lambda ticket: (
+            ticket.priority - (now - ticket.start) // self.aging, ticket.number))
+
+    def acquire(self, timeout=None, priority=None):
+        """Wait for the turn of the caller, at most "timeout" seconds.
+
+        The caller waits with the priority of current_priority() unless
+        another "priority" is given. Returns False if the timeout ran out
+        first.
+        """
+        start = time.monotonic()
+        with self._condition:
+            ticket = _Ticket(current_priority() if priority is None else priority, next(self._numbers), start)
+            self._waiting.append(ticket)
+            while self._active >= self.max_connections or self._next() is not ticket:
+                left = None if timeout is None else timeout - (time.monotonic() - start)
+                if left is not None and left <= 0:
+                    self._waiting.remove(ticket)
+                    self._timeouts += 1
+                    self._condition.notify_all()
+                    return False
+                if self._active < self.max_connections:
+                    # the caller whose turn it is may have aged past this one since it was woken up
+                    self._condition.notify_all()
+                self._condition.wait(left)
+            self._waiting.remove(ticket)
+            self._active += 1
+            if self._waiting and self._active < self.max_connections:
+                # the next caller may connect as well
+                self._condition.notify_all()
+            wait = time.monotonic() - start
+            self._connections += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return True
+
+    @contextmanager
+    def hold(self, timeout=None, priority=None):
+        """Hold a connection of the adapter in the with block, e.g. for a scan.
+
+        Raises BluetoothBackendException if the adapter stays busy for
+        "timeout" seconds.
+        """
+        if not self.acquire(timeout, priority):
+            raise BluetoothBackendException('Adapter {} stayed busy for {} seconds'.format(self.adapter, timeout))
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        """Let the next caller connect."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @property
+    def queue_depth(self):
+        """Return the number of callers waiting to connect."""
+        return len(self._waiting)
+
+    def stats(self, pollers=0):
+        """Return the statistics of this adapter as AdapterStats."""
+        with self._condition:
+            return AdapterStats(self.adapter, pollers, len(self._waiting), self._active, self._connections,
+                                self._timeouts, self._total_wait, self._max_wait)
+
+
+class AdapterManager:
+    """"
+    Owner of the connection queues of all adapters.
+
+    Pollers register with the manager and connect through the queue of
+    their adapter, so pollers sharing an adapter take turns instead of
+    failing with "device busy". All pollers use ADAPTER_MANAGER unless they
+    get another one. Adapters that can hold several connections at once
+    can be given a higher "max_connections". "aging" is passed on to the
+    queues.
+    """
+
+    def __init__(self, max_connections=1, aging=30):
+        self.max_connections = max_connections
+        self.aging = aging
+        self._queues = {}
+        self._pollers = {}
+        self._lock = Lock()
+
+    def queue(self, adapter):
+        """Return the connection queue of an adapter."""
+        with self._lock:
+            if adapter not in self._queues:
+                self._queues[adapter] = AdapterQueue(adapter, self.max_connections, self.aging)
+                self._pollers[adapter] = WeakSet()
+            return self._queues[adapter]
+
+    def register(self, poller):
+        """Register a poller with the queue of its adapter and return the queue."""
+        queue = self.queue(poller.adapter)
+        with self._lock:
+            self._pollers[poller.adapter].add(poller)
+        return queue
+
+    def unregister(self, poller):
+        """Forget a poller, pollers are also forgotten when they are garbage collected."""
+        with self._lock:
+            self._pollers.get(poller.adapter, WeakSet()).discard(poller)
+
+    def stats(self):
+        """Return the AdapterStats of all adapters, keyed by adapter."""
+        with self._lock:
+            queues = [(queue, len(self._pollers[adapter])) for adapter, queue in self._queues.items()]
+        return {queue.adapter: queue.stats(pollers) for queue, pollers in queues}
+
+
+ADAPTER_MANAGER = AdapterManager()
@@ -0,0 +1,286 @@
+""""
+Archive readings on disk in a compact binary format for fast range queries.
+
+An archive is a directory with the file "macs", one MAC address per line,
+and append-only segment files "segment-NNNNNN". A segment starts with an
+8 byte header (magic "MTA1", format version, record size) followed by
+14 byte little-endian records, sorted by time:
+    timestamp    float64 seconds since the epoch
+    temperature  int16 tenths of a degree
+    humidity     int16 tenths of a percent
+    mac          uint16 line of the MAC address in "macs", starting at 0
+"""
+
+from bisect import bisect_left, insort
+from datetime import datetime
+import logging
+import mmap
+import os
+import struct
+from threading import Lock
+from mitemp_bt.mitemp_bt_poller import Reading
+
+_LOGGER = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<4sHH')
+_RECORD = struct.Struct('<dhhH')
+_MAGIC = b'MTA1'
+_VERSION = 1
+_MACS = 'macs'
+_SEGMENT = 'segment-{:06d}'
+
+
+def _segments(directory):
+    """Return the paths of the segment files in the order they were written."""
+    names = sorted(name for name in os.listdir(directory) if name.startswith('segment-'))
+    return [os.path.join(directory, name) for name in names]
+
+
+def _read_macs(directory):
+    """Return the MAC addresses of an archive in the order of their index."""
+    try:
+        with open(os.path.join(directory, _MACS), 'r', encoding='utf-8') as macs:
+            return [line.strip() for line in macs if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class _SensorArchive:  # pylint: disable=too-few-public-methods
+    """Archive of one sensor, pass it to MiTempBtPoller as "history"."""
+
+    def __init__(self, writer, mac):
+        self._writer = writer
+        self._mac = mac
+
+    def append(self, reading):
+        """Archive a reading of the sensor."""
+        return self._writer.append(self._mac, reading)
+
+
+class ArchiveWriter:
+    """"
+    Append readings to an archive directory.
+
+    Readings are kept in memory, sorted by time, until "buffer_size" of
+    them are pending or flush() is called, so readings of several sensors
+    arriving slightly out of order are still archived in order. Readings
+    older than the last archived one are dropped. A new segment is started
+    every "segment_records" records. Only one writer may use a directory at
+    a time, close() the writer to archive the pending readings.
+    """
+
+    def __init__(self, directory, segment_records=65536, buffer_size=32):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_records = segment_records
+        self.buffer_size = buffer_size
+        self._macs = {mac: index for index, mac in enumerate(_read_macs(directory))}
+        self._pending = []
+        self._lock = Lock()
+        self._segment = None
+        self._segment_number = -1
+        self._segment_count = 0
+        self._last_timestamp = None
+        self._open_last_segment()
+
+    def _open_last_segment(self):
+        """Continue the last segment of the archive, if there is one."""
+        segments = _segments(self.directory)
+        if not segments:
+            return
+        self._segment_number = int(segments[-1].rsplit('-', 1)[1])
+        size = os.path.getsize(segments[-1])
+        self._segment_count = max(size - _HEADER.size, 0) // _RECORD.size
+        if self._segment_count:
+            with open(segments[-1], 'rb') as segment:
+                segment.seek(_HEADER.size + (self._segment_count - 1) * _RECORD.size)
+                self._last_timestamp = _RECORD.unpack(segment.read(_RECORD.size))[0]
+        # drop a record that was only partly written
+        self._segment = open(segments[-1], 'r+b')  # pylint: disable=consider-using-with
+        self._segment.truncate(_HEADER.size + self._segment_count * _RECORD.size)
+        self._segment.seek(0, os.SEEK_END)
+
+    def _next_segment(self):
+        """Close the current segment and start a new one."""
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_number += 1
+        self._segment_count = 0
+        path = os.path.join(self.directory, _SEGMENT.format(self._segment_number))
+        self._segment = open(path, 'wb')  # pylint: disable=consider-using-with
+        self._segment.write(_HEADER.pack(_MAGIC, _VERSION, _RECORD.size))
+
+    def _mac_index(self, mac):
+        """Return the index of a MAC address, adding it to the archive if it is new."""
+        mac = mac.upper()
+        if mac not in self._macs:
+            with open(os.path.join(self.directory, _MACS), 'a', encoding='utf-8') as macs:
+                macs.write(mac + '\n')
+            self._macs[mac] = len(self._macs)
+        return self._macs[mac]
+
+    def sensor(self, mac):
+        """Return the archive of one sensor, to pass to MiTempBtPoller as "history"."""
+        return _SensorArchive(self, mac)
+
+    def append(self, mac, reading):
+        """Archive a Reading of a sensor, returns False if it is older than the archived readings."""
+        record = (reading.timestamp.timestamp(), round(reading.temperature * 10), round(reading.humidity * 10))
+        with self._lock:
+            if self._last_timestamp is not None and record[0] < self._last_timestamp:
+                _LOGGER.debug('Not archiving reading of %s older than the archive', mac)
+                return False
+            insort(self._pending, record + (self._mac_index(mac),))
+            if len(self._pending) >= self.buffer_size:
+                self._flush()
+        return True
+
+    def _flush(self):
+        """Write the pending records, the lock must be held."""
+        for record in self._pending:
+            if self._segment is None or self._segment_count >= self.segment_records:
+                self._next_segment()
+            self._segment.write(_RECORD.pack(*record))
+            self._segment_count += 1
+            self._last_timestamp = record[0]
+        self._pending = []
+        if self._segment is not None:
+            self._segment.flush()
+
+    def flush(self):
+        """Write all pending readings to disk."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Write all pending readings and close the archive."""
+        with self._lock:
+            self._flush()
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Timestamps:  # pylint: disable=too-few-public-methods
+    """Timestamps of the records of a mapped segment as sequence, for bisect."""
+
+    def __init__(self, data, count):
+        self._data = data
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return _RECORD.unpack_from(self._data, _HEADER.size + index * _RECORD.size)[0]
+
+
+class _Segment:
+    """A segment file mapped into memory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.count = max(self.size - _HEADER.size, 0) // _RECORD.size
+        self._data = None
+        if self.count:
+            with open(path, 'rb') as segment:
+                self._data = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size = _HEADER.unpack_from(self._data)
+            if magic != _MAGIC or version != _VERSION or record_size != _RECORD.size:
+                self.close()
+                raise ValueError('{} is not a segment of a mitemp_bt archive'.format(path))
+        self.timestamps = _Timestamps(self._data, self.count)
+
+    def records(self, since, until):
+        """Yield the records from "since" until before "until", None means unbounded."""
+        first = 0 if since is None else bisect_left(self.timestamps, since)
+        last = self.count if until is None else bisect_left(self.timestamps, until)
+        if first >= last:
+            return
+        view = memoryview(self._data)[_HEADER.size + first * _RECORD.size:_HEADER.size + last * _RECORD.size]
+        try:
+            yield from _RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def close(self):
+        """Unmap the segment."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+
+class ArchiveReader:
+    """"
+    Query an archive directory written by ArchiveWriter.
+
+    Segments are mapped into memory and searched by time, so a query only
+    touches the pages of the records it returns, plus the first record of
+    every segment. Readings archived after the reader was opened are found
+    as well.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._segments = {}
+        self._macs = []
+        self._lock = Lock()
+
+    def _refresh(self):
+        """Return the segments of the archive, mapping new and grown segments."""
+        segments = []
+        for path in _segments(self.directory):
+            segment = self._segments.get(path)
+            if segment is None or segment.size != os.path.getsize(path):
+                # a grown segment is mapped again, the old mapping may still be read by a running query
+                segment = self._segments[path] = _Segment(path)
+            if segment.count:
+                segments.append(segment)
+        self._macs = _read_macs(self.directory)
+        return segments
+
+    @property
+    def macs(self):
+        """Return the MAC addresses of all archived sensors."""
+        return _read_macs(self.directory)
+
+    def readings(self, since=None, until=None, macs=None):
+        """Yield (MAC, Reading) of the readings from "since" until before "until" (datetimes), oldest first.
+
+        Pass a list of MAC addresses as "macs" to get only their readings.
+        """
+        since = None if since is None else since.timestamp()
+        until = None if until is None else until.timestamp()
+        with self._lock:
+            segments = self._refresh()
+            names = self._macs
+        starts = [segment.timestamps[0] for segment in segments]
+        # the first segment that may contain "since"
+        first = 0 if since is None else max(bisect_left(starts, since) - 1, 0)
+        wanted = None if macs is None else {mac.upper() for mac in macs}
+        for segment in segments[first:]:
+            if until is not None and segment.timestamps[0] >= until:
+                return
+            for timestamp, temperature, humidity, mac in segment.records(since, until):
+                if wanted is None or names[mac] in wanted:
+                    yield names[mac], Reading(temperature / 10, humidity / 10, datetime.fromtimestamp(timestamp))
+
+    def close(self):
+        """Unmap all segments."""
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
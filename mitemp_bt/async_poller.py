@@ -0,0 +1,172 @@
+""""
+asyncio interface for the Mi Temp environmental (Temp and humidity) sensor.
+"""
+
+import asyncio
+import functools
+import logging
+from threading import Event
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller
+
+_LOGGER = logging.getLogger(__name__)
+
+# asyncio.get_event_loop() is deprecated in coroutines, get_running_loop() exists from Python 3.7 on
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+# ends the queue of a stream
+_END = (None, None)
+
+
+class AsyncMiTempBtPoller:
+    """"
+    A class to read data from Mi Temp sensors from asyncio code.
+
+    The blocking Bluetooth communication of MiTempBtPoller runs in an
+    executor, so the event loop is never blocked. Concurrent calls for the
+    same value share one read. Pass a bounded executor to share a fixed
+    number of threads between many sensors, by default the executor of
+    the event loop is used.
+    """
+
+    def __init__(self, mac, backend, cache_timeout=600, retries=3, adapter='hci0', executor=None):
+        """
+        Initialize an asyncio Mi Temp Poller for the given MAC address.
+        """
+        self._poller = MiTempBtPoller(mac, backend, cache_timeout=cache_timeout,
+                                      retries=retries, adapter=adapter)
+        self._executor = executor
+        self._in_flight = {}
+
+    @property
+    def poller(self):
+        """Return the underlying blocking poller."""
+        return self._poller
+
+    async def name(self, timeout=None):
+        """Return the name of the sensor."""
+        return await self._run(timeout, 'name')
+
+    async def firmware_version(self, timeout=None):
+        """Return the firmware version."""
+        return await self._run(timeout, 'firmware_version')
+
+    async def battery_level(self, timeout=None):
+        """Return the battery level."""
+        return await self._run(timeout, 'battery_level')
+
+    async def parameter_value(self, parameter, read_cached=True, timeout=None):
+        """Return a value of one of the monitored paramaters.
+
+        See MiTempBtPoller.parameter_value(). Raises asyncio.TimeoutError
+        if no value is available within "timeout" seconds.
+        """
+        return await self._run(timeout, 'parameter_value', parameter, read_cached)
+
+    async def read_all(self, read_cached=True, timeout=None):
+        """Return all values of the sensor at once, see MiTempBtPoller.read_all()."""
+        return await self._run(timeout, 'read_all', read_cached)
+
+    async def stream(self):
+        """Yield a Reading for every sensor data notification, see MiTempBtPoller.stream().
+
+        The connection is kept in a thread of the executor until the stream
+        is closed, call aclose() on it when breaking out of the iteration.
+        """
+        loop = _running_loop()
+        queue = asyncio.Queue()
+        stop = Event()
+        loop.run_in_executor(self._executor, self._produce, loop, queue, stop)
+        try:
+            while True:
+                reading, exception = await queue.get()
+                if exception is not None:
+                    raise exception
+                if reading is None:
+                    return
+                yield reading
+        finally:
+            stop.set()
+
+    def _produce(self, loop, queue, stop):
+        """Run the blocking stream and hand its readings to the queue of the event loop.
+
+        Any exception of the stream is handed over as well, and the queue
+        is always ended, so the consumer never waits for a stream that is
+        gone.
+        """
+        try:
+            for reading in self._poller.stream(stop):
+                self._put(loop, queue, stop, (reading, None))
+        except BaseException as exception:  # pylint: disable=broad-except
+            self._put(loop, queue, stop, (None, exception))
+        finally:
+            self._put(loop, queue, stop, _END)
+
+    @staticmethod
+    def _put(loop, queue, stop, item):
+        """Put an item into the queue, unless the event loop is closed already."""
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            stop.set()
+
+    async def _run(self, timeout, method, *args):
+        """Run a method of the poller in the executor.
+
+        If the same call is already running, wait for its result instead of
+        starting another one, each caller waits at most its own timeout.
+        The read gets the deadline of the caller starting it, so the
+        executor thread gives up in time and frees the poller and the
+        adapter. If it fails while a caller with a later or no deadline is
+        still waiting, that caller reads again. Cancelling a caller does
+        not affect the other callers of the shared read.
+        """
+        loop = _running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        key = (method,) + args
+        while True:
+            call = self._in_flight.get(key)
+            if call is None:
+                call = self._start(loop, key, deadline, method, args)
+            else:
+                _LOGGER.debug('Joining running call %s for sensor %s', key, self._poller.mac)
+            try:
+                return await asyncio.wait_for(asyncio.shield(call.future),
+                                              None if deadline is None else deadline - loop.time())
+            except BluetoothBackendException:
+                if not call.ends_before(deadline):
+                    raise
+                _LOGGER.debug('Shared call %s for sensor %s failed before the deadline, reading again',
+                              key, self._poller.mac)
+
+    def _start(self, loop, key, deadline, method, args):
+        """Start a call of the poller in the executor, shared until it is done."""
+        timeout = None if deadline is None else max(deadline - loop.time(), 0)
+        future = loop.run_in_executor(self._executor,
+                                      functools.partial(getattr(self._poller, method), *args, timeout=timeout))
+        call = _Call(future, deadline)
+        self._in_flight[key] = call
+        future.add_done_callback(functools.partial(self._done, key, call))
+        return call
+
+    def _done(self, key, call, future):
+        """Forget a finished call."""
+        if self._in_flight.get(key) is call:
+            del self._in_flight[key]
+        if future.cancelled():
+            return
+        # retrieve the exception, so asyncio does not log it if nobody waits for it any more
+        future.exception()
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """A running call of the poller, shared by all callers of the same method with the same arguments."""
+
+    def __init__(self, future, deadline):
+        self.future = future
+        self.deadline = deadline
+
+    def ends_before(self, deadline):
+        """Check if the call gives up earlier than a caller with the given deadline."""
+        return self.deadline is not None and (deadline is None or self.deadline < deadline)
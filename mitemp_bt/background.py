@@ -0,0 +1,45 @@
+""""
+Helper for the classes running a loop in a background thread.
+"""
+
+from threading import Thread, Event
+
+
+class BackgroundThread:
+    """"
+    Base class for helpers doing their work in a background thread.
+
+    Subclasses implement _run_once(), which is called over and over again
+    until stop() is called. Use self._stop.wait() to pause between runs, it
+    returns early when stopping.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._thread = None
+        self._stop = Event()
+
+    def start(self):
+        """Start the background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for it."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """Loop until stopped."""
+        while not self._stop.is_set():
+            self._run_once()
+
+    def _run_once(self):
+        """Do one piece of work."""
+        raise NotImplementedError
@@ -0,0 +1,55 @@
+""""
+Decode many raw sensor data payloads at once, e.g. from a capture.
+"""
+
+from array import array
+from collections import namedtuple
+from mitemp_bt.history import numpy_module
+from mitemp_bt.mitemp_bt_poller import SENSOR_DATA_PATTERN
+
+DecodedPayloads = namedtuple('DecodedPayloads', ['temperature', 'humidity', 'valid'])
+DecodedPayloads.__doc__ = """Columns of decoded payloads, values that cannot be parsed are NaN."""
+
+
+def _split(payloads, record_size):
+    """Return the payloads as list, a buffer is split into records of "record_size" bytes."""
+    if record_size is None:
+        return list(payloads)
+    view = memoryview(payloads).cast('B')
+    if len(view) % record_size:
+        raise ValueError('buffer of {} bytes is no multiple of the record size {}'.format(len(view), record_size))
+    return [view[start:start + record_size] for start in range(0, len(view), record_size)]
+
+
+def decode_payloads(payloads, record_size=None, use_numpy=None):
+    """Decode raw sensor data payloads into columns.
+
+    "payloads" is a sequence of bytes-like payloads, None for a missing one,
+    or one buffer of payloads of "record_size" bytes each. Returns
+    DecodedPayloads with temperature, humidity and a validity mask, as
+    numpy arrays if numpy is installed and "use_numpy" is not False, as
+    array.array otherwise. The values are exactly those of
+    parse_sensor_data(), a payload is valid if MiTempBtPoller accepts it.
+
+    Each payload is searched with the regular expression of
+    parse_sensor_data() without creating a Reading for it.
+    """
+    payloads = _split(payloads, record_size)
+    count = len(payloads)
+    temperature = array('d', [float('nan')]) * count
+    humidity = array('d', [float('nan')]) * count
+    valid = array('b', bytes(count))
+    for index, payload in enumerate(payloads):
+        match = SENSOR_DATA_PATTERN.search(payload) if payload is not None else None
+        if match is None:
+            continue
+        temperature[index] = float(match.group(1))
+        humidity[index] = float(match.group(2))
+        # the poller rejects a humidity over 100%, see MiTempBtPoller._check_data()
+        valid[index] = not humidity[index] > 100
+    numpy = numpy_module() if use_numpy is not False else None
+    if numpy is not None:
+        return DecodedPayloads(numpy.frombuffer(temperature, dtype=numpy.float64),
+                               numpy.frombuffer(humidity, dtype=numpy.float64),
+                               numpy.frombuffer(valid, dtype=numpy.int8).astype(bool))
+    return DecodedPayloads(temperature, humidity, valid)
@@ -0,0 +1,255 @@
+""""
+Record the Bluetooth traffic of real sensors and replay it without hardware.
+
+RecordingBackend.wrap(backend, path) returns a backend that works like
+"backend" and appends every connect, handle read and notification to the
+capture file at "path", call close() on it when done recording.
+ReplayBackend.load(path, speed) returns a backend that plays a capture
+back to MiTempBtPoller, taking as long as the sensors did, divided by
+"speed". Paths ending in ".gz" are compressed.
+
+The capture file has one JSON object per line with these keys:
+    t    seconds since the epoch when the operation started
+    mac  MAC address of the sensor
+    op   "connect", "read" or "notify"
+    h    handle of "read" and "notify"
+    d    seconds the operation took
+    v    hex result of "read", null for None
+    n    [offset, hex payload] of every notification received during "notify"
+    e    message of the BluetoothBackendException raised, if any
+"""
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import gzip
+import json
+from threading import Lock
+import time
+from btlewrap.base import AbstractBackend, BluetoothBackendException
+
+
+def _open(path, mode):
+    """Open a capture file as text, compressed if the path ends in ".gz"."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')  # pylint: disable=consider-using-with
+
+
+def _to_hex(value):
+    """Convert a handle value into hex, backends return bytes, str or lists of ints."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.encode('latin-1')
+    return bytes(value).hex()
+
+
+def read_capture(path):
+    """Return the events of a capture file as list of dicts."""
+    with _open(path, 'r') as capture:
+        return [json.loads(line) for line in capture if line.strip()]
+
+
+class _CaptureFile:
+    """Capture file shared by all connections of a recording backend, opened on the first event."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = Lock()
+
+    def write(self, event):
+        """Append an event to the file."""
+        line = json.dumps(event, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                self._file = _open(self.path, 'a')
+            self._file.write(line + '\n')
+
+    def close(self):
+        """Close the file, a later event opens it again."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _RecordingDelegate:  # pylint: disable=too-few-public-methods
+    """Delegate recording the notifications before handing them on."""
+
+    def __init__(self, delegate, notifications):
+        self._delegate = delegate
+        self._start = time.monotonic()
+        self._notifications = notifications
+
+    def handleNotification(self, handle, raw_data):  # pylint: disable=invalid-name
+        """Record the notification and hand it on."""
+        self._notifications.append([round(time.monotonic() - self._start, 4), _to_hex(raw_data)])
+        self._delegate.handleNotification(handle, raw_data)
+
+
+class RecordingBackend(AbstractBackend):
+    """"
+    Backend wrapping another backend and recording its traffic.
+
+    Use wrap() to get a backend class for MiTempBtPoller. The capture file
+    is kept open while recording, call close() on the class or leave the
+    with block of a backend to finish it.
+    """
+
+    backend = None
+    path = None
+    capture = None
+
+    def __init__(self, adapter='hci0', address_type='public', **kwargs):
+        super().__init__(adapter, address_type, **kwargs)
+        self._backend = self.backend(  # pylint: disable=not-callable
+            adapter=adapter, address_type=address_type, **kwargs)
+        self._mac = None
+
+    @classmethod
+    def wrap(cls, backend, path):
+        """Return a backend class recording the traffic of "backend" into the file at "path"."""
+        return type('Recording' + backend.__name__, (cls,),
+                    {'backend': backend, 'path': path, 'capture': _CaptureFile(path)})
+
+    @classmethod
+    def close(cls):
+        """Close the capture file, so that it is complete."""
+        cls.capture.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def check_backend(self):  # pylint: disable=arguments-differ
+        """Check if the wrapped backend is available."""
+        return self._backend.check_backend()
+
+    @staticmethod
+    def supports_scanning():
+        """Scanning is not recorded."""
+        return False
+
+    @contextmanager
+    def _event(self, operation, **values):
+        """Time the with block and append it to the capture file as "operation"."""
+        event = {'t': round(time.time(), 4), 'mac': self._mac, 'op': operation}
+        event.update(values)
+        start = time.monotonic()
+        try:
+            yield event
+        except BluetoothBackendException as exception:
+            event['e'] = str(exception)
+            raise
+        finally:
+            event['d'] = round(time.monotonic() - start, 4)
+            self.capture.write(event)
+
+    def connect(self, mac):
+        self._mac = mac
+        with self._event('connect'):
+            self._backend.connect(mac)
+
+    def disconnect(self):
+        self._backend.disconnect()
+
+    def read_handle(self, handle):
+        with self._event('read', h=handle) as event:
+            value = self._backend.read_handle(handle)
+            event['v'] = _to_hex(value)
+            return value
+
+    def write_handle(self, handle, value):
+        return self._backend.write_handle(handle, value)
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        with self._event('notify', h=handle, n=[]) as event:
+            return self._backend.wait_for_notification(
+                handle, _RecordingDelegate(delegate, event['n']), notification_timeout)
+
+
+class ReplayBackend(AbstractBackend):
+    """"
+    Backend playing back a capture file instead of talking to sensors.
+
+    Use load() to get a backend class for MiTempBtPoller. Every sensor gets
+    the recorded results of its connects, reads per handle and
+    notifications in the recorded order, after the recorded time divided by
+    "speed", so a changed order of operations still replays. A speed of 0
+    replays without waiting. When the capture of a sensor is used up it
+    starts over if "loop" is set and fails otherwise.
+    """
+
+    events = None
+    speed = 1.0
+    loop = False
+    _lock = Lock()
+
+    def __init__(self, adapter='hci0', address_type='public', **kwargs):
+        super().__init__(adapter, address_type, **kwargs)
+        self._mac = None
+
+    @classmethod
+    def load(cls, path, speed=1.0, loop=False):
+        """Return a backend class replaying the capture file at "path"."""
+        queues = defaultdict(deque)
+        for event in read_capture(path):
+            queues[(event['mac'].upper(), event['op'], event.get('h'))].append(event)
+        return type('ReplayBackend', (cls,), {'events': queues, 'speed': speed, 'loop': loop})
+
+    @staticmethod
+    def check_backend():
+        """A capture is always available."""
+        return True
+
+    @staticmethod
+    def supports_scanning():
+        """A capture contains no scans."""
+        return False
+
+    def _sleep(self, seconds):
+        """Wait as long as the sensor did, divided by the speed."""
+        if self.speed and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def _replay(self, operation, handle=None):
+        """Return the next recorded event, after waiting as long as it took."""
+        with self._lock:
+            queue = self.events.get((self._mac, operation, handle))
+            if not queue:
+                raise BluetoothBackendException('Capture has no more {} of handle {} for sensor {}'.format(
+                    operation, handle, self._mac))
+            event = queue.popleft()
+            if self.loop:
+                queue.append(event)
+        if operation != 'notify':
+            self._sleep(event['d'])
+        return event
+
+    @staticmethod
+    def _raise_recorded(event):
+        """Raise the recorded exception of the event, if any."""
+        if 'e' in event:
+            raise BluetoothBackendException(event['e'])
+
+    def connect(self, mac):
+        self._mac = mac.upper()
+        self._raise_recorded(self._replay('connect'))
+
+    def read_handle(self, handle):
+        event = self._replay('read', handle)
+        self._raise_recorded(event)
+        return None if event.get('v') is None else bytes.fromhex(event['v'])
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        event = self._replay('notify', handle)
+        waited = 0
+        for offset, payload in event['n']:
+            self._sleep(offset - waited)
+            waited = offset
+            delegate.handleNotification(handle, None if payload is None else bytes.fromhex(payload))
+        self._sleep(event['d'] - waited)
+        self._raise_recorded(event)
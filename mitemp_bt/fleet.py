@@ -0,0 +1,119 @@
+""""
+Read many Mi Temp sensors at once, spread over several Bluetooth adapters.
+"""
+
+from collections import OrderedDict, namedtuple
+import logging
+from threading import Thread
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import PRIORITY_BACKGROUND, read_priority
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller
+
+_LOGGER = logging.getLogger(__name__)
+
+Sweep = namedtuple('Sweep', ['readings', 'errors'])
+Sweep.__doc__ = """Result of a sweep: values of read_all() and exceptions, both keyed by MAC."""
+
+
+class MiTempBtFleet:
+    """"
+    A class to read data from a fleet of Mi Temp sensors.
+
+    Sensors are assigned round-robin to the given adapters. During a sweep
+    every adapter gets one worker thread, which reads its sensors one after
+    another, so there is never more than one connection per adapter.
+    """
+
+    def __init__(self, macs, backend, adapters=('hci0',), cache_timeout=600, retries=3, history=None):
+        """
+        Initialize a fleet for the given MAC addresses and adapters.
+
+        Pass a mitemp_bt.history.HistoryStore as "history" to keep the
+        readings of every sensor.
+        """
+        if not adapters:
+            raise ValueError('at least one adapter is required')
+        self._backend = backend
+        self._adapters = list(adapters)
+        self._cache_timeout = cache_timeout
+        self._retries = retries
+        self._history = history
+        self._pollers = OrderedDict()
+        for mac in macs:
+            self.add(mac)
+
+    def add(self, mac):
+        """Add a sensor to the fleet and return its poller.
+
+        The sensor is assigned to the adapter with the fewest sensors.
+        """
+        if mac in self._pollers:
+            return self._pollers[mac]
+        load = {adapter: 0 for adapter in self._adapters}
+        for poller in self._pollers.values():
+            load[poller.adapter] += 1
+        adapter = min(self._adapters, key=lambda a: load[a])
+        poller = MiTempBtPoller(mac, self._backend, cache_timeout=self._cache_timeout,
+                                retries=self._retries, adapter=adapter,
+                                history=None if self._history is None else self._history.history(mac))
+        self._pollers[mac] = poller
+        return poller
+
+    def remove(self, mac):
+        """Remove a sensor from the fleet."""
+        self._pollers.pop(mac, None)
+
+    def poller(self, mac):
+        """Return the poller of a sensor."""
+        return self._pollers[mac]
+
+    @property
+    def macs(self):
+        """Return the MAC addresses of all sensors in the fleet."""
+        return list(self._pollers)
+
+    def sweep(self, read_cached=True, priority=PRIORITY_BACKGROUND):
+        """Read all sensors of the fleet.
+
+        Sensors with valid cached data are not contacted, unless
+        "read_cached" is False. The sensors are read with background
+        priority on their adapters, so other reads go first, unless another
+        "priority" is given. Returns a Sweep with the values of all sensors
+        that could be read and the exceptions of those that failed.
+        """
+        readings = {}
+        errors = {}
+        threads = []
+        for adapter in self._adapters:
+            pollers = [p for p in self._pollers.values() if p.adapter == adapter]
+            if not pollers:
+                continue
+            thread = Thread(target=self._sweep_adapter, args=(pollers, read_cached, priority, readings, errors),
+                            name='mitemp-{}'.format(adapter), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        return Sweep(OrderedDict((mac, readings[mac]) for mac in self._pollers if mac in readings),
+                     OrderedDict((mac, errors[mac]) for mac in self._pollers if mac in errors))
+
+    @staticmethod
+    def _sweep_adapter(pollers, read_cached, priority, readings, errors):
+        """Read the given sensors one after another.
+
+        A sensor that fails is recorded in "errors", the other sensors are
+        still read.
+        """
+        for poller in pollers:
+            mac = poller.mac
+            try:
+                with read_priority(priority):
+                    readings[mac] = poller.read_all(read_cached=read_cached)
+            except BluetoothBackendException as exception:
+                _LOGGER.debug('Could not read sensor %s: %s', mac, exception)
+                errors[mac] = exception
+            # e.g. a broken backend, which must not end the sweep of the adapter
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Unexpected error reading sensor %s', mac)
+                errors[mac] = exception
@@ -0,0 +1,172 @@
+""""
+Bounded in-memory history of the readings of each sensor.
+"""
+
+from array import array
+from collections import namedtuple
+from datetime import datetime
+from threading import Lock
+from mitemp_bt.mitemp_bt_poller import Reading
+
+Aggregate = namedtuple('Aggregate', ['count', 'temperature_min', 'temperature_max', 'temperature_mean',
+                                     'humidity_min', 'humidity_max', 'humidity_mean'])
+Aggregate.__doc__ = """Statistics of the readings in a time window."""
+
+_NUMPY = []
+
+
+def numpy_module():
+    """Return the numpy module or None if it is not installed, imported on first use."""
+    if not _NUMPY:
+        try:
+            import numpy  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            numpy = None
+        _NUMPY.append(numpy)
+    return _NUMPY[0]
+
+
+def _timestamp(value):
+    """Convert a datetime into seconds since the epoch, None stays None."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+
+class ReadingHistory:
+    """"
+    The last "capacity" readings of a sensor in a ring buffer.
+
+    Timestamps, temperatures and humidities are kept in fixed-size arrays,
+    so memory stays bounded no matter how long the sensor is read, and
+    appending takes constant time. Only readings newer than the last one
+    are kept, so the same reading appended twice is stored once. Queries
+    find the start of a time window by binary search and use numpy for the
+    aggregates if it is installed.
+    """
+
+    def __init__(self, capacity=1440, use_numpy=None):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._temperatures = array('d', bytes(8 * capacity))
+        self._humidities = array('d', bytes(8 * capacity))
+        self._start = 0
+        self._count = 0
+        self._lock = Lock()
+        self._use_numpy = use_numpy
+
+    def __len__(self):
+        return self._count
+
+    def append(self, reading):
+        """Add a Reading, returns False if it is not newer than the last one."""
+        timestamp = reading.timestamp.timestamp()
+        with self._lock:
+            if self._count and timestamp <= self._timestamps[(self._start + self._count - 1) % self.capacity]:
+                return False
+            if self._count < self.capacity:
+                index = (self._start + self._count) % self.capacity
+                self._count += 1
+            else:
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+            self._timestamps[index] = timestamp
+            self._temperatures[index] = reading.temperature
+            self._humidities[index] = reading.humidity
+        return True
+
+    def _find(self, timestamp):
+        """Return the position of the first reading at or after the timestamp, the lock must be held."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamps[(self._start + middle) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _slices(self, first, last):
+        """Return the physical index ranges of the positions first to last, the lock must be held."""
+        start = (self._start + first) % self.capacity
+        end = start + last - first
+        if end <= self.capacity:
+            return [(start, end)]
+        return [(start, self.capacity), (0, end - self.capacity)]
+
+    def _columns(self, first, last):
+        """Copy the columns of the positions first to last."""
+        slices = self._slices(first, last)
+        columns = (array('d'), array('d'), array('d'))
+        for column, values in zip(columns, (self._timestamps, self._temperatures, self._humidities)):
+            for start, end in slices:
+                column.extend(values[start:end])
+        return columns
+
+    def _window(self, since, until):
+        """Return timestamp, temperature and humidity columns of a time window."""
+        with self._lock:
+            first = 0 if since is None else self._find(_timestamp(since))
+            last = self._count
+            if until is not None:
+                last = self._find(_timestamp(until))
+            return self._columns(first, max(first, last))
+
+    def last(self, count=1):
+        """Return the last "count" readings, oldest first."""
+        with self._lock:
+            columns = self._columns(max(self._count - count, 0), self._count)
+        return self._readings(*columns)
+
+    def window(self, since=None, until=None):
+        """Return the readings from "since" until before "until" (datetimes), oldest first."""
+        return self._readings(*self._window(since, until))
+
+    @staticmethod
+    def _readings(timestamps, temperatures, humidities):
+        """Convert columns into a list of Readings."""
+        return [Reading(temperature, humidity, datetime.fromtimestamp(timestamp))
+                for timestamp, temperature, humidity in zip(timestamps, temperatures, humidities)]
+
+    def aggregate(self, since=None, until=None):
+        """Return the Aggregate of the readings from "since" until before "until", None if there are none."""
+        _, temperatures, humidities = self._window(since, until)
+        count = len(temperatures)
+        if not count:
+            return None
+        numpy = numpy_module() if self._use_numpy is not False else None
+        if numpy is not None:
+            temperatures = numpy.frombuffer(temperatures, dtype=numpy.float64)
+            humidities = numpy.frombuffer(humidities, dtype=numpy.float64)
+            return Aggregate(count, float(temperatures.min()), float(temperatures.max()), float(temperatures.mean()),
+                             float(humidities.min()), float(humidities.max()), float(humidities.mean()))
+        return Aggregate(count, min(temperatures), max(temperatures), sum(temperatures) / count,
+                         min(humidities), max(humidities), sum(humidities) / count)
+
+
+class HistoryStore:
+    """"
+    The ReadingHistory of every sensor, e.g. of a fleet.
+
+    Every sensor gets its own history of "capacity" readings.
+    """
+
+    def __init__(self, capacity=1440, use_numpy=None):
+        self.capacity = capacity
+        self._use_numpy = use_numpy
+        self._histories = {}
+        self._lock = Lock()
+
+    def history(self, mac):
+        """Return the ReadingHistory of a sensor."""
+        with self._lock:
+            if mac not in self._histories:
+                self._histories[mac] = ReadingHistory(self.capacity, self._use_numpy)
+            return self._histories[mac]
+
+    def macs(self):
+        """Return the MAC addresses of all sensors with a history."""
+        with self._lock:
+            return list(self._histories)
@@ -0,0 +1,82 @@
+""""
+Persist firmware version, battery level and name of sensors across restarts.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import os
+import stat
+import tempfile
+from threading import Lock
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MetadataStore:
+    """"
+    Store sensor metadata in a JSON file, keyed by MAC address.
+
+    The file is only read when the first sensor asks for its metadata.
+    Every update locks the file "path" + ".lock", re-reads the file and
+    replaces it atomically, keeping its permissions, so several processes,
+    also of different users, can share one file. Pass an instance to
+    MiTempBtPoller as "metadata_store".
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._data = None
+        self._lock = Lock()
+
+    def _read(self):
+        """Read the file, a missing or broken file is an empty store."""
+        try:
+            with open(self._path, 'r', encoding='utf-8') as store_file:
+                data = json.load(store_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as exception:
+            _LOGGER.warning('Ignoring broken metadata store %s: %s', self._path, exception)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, mac):
+        """Return the stored metadata of a sensor as dict, empty if there is none."""
+        with self._lock:
+            if self._data is None:
+                self._data = self._read()
+            return dict(self._data.get(mac.upper(), {}))
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the lock file of the store, shared with other processes."""
+        # read-only, so users without write access to the lock file can lock it as well
+        handle = os.open(self._path + '.lock', os.O_RDONLY | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield os.fstat(handle)
+        finally:
+            os.close(handle)
+
+    def update(self, mac, **values):
+        """Update some of the metadata of a sensor and write the file."""
+        with self._lock, self._file_lock() as lock_stat:
+            self._data = self._read()
+            self._data.setdefault(mac.upper(), {}).update(values)
+            try:
+                mode = stat.S_IMODE(os.stat(self._path).st_mode)
+            except FileNotFoundError:
+                # a new file gets the permissions of the lock file, created according to the umask
+                mode = stat.S_IMODE(lock_stat.st_mode)
+            directory = os.path.dirname(os.path.abspath(self._path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.mitemp-metadata-')
+            try:
+                with os.fdopen(handle, 'w', encoding='utf-8') as store_file:
+                    json.dump(self._data, store_file, indent=2, sort_keys=True)
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, self._path)
+            except OSError:
+                os.unlink(temp_path)
+                raise
@@ -0,0 +1,199 @@
+""""
+Counters and histograms of the Bluetooth communication, in Prometheus text format.
+
+All pollers record into POLLER_METRICS, which is registered with REGISTRY,
+unless they get their own PollerMetrics. REGISTRY.render() returns the
+Prometheus text exposition format, start_http_server() serves it.
+"""
+
+from contextlib import contextmanager
+from threading import Lock, Thread
+import time
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+def _format_labels(labels, extra=()):
+    """Format label pairs as {name="value",...}."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                           .replace('\n', '\\n'))
+                          for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    """Format a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """A value that only goes up, one per set of labels."""
+
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter for the given labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for the given labels."""
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        """Return the lines of this metric."""
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(key), _format_value(value)) for key, value in values]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, one per set of labels."""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self._buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        """Record a value for the given labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self._buckets), 0.0))
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Record the duration of the with block in seconds."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels):
+        """Return the number of observations for the given labels."""
+        counts, _ = self._values.get(tuple(sorted(labels.items())), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self):
+        """Return the lines of this metric."""
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            for bound, count in zip(self._buckets, counts):
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(key, [('le', _format_value(bound))]),
+                                                     count))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(key), _format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(key), counts[-1]))
+        return lines
+
+
+class MetricsRegistry:
+    """A collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """Add a metric and return it."""
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        """Create and register a Counter."""
+        return self.register(Counter(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram."""
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.metric_type))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class PollerMetrics:  # pylint: disable=too-few-public-methods
+    """The metrics recorded by MiTempBtPoller."""
+
+    def __init__(self, registry):
+        self.adapter_wait = registry.histogram(
+            'mitemp_adapter_wait_seconds', 'Time spent waiting for the adapter to be free for a connection.')
+        self.connect_duration = registry.histogram(
+            'mitemp_connect_duration_seconds', 'Time to connect to a sensor.')
+        self.read_handle_duration = registry.histogram(
+            'mitemp_read_handle_duration_seconds', 'Time to read a handle of a sensor.')
+        self.notification_wait = registry.histogram(
+            'mitemp_notification_wait_seconds', 'Time spent waiting for the sensor data notification.')
+        self.cache_requests = registry.counter(
+            'mitemp_cache_requests_total', 'Reads of sensor data by result: hit, stale or miss.')
+        self.failures = registry.counter(
+            'mitemp_failures_total', 'Failed Bluetooth operations by exception type.')
+        self.failure_blackouts = registry.counter(
+            'mitemp_failure_blackouts_total', 'Times a sensor was not contacted after all retries failed.')
+        self.coalesced_reads = registry.counter(
+            'mitemp_coalesced_reads_total', 'Reads of firmware, battery or name answered by a read already running.')
+        self.rejected_readings = registry.counter(
+            'mitemp_rejected_readings_total', 'Sensor data rejected as invalid.')
+
+
+REGISTRY = MetricsRegistry()
+POLLER_METRICS = PollerMetrics(REGISTRY)
+
+
+def start_http_server(port, addr='', registry=REGISTRY):
+    """Serve the metrics of the registry over HTTP from a background thread.
+
+    Returns the server, call shutdown() on it to stop serving.
+    """
+    # http.server takes longer to import than the rest of the library, only load it when needed
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # pylint: disable=import-outside-toplevel
+    from socketserver import ThreadingMixIn  # pylint: disable=import-outside-toplevel
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        """HTTP server handling each request in a thread."""
+
+        daemon_threads = True
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Answer every GET request with the rendered metrics."""
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Send the metrics."""
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """Do not log every scrape."""
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    Thread(target=server.serve_forever, name='mitemp-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,175 @@
+""""
+Passive reading of Mi Temp sensors from their MiBeacon advertisements.
+
+The sensors broadcast temperature, humidity and battery level as service
+data of the Xiaomi service UUID 0xFE95. Listening to these advertisements
+does not need a connection to the sensor at all.
+"""
+
+from collections import namedtuple
+import logging
+import re
+import struct
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import ADAPTER_MANAGER, PRIORITY_BACKGROUND
+from mitemp_bt.background import BackgroundThread
+from mitemp_bt.mitemp_bt_poller import MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY
+
+_SERVICE_UUID = 0xFE95
+_ADTYPE_SERVICE_DATA = 0x16
+
+_FRAME_CONTROL_ENCRYPTED = 0x08
+_FRAME_CONTROL_MAC = 0x10
+_FRAME_CONTROL_CAPABILITY = 0x20
+_FRAME_CONTROL_OBJECT = 0x40
+
+_OBJECT_TEMPERATURE = 0x1004
+_OBJECT_HUMIDITY = 0x1006
+_OBJECT_BATTERY = 0x100A
+_OBJECT_TEMPERATURE_HUMIDITY = 0x100D
+
+# object id: (struct format, values contained)
+_OBJECTS = {
+    _OBJECT_TEMPERATURE: ('<h', (MI_TEMPERATURE,)),
+    _OBJECT_HUMIDITY: ('<H', (MI_HUMIDITY,)),
+    _OBJECT_BATTERY: ('<B', (MI_BATTERY,)),
+    _OBJECT_TEMPERATURE_HUMIDITY: ('<hH', (MI_TEMPERATURE, MI_HUMIDITY)),
+}
+# values transmitted in units of 0.1
+_SCALED = (MI_TEMPERATURE, MI_HUMIDITY)
+
+_LOGGER = logging.getLogger(__name__)
+
+MiBeacon = namedtuple('MiBeacon', ['mac', 'product_id', 'frame_counter', 'values'])
+MiBeacon.__doc__ = """A decoded MiBeacon frame, values are keyed by MI_TEMPERATURE, MI_HUMIDITY and MI_BATTERY."""
+
+
+def parse_service_data(data):
+    """Parse the service data of a MiBeacon advertisement.
+
+    "data" is the payload of the service data without the leading service
+    UUID. Returns a MiBeacon or None if the frame does not contain any
+    sensor values or is encrypted.
+    """
+    if len(data) < 5:
+        return None
+    frame_control, product_id, frame_counter = struct.unpack_from('<HHB', data)
+    if frame_control & _FRAME_CONTROL_ENCRYPTED:
+        return None
+
+    mac = None
+    offset = 5
+    if frame_control & _FRAME_CONTROL_MAC:
+        mac = ':'.join(format(c, '02X') for c in reversed(data[offset:offset + 6]))
+        offset += 6
+    if frame_control & _FRAME_CONTROL_CAPABILITY:
+        offset += 1
+    if not frame_control & _FRAME_CONTROL_OBJECT or len(data) < offset + 3:
+        return None
+
+    object_id, length = struct.unpack_from('<HB', data, offset)
+    if object_id not in _OBJECTS:
+        return None
+    value_format, keys = _OBJECTS[object_id]
+    if length != struct.calcsize(value_format) or len(data) < offset + 3 + length:
+        return None
+    raw_values = struct.unpack_from(value_format, data, offset + 3)
+    values = {key: raw / 10.0 if key in _SCALED else raw for key, raw in zip(keys, raw_values)}
+    return MiBeacon(mac, product_id, frame_counter, values)
+
+
+class MiBeaconListener(BackgroundThread):
+    """"
+    Listen for MiBeacon advertisements and fill the cache of pollers.
+
+    Register the pollers of all sensors of interest, then either feed
+    advertisements with handle_service_data() or let the listener scan
+    with bluepy via listen() or, in a background thread, start().
+    """
+
+    def __init__(self, adapter='hci0', callback=None, interval=10, adapter_manager=None):
+        """
+        Initialize a listener on the given adapter.
+
+        "callback" is called with MAC, MiBeacon and RSSI for every decoded
+        advertisement of any sensor, registered or not. The background
+        thread restarts the scan every "interval" seconds. Scans wait in the
+        connection queue of the adapter in
+        mitemp_bt.adapter.ADAPTER_MANAGER with background priority, unless
+        another manager is given as "adapter_manager", so pollers get the
+        adapter between two scans.
+        """
+        super().__init__('mibeacon-' + adapter)
+        self._adapter = adapter
+        self._adapter_queue = (adapter_manager if adapter_manager is not None else ADAPTER_MANAGER).queue(adapter)
+        self._callback = callback
+        self._interval = interval
+        self._pollers = {}
+
+    def register(self, poller):
+        """Fill the cache of this poller from advertisements."""
+        self._pollers[poller.mac.upper()] = poller
+
+    def unregister(self, poller):
+        """Stop filling the cache of this poller."""
+        self._pollers.pop(poller.mac.upper(), None)
+
+    def handle_service_data(self, mac, data, rssi=None):
+        """Handle the 0xFE95 service data advertised by a device.
+
+        Returns the decoded MiBeacon or None.
+        """
+        beacon = parse_service_data(data)
+        if beacon is None:
+            return None
+        mac = (beacon.mac or mac).upper()
+        _LOGGER.debug('Received advertisement from %s: %s', mac, beacon.values)
+        poller = self._pollers.get(mac)
+        if poller is not None:
+            poller.handle_advertisement(beacon.values)
+        if self._callback is not None:
+            self._callback(mac, beacon, rssi)
+        return beacon
+
+    def handleDiscovery(self, device, is_new_device, is_new_data):  # pylint: disable=invalid-name,unused-argument
+        """ gets called by the bluepy scanner for every advertisement
+        """
+        value = device.getValueText(_ADTYPE_SERVICE_DATA)
+        if not value or len(value) < 4:
+            return
+        raw = bytes.fromhex(value)
+        if struct.unpack_from('<H', raw)[0] != _SERVICE_UUID:
+            return
+        self.handle_service_data(device.addr, raw[2:], device.rssi)
+
+    def listen(self, timeout):
+        """Listen for advertisements for "timeout" seconds using bluepy.
+
+        Waits up to "timeout" seconds for the adapter to become free first.
+        Note this must be run as root!
+        """
+        with self._adapter_queue.hold(timeout, PRIORITY_BACKGROUND):
+            self._scan(timeout)
+
+    def _scan(self, timeout):
+        """Scan with bluepy, while holding the adapter."""
+        # pylint: disable=import-outside-toplevel
+        from bluepy.btle import Scanner, BTLEException  # pylint: disable=import-error
+        match_result = re.search(r"hci([\d]+)", self._adapter)
+        if match_result is None:
+            raise BluetoothBackendException(
+                'Invalid pattern "{}" for Bluetooth adapter. '
+                'Expected something like "hci0".'.format(self._adapter))
+        try:
+            scanner = Scanner(iface=int(match_result.group(1))).withDelegate(self)
+            scanner.scan(timeout, passive=True)
+        except BTLEException as exception:
+            raise BluetoothBackendException() from exception
+
+    def _run_once(self):
+        """Listen for one interval."""
+        try:
+            self.listen(self._interval)
+        except BluetoothBackendException as exception:
+            _LOGGER.warning('Listening for advertisements failed: %s', exception)
+            self._stop.wait(self._interval)
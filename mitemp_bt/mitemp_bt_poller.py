@@ -2,10 +2,18 @@
 Read data from Mi Temp environmental (Temp and humidity) sensor.
 """
 
+from collections import namedtuple
 from datetime import datetime, timedelta
+import functools
 import logging
-from threading import Lock
+import re
+from threading import Event, Lock, Thread
+import time
 from btlewrap.base import BluetoothInterface, BluetoothBackendException
+from mitemp_bt.adapter import ADAPTER_MANAGER, PRIORITY_BACKGROUND, read_priority
+from mitemp_bt.metrics import POLLER_METRICS
+from mitemp_bt.retry import RetryPolicy, deadline_from_timeout, remaining
+from mitemp_bt.tracing import NOOP_TRACER
 
 _HANDLE_READ_BATTERY_LEVEL = 0x0018
 _HANDLE_READ_FIRMWARE_VERSION = 0x0024
@@ -16,122 +24,673 @@ _HANDLE_READ_WRITE_SENSOR_DATA = 0x0010
 MI_TEMPERATURE = "temperature"
 MI_HUMIDITY = "humidity"
 MI_BATTERY = "battery"
+MI_FIRMWARE = "firmware"
+MI_NAME = "name"
+
+# e.g. b'T=25.6 H=23.6\x00', spurious binary data around the values is ignored
+SENSOR_DATA_PATTERN = re.compile(rb'T=(-?[0-9]+(?:\.[0-9]*)?)\s*H=(-?[0-9]+(?:\.[0-9]*)?)')
 
 _LOGGER = logging.getLogger(__name__)
 
+Reading = namedtuple('Reading', [MI_TEMPERATURE, MI_HUMIDITY, 'timestamp'])
+Reading.__doc__ = """Temperature and humidity sent by the sensor and the time they were received."""
+
+
+def parse_sensor_data(raw_data, timestamp=None):
+    """Parses the byte array returned by the sensor.
+
+    The sensor returns 12 - 15 bytes in total, a readable text with the
+    temperature and humidity. e.g.:
+
+    54 3d 32 35 2e 36 20 48 3d 32 33 2e 36 00 -> T=25.6 H=23.6
+
+    Returns a Reading or None if the data does not contain both values.
+
+    Fix for single digit values thank to @rmiddlet:
+    https://github.com/ratcashdev/mitemp/issues/2#issuecomment-406263635
+    """
+    match = SENSOR_DATA_PATTERN.search(raw_data)
+    if match is None:
+        return None
+    return Reading(float(match.group(1)), float(match.group(2)), timestamp or datetime.now())
+
+
+class _NotificationError(BluetoothBackendException):
+    """Waiting for the sensor data failed after connecting to the sensor."""
+
+
+class _AdapterConnection:  # pylint: disable=too-few-public-methods
+    """Context Manager for a connection to a sensor.
+
+    btlewrap serializes all connections of a process behind one lock, no
+    matter which adapter they use. This waits in the queue of the adapter
+    instead, so that sensors on different adapters can be read at the same
+    time. Unless "hold" is set, the queue is released as soon as the
+    connection is established, for connections that stay open for long.
+    The lock of the connection is held until it is closed, so that one
+    poller never opens a second connection to the same backend.
+    """
+
+    def __init__(self, backend, mac, queue, deadline, metrics, tracer, hold=True, lock=None):
+        self._backend = backend
+        self._mac = mac
+        self._queue = queue
+        self._lock = lock if lock is not None else Lock()
+        self._hold = hold
+        self._deadline = deadline
+        self._metrics = metrics
+        self._tracer = tracer
+
+    def __enter__(self):
+        self._acquire_lock()
+        try:
+            with self._tracer.span('mitemp.lock_wait', {'mitemp.lock': 'adapter'}), \
+                    self._metrics.adapter_wait.time(adapter=self._queue.adapter):
+                acquired = self._queue.acquire(remaining(self._deadline))
+        except BaseException:
+            self._lock.release()
+            raise
+        if not acquired:
+            self._lock.release()
+            raise BluetoothBackendException("Deadline exceeded waiting for adapter %s to connect to Mi Temp sensor %s"
+                                            % (self._queue.adapter, self._mac))
+        try:
+            with self._tracer.span('mitemp.connect'), \
+                    self._metrics.connect_duration.time(mac=self._mac):
+                self._backend.connect(self._mac)
+        # release the adapter on any exceptions otherwise it will never be released
+        except BaseException as exception:
+            self._queue.release()
+            self._lock.release()
+            self._count_failure(exception)
+            raise
+        if not self._hold:
+            self._queue.release()
+        return _InstrumentedConnection(self._backend, self._mac, self._metrics, self._tracer)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_val is not None:
+            self._count_failure(exc_val)
+        try:
+            self._backend.disconnect()
+        finally:
+            if self._hold:
+                self._queue.release()
+            self._lock.release()
+
+    def _acquire_lock(self):
+        """Wait until no other connection of the poller is open, at most until the deadline."""
+        # only waiting for the lock is traced, e.g. for a running stream
+        if self._lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return
+        left = remaining(self._deadline)
+        with self._tracer.span('mitemp.lock_wait', {'mitemp.lock': 'connection'}):
+            acquired = self._lock.acquire(  # pylint: disable=consider-using-with
+                timeout=-1 if left is None else max(left, 0))
+        if not acquired:
+            raise BluetoothBackendException("Deadline exceeded waiting for open connection to Mi Temp sensor %s"
+                                            % self._mac)
+
+    def _count_failure(self, exception):
+        """Count a failed Bluetooth operation by the type of the original exception."""
+        if isinstance(exception, BluetoothBackendException):
+            self._metrics.failures.inc(mac=self._mac, exception=type(exception.__cause__ or exception).__name__)
+
+
+class _InstrumentedConnection:
+    """Backend of an open connection, recording metrics and spans of each operation."""
+
+    def __init__(self, backend, mac, metrics, tracer):
+        self._backend = backend
+        self._mac = mac
+        self._metrics = metrics
+        self._tracer = tracer
+
+    def read_handle(self, handle):
+        """Read a handle from the sensor."""
+        with self._tracer.span('mitemp.read_handle', {'mitemp.handle': hex(handle)}), \
+                self._metrics.read_handle_duration.time(mac=self._mac, handle=hex(handle)):
+            return self._backend.read_handle(handle)
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        """Wait for notifications of the sensor."""
+        with self._tracer.span('mitemp.notification_wait', {'mitemp.timeout': notification_timeout}), \
+                self._metrics.notification_wait.time(mac=self._mac):
+            return self._backend.wait_for_notification(handle, delegate, notification_timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """A call in progress, shared by all callers asking for the same result."""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.exception = None
+
+
+class _SingleFlight:  # pylint: disable=too-few-public-methods
+    """Run only one call per key at a time, concurrent callers wait for it and share its result."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+
+    def call(self, key, func, deadline=None):
+        """Call func, or wait for the running call with the same key until the deadline.
+
+        Returns the result and whether it came from another caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if leader:
+            try:
+                flight.result = func()
+            except BaseException as exception:
+                flight.exception = exception
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result, False
+
+        left = remaining(deadline)
+        if not flight.done.wait(None if left is None else max(left, 0)):
+            raise BluetoothBackendException("Deadline exceeded waiting for running read of %s" % key)
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.result, True
+
+
+class _NotificationCollector:  # pylint: disable=too-few-public-methods
+    """Delegate keeping the payloads of all notifications."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def handleNotification(self, handle, raw_data):  # pylint: disable=unused-argument,invalid-name
+        """Keep the payload."""
+        self.payloads.append(raw_data)
+
 
 class MiTempBtPoller:
     """"
     A class to read data from Mi Temp plant sensors.
     """
 
-    def __init__(self, mac, backend, cache_timeout=600, retries=3, adapter='hci0'):
+    def __init__(self, mac, backend, cache_timeout=600, retries=3, adapter='hci0', shared_cache=None,
+                 stale_while_revalidate=False, retry_policy=None, metadata_store=None, metrics=None,
+                 tracer=None, adapter_manager=None, history=None):
         """
         Initialize a Mi Temp Poller for the given MAC address.
+
+        Failed reads are retried "retries" times, pass a
+        mitemp_bt.retry.RetryPolicy as "retry_policy" for full control.
+        Pass a mitemp_bt.shared_cache.SharedReadingCache as "shared_cache" to
+        share readings with other processes. With "stale_while_revalidate"
+        an expired cache is returned right away while it is refreshed in a
+        background thread, use cache_age() to find out how old it is.
+        Pass a mitemp_bt.metadata.MetadataStore as "metadata_store" to keep
+        firmware version, battery level and name across restarts.
+        Metrics are recorded into mitemp_bt.metrics.POLLER_METRICS unless
+        other mitemp_bt.metrics.PollerMetrics are given as "metrics".
+        Pass a mitemp_bt.tracing.Tracer as "tracer" to trace every read.
+        Connections wait in the queue of their adapter in
+        mitemp_bt.adapter.ADAPTER_MANAGER, unless another
+        mitemp_bt.adapter.AdapterManager is given as "adapter_manager".
+        Pass a mitemp_bt.history.ReadingHistory as "history" to keep the
+        valid readings of the sensor.
         """
 
         self._mac = mac
         self._bt_interface = BluetoothInterface(backend, adapter=adapter)
+        self._adapter = adapter
         self._cache = None
         self._cache_timeout = timedelta(seconds=cache_timeout)
         self._last_read = None
         self._fw_last_read = None
+        self._battery_last_read = None
+        self._advertised = {}
+        self._shared_cache = shared_cache
+        self._stale_while_revalidate = stale_while_revalidate
+        self._metadata_store = metadata_store
+        self._metadata_restored = metadata_store is None
+        self._history = history
+        self._metrics = metrics if metrics is not None else POLLER_METRICS
+        self._tracer = tracer if tracer is not None else NOOP_TRACER
+        self._adapter_queue = (adapter_manager if adapter_manager is not None else ADAPTER_MANAGER).register(self)
         self.retries = retries
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(retries=retries)
         self.ble_timeout = 10
         self.lock = Lock()
+        # held while a connection to the sensor is open, see _AdapterConnection
+        self._connection_lock = Lock()
+        self._single_flight = _SingleFlight()
         self._firmware_version = None
+        self._name = None
         self.battery = None
 
-    def name(self):
-        """Return the name of the sensor."""
-        with self._bt_interface.connect(self._mac) as connection:
-            name = connection.read_handle(_HANDLE_READ_NAME)  # pylint: disable=no-member
+    @property
+    def mac(self):
+        """Return the MAC address of the sensor."""
+        return self._mac
+
+    @property
+    def adapter(self):
+        """Return the Bluetooth adapter used for this sensor."""
+        return self._adapter
+
+    def _span(self, name, attributes=None):
+        """Return a span of the tracer for a public read method."""
+        if self._tracer is NOOP_TRACER:
+            return NOOP_TRACER.span(name)
+        span_attributes = {'mitemp.mac': self._mac, 'mitemp.adapter': self._adapter}
+        span_attributes.update(attributes or {})
+        return self._tracer.span(name, span_attributes)
+
+    def _connect(self, deadline=None, hold=True):
+        """Return a context manager for a connection to the sensor.
+
+        Unless "hold" is set, the adapter is only occupied while connecting.
+        A second connection waits until the open one is closed.
+        """
+        left = remaining(deadline)
+        if left is not None and left <= 0:
+            raise BluetoothBackendException("Deadline exceeded before connecting to Mi Temp sensor %s" % self._mac)
+        return _AdapterConnection(self._bt_interface._backend,  # pylint: disable=protected-access
+                                  self._mac, self._adapter_queue, deadline, self._metrics, self._tracer, hold,
+                                  self._connection_lock)
+
+    def _notification_timeout(self, deadline):
+        """Return how long to wait for the sensor data, at most until the deadline."""
+        left = remaining(deadline)
+        if left is None:
+            return self.ble_timeout
+        return max(min(self.ble_timeout, left), 0)
+
+    def _set_failure_blackout(self, deadline=None):
+        """Don't contact a sensor that doesn't work again before the blackout of the retry policy is over.
+
+        If the caller ran out of time, the sensor is not to blame.
+        """
+        left = remaining(deadline)
+        if left is not None and left <= 0:
+            return
+        self._metrics.failure_blackouts.inc(mac=self._mac)
+        self._last_read = datetime.now() - self._cache_timeout + self.retry_policy.failure_blackout
+
+    def name(self, timeout=None):
+        """Return the name of the sensor.
+
+        The name is read once and then kept, it is also picked up by the
+        first call to fill_cache(). Concurrent callers share one read.
+        "timeout" limits the time in seconds spent including retries.
+        """
+        with self._span('mitemp.name'):
+            self._restore_metadata()
+            if self._name is None:
+                deadline = deadline_from_timeout(timeout)
+                self._coalesce(MI_NAME, functools.partial(self._read_name_retrying, deadline), deadline)
+            return self._name
+
+    def _read_name_retrying(self, deadline):
+        """Read the name, unless another caller read it meanwhile."""
+        if self._name is not None:
+            return
+        name = self.retry_policy.call(functools.partial(self._read_name, deadline), deadline)
 
         if not name:
             raise BluetoothBackendException("Could not read NAME using handle %s"
                                             " from Mi Temp sensor %s" % (hex(_HANDLE_READ_NAME), self._mac))
-        return ''.join(chr(n) for n in name)
+        self._name = ''.join(chr(n) for n in name)
+        self._save_metadata(name=self._name)
+
+    def _coalesce(self, kind, func, deadline):
+        """Call func, unless the same kind of read is running already, then wait for that one."""
+        _, shared = self._single_flight.call(kind, func, deadline)
+        if shared:
+            _LOGGER.debug('Shared running read of %s of sensor %s', kind, self._mac)
+            self._metrics.coalesced_reads.inc(mac=self._mac, kind=kind)
+
+    def _read_name(self, deadline):
+        """Connect to the sensor and read its name."""
+        with self._connect(deadline) as connection:
+            return connection.read_handle(_HANDLE_READ_NAME)
+
+    def fill_cache(self, timeout=None):
+        """Fill the cache with new data from the sensor.
+
+        Firmware version, battery level and name are read over the same
+        connection as the sensor data whenever they are due, so a cold poll
+        only connects to the sensor once. Failures are retried according to
+        the retry policy, within "timeout" seconds if given.
+        """
+        with self._span('mitemp.fill_cache'):
+            self._fill_cache(deadline_from_timeout(timeout))
 
-    def fill_cache(self):
-        """Fill the cache with new data from the sensor."""
+    def _fill_cache(self, deadline):
+        """Fill the cache with new data from the sensor before the deadline."""
         _LOGGER.debug('Filling cache with new sensor data.')
         try:
-            self.firmware_version()
+            self.retry_policy.call(functools.partial(self._fill_cache_once, deadline), deadline)
+        except _NotificationError:
+            self._set_failure_blackout(deadline)
+            return
         except BluetoothBackendException:
-            # If a sensor doesn't work, wait 5 minutes before retrying
-            self._last_read = datetime.now() - self._cache_timeout + \
-                timedelta(seconds=300)
+            self._set_failure_blackout(deadline)
             raise
 
-        with self._bt_interface.connect(self._mac) as connection:
+    def _fill_cache_once(self, deadline):
+        """Connect to the sensor once and read everything that is due."""
+        with self._connect(deadline) as connection:
+            if self._firmware_expired():
+                self._read_firmware(connection)
+            if self._name is None:
+                name = connection.read_handle(_HANDLE_READ_NAME)
+                if name:
+                    self._name = ''.join(chr(n) for n in name)
+                    self._save_metadata(name=self._name)
             try:
                 connection.wait_for_notification(_HANDLE_READ_WRITE_SENSOR_DATA, self,
-                                                 self.ble_timeout)  # pylint: disable=no-member
-                # If a sensor doesn't work, wait 5 minutes before retrying
-            except BluetoothBackendException:
-                self._last_read = datetime.now() - self._cache_timeout + \
-                    timedelta(seconds=300)
-                return
-
-    def battery_level(self):
+                                                 self._notification_timeout(deadline))
+            except BluetoothBackendException as exception:
+                raise _NotificationError(str(exception)) from exception
+
+    def battery_level(self, timeout=None):
         """Return the battery level.
 
         The battery level is updated when reading the firmware version. This
-        is done only once every 24h
-        """
-        self.firmware_version()
-        return self.battery
-
-    def firmware_version(self):
-        """Return the firmware version."""
-        if (self._firmware_version is None) or \
-                (datetime.now() - timedelta(hours=24) > self._fw_last_read):
-            self._fw_last_read = datetime.now()
-            with self._bt_interface.connect(self._mac) as connection:
-                res_firmware = connection.read_handle(_HANDLE_READ_FIRMWARE_VERSION)  # pylint: disable=no-member
-                _LOGGER.debug('Received result for handle %s: %s',
-                              _HANDLE_READ_FIRMWARE_VERSION, res_firmware)
-                res_battery = connection.read_handle(_HANDLE_READ_BATTERY_LEVEL)  # pylint: disable=no-member
-                _LOGGER.debug('Received result for handle %s: %s',
-                              _HANDLE_READ_BATTERY_LEVEL, res_battery)
-
-            if res_firmware is None:
-                self._firmware_version = None
-            else:
-                self._firmware_version = res_firmware.decode("utf-8")
+        is done only once every 24h, unless the battery level was received in
+        an advertisement during that time.
+        """
+        with self._span('mitemp.battery_level'):
+            self._restore_metadata()
+            if (self._battery_last_read is None) or \
+                    (datetime.now() - timedelta(hours=24) > self._battery_last_read):
+                self.firmware_version(timeout)
+            return self.battery
+
+    def firmware_version(self, timeout=None):
+        """Return the firmware version.
+
+        Concurrent callers share one read, which also reads the battery
+        level. "timeout" limits the time in seconds spent including retries.
+        """
+        with self._span('mitemp.firmware_version'):
+            if self._firmware_expired():
+                deadline = deadline_from_timeout(timeout)
+                self._coalesce(MI_FIRMWARE, functools.partial(self._read_firmware_retrying, deadline), deadline)
+            return self._firmware_version
+
+    def _read_firmware_retrying(self, deadline):
+        """Read firmware version and battery level, unless another caller read them meanwhile."""
+        if self._firmware_expired():
+            self.retry_policy.call(functools.partial(self._read_firmware_once, deadline), deadline)
+
+    def _read_firmware_once(self, deadline):
+        """Connect to the sensor and read firmware version and battery level."""
+        with self._connect(deadline) as connection:
+            self._read_firmware(connection)
+
+    def _firmware_expired(self):
+        """Check if firmware version and battery level have to be read again."""
+        self._restore_metadata()
+        return (self._firmware_version is None) or \
+            (datetime.now() - timedelta(hours=24) > self._fw_last_read)
+
+    def _read_firmware(self, connection):
+        """Read firmware version and battery level over an open connection."""
+        with self._tracer.span('mitemp.read_firmware'):
+            self._read_firmware_values(connection)
+
+    def _read_firmware_values(self, connection):
+        """Read and store firmware version and battery level."""
+        self._fw_last_read = datetime.now()
+        res_firmware = connection.read_handle(_HANDLE_READ_FIRMWARE_VERSION)
+        _LOGGER.debug('Received result for handle %s: %s',
+                      _HANDLE_READ_FIRMWARE_VERSION, res_firmware)
+        res_battery = connection.read_handle(_HANDLE_READ_BATTERY_LEVEL)
+        _LOGGER.debug('Received result for handle %s: %s',
+                      _HANDLE_READ_BATTERY_LEVEL, res_battery)
+
+        if res_firmware is None:
+            self._firmware_version = None
+        else:
+            self._firmware_version = res_firmware.decode("utf-8")
 
-            if res_battery is None:
-                self.battery = 0
-            else:
-                self.battery = int(ord(res_battery))
-        return self._firmware_version
+        if res_battery is None:
+            self.battery = 0
+        else:
+            self.battery = int(ord(res_battery))
+        self._battery_last_read = self._fw_last_read
+        self._save_metadata(firmware=self._firmware_version, firmware_read=self._fw_last_read.timestamp(),
+                            battery=self.battery, battery_read=self._fw_last_read.timestamp())
+
+    def _restore_metadata(self):
+        """Load firmware version, battery level and name from the metadata store, once."""
+        if self._metadata_restored:
+            return
+        self._metadata_restored = True
+        stored = self._metadata_store.get(self._mac)
+        _LOGGER.debug('Restoring metadata of sensor %s: %s', self._mac, stored)
+        if self._firmware_version is None and stored.get('firmware') is not None:
+            self._firmware_version = stored['firmware']
+            self._fw_last_read = datetime.fromtimestamp(stored.get('firmware_read', 0))
+        if self.battery is None and stored.get('battery') is not None:
+            self.battery = stored['battery']
+            self._battery_last_read = datetime.fromtimestamp(stored.get('battery_read', 0))
+        if self._name is None:
+            self._name = stored.get('name')
+
+    def _save_metadata(self, **values):
+        """Write metadata to the metadata store, if there is one."""
+        if self._metadata_store is None:
+            return
+        try:
+            self._metadata_store.update(self._mac, **values)
+        except OSError as exception:
+            _LOGGER.warning('Could not store metadata of sensor %s: %s', self._mac, exception)
 
-    def parameter_value(self, parameter, read_cached=True):
+    def parameter_value(self, parameter, read_cached=True, timeout=None):
         """Return a value of one of the monitored paramaters.
 
         This method will try to retrieve the data from cache and only
         request it by bluetooth if no cached value is stored or the cache is
         expired.
         This behaviour can be overwritten by the "read_cached" parameter.
+        "timeout" limits the time in seconds spent including retries.
         """
-        # Special handling for battery attribute
-        if parameter == MI_BATTERY:
-            return self.battery_level()
+        with self._span('mitemp.parameter_value', {'mitemp.parameter': parameter}):
+            # Special handling for battery attribute
+            if parameter == MI_BATTERY:
+                return self.battery_level(timeout)
+
+            return getattr(self.reading(read_cached, timeout), parameter)
+
+    def reading(self, read_cached=True, timeout=None):
+        """Return temperature and humidity together as Reading.
 
-        # Use the lock to make sure the cache isn't updated multiple times
-        with self.lock:
-            if (read_cached is False) or \
-                    (self._last_read is None) or \
-                    (datetime.now() - self._cache_timeout > self._last_read):
-                self.fill_cache()
+        The cache is used the same way as by parameter_value().
+        """
+        with self._span('mitemp.reading'):
+            self._update_cache(read_cached, deadline_from_timeout(timeout))
+            reading = self._cache
+            if reading is None:
+                raise BluetoothBackendException("Could not read data from Mi Temp sensor %s" % self._mac)
+            return reading
+
+    def read_all(self, read_cached=True, timeout=None):
+        """Return all values of the sensor at once.
+
+        On a cold poller temperature, humidity, battery level, firmware
+        version and name are all read over a single connection. The result
+        is a dict keyed by MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY,
+        MI_FIRMWARE and MI_NAME.
+        """
+        with self._span('mitemp.read_all'):
+            deadline = deadline_from_timeout(timeout)
+            self._update_cache(read_cached, deadline)
+            reading = self._cache
+            if reading is None:
+                raise BluetoothBackendException("Could not read data from Mi Temp sensor %s" % self._mac)
+            result = {MI_TEMPERATURE: reading.temperature, MI_HUMIDITY: reading.humidity}
+            result[MI_BATTERY] = self.battery_level(remaining(deadline))
+            result[MI_FIRMWARE] = self._firmware_version
+            result[MI_NAME] = self._name
+            return result
+
+    def stream(self, stop=None):
+        """Yield a Reading for every sensor data notification, over one long-lived connection.
+
+        The sensor sends new data every few seconds while connected. If the
+        connection fails or no data arrives within "ble_timeout" seconds, it
+        is reconnected after the backoff of the retry policy. After
+        "retries" reconnects in a row without data the last exception is
+        raised. The stream ends when the threading.Event "stop" is set or
+        the generator is closed. The adapter of the sensor is only occupied
+        while connecting, so other sensors on it can still be read while the
+        stream is running. The cache is updated as well.
+        """
+        failures = 0
+        while stop is None or not stop.is_set():
+            try:
+                with self._connect(hold=False) as connection:
+                    while stop is None or not stop.is_set():
+                        collector = _NotificationCollector()
+                        connection.wait_for_notification(_HANDLE_READ_WRITE_SENSOR_DATA, collector,
+                                                         self.ble_timeout)
+                        if not collector.payloads:
+                            raise BluetoothBackendException("No data from Mi Temp sensor %s within %s seconds"
+                                                            % (self._mac, self.ble_timeout))
+                        failures = 0
+                        for raw_data in collector.payloads:
+                            self.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, raw_data)
+                            reading = self._cache
+                            if reading is not None:
+                                yield reading
+            except self.retry_policy.retry_on as exception:
+                if failures >= self.retry_policy.retries:
+                    raise
+                delay = self.retry_policy.delay(failures)
+                failures += 1
+                _LOGGER.debug('Stream of sensor %s interrupted by %s, reconnecting in %.2f seconds',
+                              self._mac, exception, delay)
+                if stop is None:
+                    time.sleep(delay)
+                else:
+                    stop.wait(delay)
+
+    def cache_age(self):
+        """Return the age of the cached data as timedelta or None if there is none."""
+        reading = self._cache
+        if reading is None:
+            return None
+        return datetime.now() - reading.timestamp
+
+    def cache_expiry(self):
+        """Return when the cache expires or None if it is empty."""
+        last_read = self._last_read
+        if last_read is None:
+            return None
+        return last_read + self._cache_timeout
+
+    def _cache_expired(self):
+        """Check if the cache has to be filled."""
+        return (self._last_read is None) or \
+            (datetime.now() - self._cache_timeout > self._last_read)
+
+    def _update_cache(self, read_cached, deadline=None):
+        """Fill the cache if it is expired or if "read_cached" is False."""
+        if self._stale_while_revalidate and read_cached and self.cache_available():
+            # never wait for a running read while there is a reading to return
+            if self._cache_expired():
+                self._metrics.cache_requests.inc(mac=self._mac, result='stale')
+                self._revalidate()
+            else:
+                self._metrics.cache_requests.inc(mac=self._mac, result='hit')
+            return
+
+        # Use the lock to make sure the cache isn't updated multiple times,
+        # only waiting for it is traced. Released at the end of this method.
+        acquired = self.lock.acquire(blocking=False)  # pylint: disable=consider-using-with
+        if not acquired:
+            left = remaining(deadline)
+            with self._tracer.span('mitemp.lock_wait', {'mitemp.lock': 'poller'}):
+                acquired = self.lock.acquire(  # pylint: disable=consider-using-with
+                    timeout=-1 if left is None else max(left, 0))
+        if not acquired:
+            raise BluetoothBackendException("Deadline exceeded waiting for running read of Mi Temp sensor %s"
+                                            % self._mac)
+        try:
+            if (read_cached is False) or self._cache_expired():
+                self._metrics.cache_requests.inc(mac=self._mac, result='miss')
+                with self._tracer.span('mitemp.refresh'):
+                    self._refresh(read_cached, deadline)
             else:
+                self._metrics.cache_requests.inc(mac=self._mac, result='hit')
                 _LOGGER.debug("Using cache (%s < %s)",
                               datetime.now() - self._last_read,
                               self._cache_timeout)
+        finally:
+            self.lock.release()
 
-        if self.cache_available():
-            return self._parse_data()[parameter]
-        raise BluetoothBackendException("Could not read data from Mi Temp sensor %s" % self._mac)
+    def _refresh(self, read_cached, deadline=None):
+        """Fill the cache, while holding the lock."""
+        if self._shared_cache is None:
+            self._fill_cache(deadline)
+        else:
+            self._fill_cache_shared(read_cached, deadline)
+
+    def _revalidate(self):
+        """Refresh the cache in a background thread, unless a refresh is running already."""
+        if not self.lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            _LOGGER.debug('Refresh of sensor %s is running, using stale cache', self._mac)
+            return
+        _LOGGER.debug('Using stale cache of sensor %s while refreshing it', self._mac)
+        Thread(target=self._revalidate_locked, name='mitemp-revalidate-' + str(self._mac), daemon=True).start()
+
+    def _revalidate_locked(self):
+        """Refresh the cache and release the lock acquired by _revalidate()."""
+        try:
+            if self._cache_expired():
+                with read_priority(PRIORITY_BACKGROUND):
+                    self._refresh(read_cached=True)
+        except BluetoothBackendException as exception:
+            _LOGGER.debug('Background refresh of sensor %s failed: %s', self._mac, exception)
+        finally:
+            self.lock.release()
+
+    def _fill_cache_shared(self, read_cached, deadline):
+        """Fill the cache from the shared cache or, if no other process is doing it, from the sensor."""
+        shared = self._shared_cache
+        while True:
+            if read_cached:
+                reading = shared.get(self._mac)
+                if reading is not None and datetime.now() - self._cache_timeout <= reading.timestamp:
+                    _LOGGER.debug('Using reading of sensor %s from shared cache', self._mac)
+                    self._set_reading(reading)
+                    return
+            if shared.acquire_refresh(self._mac):
+                break
+            left = remaining(deadline)
+            if left is not None and left <= shared.poll_interval:
+                raise BluetoothBackendException("Deadline exceeded waiting for another process reading "
+                                                "Mi Temp sensor %s" % self._mac)
+            time.sleep(shared.poll_interval)
+
+        try:
+            previous = self._cache
+            self._fill_cache(deadline)
+            if self._cache is not None and self._cache is not previous:
+                shared.put(self._mac, self._cache)
+        finally:
+            shared.release_refresh(self._mac)
 
     def _check_data(self):
         """Ensure that the data in the cache is valid.
@@ -141,11 +700,11 @@ class MiTempBtPoller:
         if not self.cache_available():
             return
 
-        parsed = self._parse_data()
+        reading = self._cache
         _LOGGER.debug('Received new data from sensor: Temp=%.1f, Humidity=%.1f',
-                      parsed[MI_TEMPERATURE], parsed[MI_HUMIDITY])
+                      reading.temperature, reading.humidity)
 
-        if parsed[MI_HUMIDITY] > 100:  # humidity over 100 procent
+        if reading.humidity > 100:  # humidity over 100 procent
             self.clear_cache()
             return
 
@@ -159,29 +718,12 @@ class MiTempBtPoller:
         return self._cache is not None
 
     def _parse_data(self):
-        """Parses the byte array returned by the sensor.
+        """Return the cached values as dict keyed by MI_TEMPERATURE and MI_HUMIDITY.
 
-        The sensor returns 12 - 15 bytes in total, a readable text with the
-        temperature and humidity. e.g.:
-
-        54 3d 32 35 2e 36 20 48 3d 32 33 2e 36 00 -> T=25.6 H=23.6
-
-        Fix for single digit values thank to @rmiddlet:
-        https://github.com/ratcashdev/mitemp/issues/2#issuecomment-406263635
+        The data is parsed once when it is received, see parse_sensor_data().
         """
-        data = self._cache
-        # Sanitizing the input sometimes has spurious binary data
-        data = data.strip('\0')
-        data = ''.join(filter(lambda i: i.isprintable(), data))
-
-        res = {}
-        for dataitem in data.split(' '):
-            dataparts = dataitem.split('=')
-            if dataparts[0] == 'T':
-                res[MI_TEMPERATURE] = float(dataparts[1])
-            elif dataparts[0] == 'H':
-                res[MI_HUMIDITY] = float(dataparts[1])
-        return res
+        reading = self._cache
+        return {MI_TEMPERATURE: reading.temperature, MI_HUMIDITY: reading.humidity}
 
     @staticmethod
     def _format_bytes(raw_data):
@@ -190,17 +732,42 @@ class MiTempBtPoller:
             return 'None'
         return ' '.join([format(c, "02x") for c in raw_data]).upper()
 
+    def handle_advertisement(self, values):
+        """Update the cache with values received in an advertisement.
+
+        "values" is a dict keyed by MI_TEMPERATURE, MI_HUMIDITY and
+        MI_BATTERY and may contain only some of them, the missing ones are
+        taken from earlier advertisements or the cache. See mitemp_bt.mibeacon.
+        """
+        if MI_BATTERY in values:
+            self.battery = values[MI_BATTERY]
+            self._battery_last_read = datetime.now()
+            self._save_metadata(battery=self.battery, battery_read=self._battery_last_read.timestamp())
+
+        self._advertised.update(values)
+        merged = self._parse_data() if self.cache_available() else {}
+        merged.update(self._advertised)
+        if MI_TEMPERATURE not in merged or MI_HUMIDITY not in merged:
+            return
+        self._set_reading(Reading(merged[MI_TEMPERATURE], merged[MI_HUMIDITY], datetime.now()))
+
     def handleNotification(self, handle, raw_data):  # pylint: disable=unused-argument,invalid-name
         """ gets called by the bluepy backend when using wait_for_notification
         """
         if raw_data is None:
             return
-        data = raw_data.decode("utf-8").strip(' \n\t')
-        self._cache = data
+        with self._tracer.span('mitemp.parse') as span:
+            self._set_reading(parse_sensor_data(raw_data))
+            span.set_attribute('mitemp.valid', self.cache_available())
+
+    def _set_reading(self, reading):
+        """Validate a new reading and store it in the cache."""
+        self._cache = reading
         self._check_data()
         if self.cache_available():
-            self._last_read = datetime.now()
+            self._last_read = reading.timestamp
+            if self._history is not None:
+                self._history.append(reading)
         else:
-            # If a sensor doesn't work, wait 5 minutes before retrying
-            self._last_read = datetime.now() - self._cache_timeout + \
-                timedelta(seconds=300)
+            self._metrics.rejected_readings.inc(mac=self._mac)
+            self._set_failure_blackout()
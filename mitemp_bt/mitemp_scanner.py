@@ -0,0 +1,134 @@
+""""
+Scan for Mi Temp sensors and keep track of the sensors in range.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import logging
+from threading import Lock
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import ADAPTER_MANAGER, PRIORITY_BACKGROUND
+from mitemp_bt.background import BackgroundThread
+
+VALID_DEVICE_NAMES = ['mj_ht_v1']
+DEVICE_PREFIX = '4C:65:A8:'
+
+_LOGGER = logging.getLogger(__name__)
+
+Device = namedtuple('Device', ['mac', 'last_seen', 'rssi'])
+Device.__doc__ = """A sensor in the registry, "rssi" is None if the scan did not report it."""
+
+
+def scan(backend, timeout=10, adapter='hci0'):
+    """Scan for mitemp devices.
+
+    Note: this must be run as root!
+    """
+    result = []
+    for (mac, name) in backend.scan_for_devices(timeout, adapter=adapter):
+        if (name is not None and name.lower() in VALID_DEVICE_NAMES) or \
+                mac is not None and mac.upper().startswith(DEVICE_PREFIX):
+            result.append(mac.upper())
+    return result
+
+
+class DeviceRegistry:
+    """"
+    In-memory registry of the sensors in range.
+
+    Sensors that have not been seen for "expiry" seconds are dropped by
+    expire(). The optional callbacks are called with the MAC address when
+    a sensor shows up for the first time and when it vanishes, e.g. to add
+    it to or remove it from a MiTempBtFleet.
+    """
+
+    def __init__(self, expiry=600, on_new=None, on_vanished=None):
+        self._expiry = timedelta(seconds=expiry)
+        self._on_new = on_new
+        self._on_vanished = on_vanished
+        self._devices = {}
+        self._lock = Lock()
+
+    def seen(self, mac, rssi=None, when=None):
+        """Record that a sensor was seen, returns True if it is new."""
+        mac = mac.upper()
+        with self._lock:
+            is_new = mac not in self._devices
+            self._devices[mac] = Device(mac, when or datetime.now(), rssi)
+        if is_new:
+            _LOGGER.debug('Found new sensor %s', mac)
+            if self._on_new is not None:
+                self._on_new(mac)
+        return is_new
+
+    def handle_beacon(self, mac, beacon, rssi):  # pylint: disable=unused-argument
+        """Record an advertisement, can be used as callback of a MiBeaconListener."""
+        self.seen(mac, rssi)
+
+    def expire(self, now=None):
+        """Drop all sensors that have not been seen recently and return their MACs."""
+        deadline = (now or datetime.now()) - self._expiry
+        with self._lock:
+            vanished = [mac for mac, device in self._devices.items() if device.last_seen < deadline]
+            for mac in vanished:
+                del self._devices[mac]
+        for mac in vanished:
+            _LOGGER.debug('Sensor %s vanished', mac)
+            if self._on_vanished is not None:
+                self._on_vanished(mac)
+        return vanished
+
+    def devices(self):
+        """Return all sensors in range, sorted by MAC address."""
+        with self._lock:
+            return [self._devices[mac] for mac in sorted(self._devices)]
+
+    def __contains__(self, mac):
+        return mac.upper() in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+
+class ContinuousScanner(BackgroundThread):
+    """"
+    Scan for sensors in a background thread and keep a registry up to date.
+
+    A scan occupies the adapter, so it waits in the connection queue of the
+    adapter with background priority, like the reads of the pollers.
+    """
+
+    def __init__(self, backend, registry=None, timeout=10, interval=60, adapter='hci0', adapter_manager=None):
+        """
+        Scan for "timeout" seconds every "interval" seconds.
+
+        Scans queue up in mitemp_bt.adapter.ADAPTER_MANAGER, unless another
+        manager is given as "adapter_manager".
+        """
+        super().__init__('mitemp-scanner-' + adapter)
+        self.registry = registry if registry is not None else DeviceRegistry()
+        self._backend = backend
+        self._timeout = timeout
+        self._interval = interval
+        self._adapter = adapter
+        self._adapter_queue = (adapter_manager if adapter_manager is not None else ADAPTER_MANAGER).queue(adapter)
+
+    def scan_once(self):
+        """Run one scan, update the registry and return the MACs found.
+
+        Gives up if the adapter is busy for longer than the interval.
+        """
+        with self._adapter_queue.hold(self._interval, PRIORITY_BACKGROUND):
+            macs = scan(self._backend, self._timeout, adapter=self._adapter)
+        for mac in macs:
+            self.registry.seen(mac)
+        self.registry.expire()
+        return macs
+
+    def _run_once(self):
+        """Scan once and wait for the next interval."""
+        try:
+            self.scan_once()
+        except BluetoothBackendException as exception:
+            _LOGGER.warning('Scanning for sensors failed: %s', exception)
+        self._stop.wait(self._interval)
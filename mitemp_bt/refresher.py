@@ -0,0 +1,107 @@
+""""
+Keep the cache of pollers warm from a background thread.
+"""
+
+from datetime import datetime, timedelta
+import logging
+from threading import Lock
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import PRIORITY_BACKGROUND, read_priority
+from mitemp_bt.background import BackgroundThread
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class BackgroundRefresher(BackgroundThread):
+    """"
+    Refresh pollers shortly before their cache expires.
+
+    Readers of the pollers then always find valid data in the cache and
+    never wait for the sensor. Pollers are refreshed one after another,
+    with background priority on their adapters.
+    """
+
+    def __init__(self, pollers=(), margin=60, max_wait=60, max_backoff=3600):
+        """
+        Refresh pollers "margin" seconds before their cache expires.
+
+        The thread wakes up at least every "max_wait" seconds to pick up
+        pollers added in the meantime. A poller that could not be refreshed
+        is tried again after the failure blackout of its retry policy,
+        doubled for every further failure up to "max_backoff" seconds.
+        """
+        super().__init__('mitemp-refresher')
+        self._margin = timedelta(seconds=margin)
+        self._max_wait = max_wait
+        self._max_backoff = max_backoff
+        self._pollers = list(pollers)
+        self._failed = {}
+        self._failures = {}
+        self._lock = Lock()
+
+    def add(self, poller):
+        """Keep this poller warm as well."""
+        with self._lock:
+            self._pollers.append(poller)
+
+    def remove(self, poller):
+        """Stop refreshing this poller."""
+        with self._lock:
+            self._pollers.remove(poller)
+        self._failed.pop(poller, None)
+        self._failures.pop(poller, None)
+
+    def refresh_due(self):
+        """Refresh all pollers whose cache expires within the margin.
+
+        A poller that could not be refreshed is tried again when its backoff
+        is over. Returns the number of seconds until the next poller is
+        due.
+        """
+        with self._lock:
+            pollers = list(self._pollers)
+        wait = self._max_wait
+        for poller in pollers:
+            due = self._due(poller)
+            if due <= datetime.now():
+                self._refresh(poller)
+                due = self._due(poller)
+            wait = min(wait, (due - datetime.now()).total_seconds())
+        return max(wait, 0)
+
+    def _due(self, poller):
+        """Return when a poller has to be refreshed next."""
+        expiry = poller.cache_expiry()
+        if expiry is None:
+            return self._failed.get(poller, datetime.now())
+        return max(expiry - self._margin, self._failed.get(poller, expiry - self._margin))
+
+    def _backoff(self, poller, failures):
+        """Return the seconds until a poller is refreshed again after "failures" failures in a row."""
+        blackout = max(poller.retry_policy.failure_blackout.total_seconds(), self._max_wait)
+        return min(blackout * 2 ** (failures - 1), max(self._max_backoff, blackout))
+
+    def _refresh(self, poller):
+        """Refresh one poller."""
+        _LOGGER.debug('Refreshing sensor %s', poller.mac)
+        start = datetime.now()
+        try:
+            with read_priority(PRIORITY_BACKGROUND):
+                # invalid data clears the cache and raises, only a missing notification keeps the old reading
+                refreshed = poller.reading(read_cached=False).timestamp >= start
+        except BluetoothBackendException as exception:
+            _LOGGER.debug('Refreshing sensor %s failed: %s', poller.mac, exception)
+            refreshed = False
+
+        if refreshed:
+            self._failed.pop(poller, None)
+            self._failures.pop(poller, None)
+        else:
+            failures = self._failures[poller] = self._failures.get(poller, 0) + 1
+            backoff = self._backoff(poller, failures)
+            _LOGGER.debug('Refreshing sensor %s again in %d seconds', poller.mac, backoff)
+            self._failed[poller] = datetime.now() + timedelta(seconds=backoff)
+
+    def _run_once(self):
+        """Refresh what is due and wait for the next one."""
+        self._stop.wait(self.refresh_due())
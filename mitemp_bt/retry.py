@@ -0,0 +1,75 @@
+""""
+Retry policy for the Bluetooth communication with the sensors.
+"""
+
+from datetime import timedelta
+import logging
+import random
+import time
+from btlewrap.base import BluetoothBackendException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def deadline_from_timeout(timeout):
+    """Convert a timeout in seconds into a deadline on the time.monotonic() clock."""
+    if timeout is None:
+        return None
+    return time.monotonic() + timeout
+
+
+def remaining(deadline):
+    """Return the seconds left until the deadline or None if there is none."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class RetryPolicy:
+    """"
+    How often and how fast to retry a failed Bluetooth operation.
+
+    A failed attempt is retried up to "retries" times. Before retry n the
+    policy waits backoff * 2^n seconds, at most "max_backoff", reduced by a
+    random fraction of up to "jitter" so that sensors failing together do
+    not retry together. Only exceptions listed in "retry_on" are retried.
+    When all attempts failed, the poller does not contact the sensor again
+    for "failure_blackout" seconds.
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=8, jitter=0.5,
+                 retry_on=(BluetoothBackendException,), failure_blackout=300):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+        self.failure_blackout = timedelta(seconds=failure_blackout)
+
+    def delay(self, attempt):
+        """Return the seconds to wait before retrying after the given failed attempt (starting at 0)."""
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, func, deadline=None):
+        """Call func until it succeeds, the retries are used up or the deadline is reached.
+
+        "deadline" is a time.monotonic() value. The exception of the last
+        attempt is raised if all attempts fail.
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except self.retry_on as exception:
+                if attempt >= self.retries:
+                    raise
+                delay = self.delay(attempt)
+                left = remaining(deadline)
+                if left is not None and left <= delay:
+                    _LOGGER.debug('No time left for retrying after %s', exception)
+                    raise
+                _LOGGER.debug('Attempt %d failed with %s, retrying in %.2f seconds',
+                              attempt + 1, exception, delay)
+                time.sleep(delay)
+                attempt += 1
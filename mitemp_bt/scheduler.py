@@ -0,0 +1,180 @@
+""""
+Read sensors as often as their readings change, from a background thread.
+"""
+
+from datetime import datetime, timedelta
+import logging
+from threading import Lock
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import PRIORITY_BACKGROUND, read_priority
+from mitemp_bt.background import BackgroundThread
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _SensorState:  # pylint: disable=too-few-public-methods
+    """What the scheduler knows about one sensor."""
+
+    def __init__(self, due):
+        self.due = due
+        self.reading = None
+        self.temperature_rate = None
+        self.humidity_rate = None
+        self.battery = None
+        self.interval = None
+        self.failures = 0
+
+
+class AdaptiveScheduler(BackgroundThread):
+    """"
+    Read every sensor about as often as its readings change.
+
+    The change rate of temperature and humidity of each sensor is tracked
+    over its last readings. The next read is planned for when the
+    temperature is expected to have changed by "temperature_step" degrees
+    or the humidity by "humidity_step" percent, but not sooner than
+    "min_interval" and not later than "max_interval" seconds. The interval
+    of sensors with a battery level below "low_battery" percent is
+    multiplied by "low_battery_factor". Reads of sensors on the same adapter
+    are planned at least "spacing" seconds apart, which also staggers the
+    first reads. Reads use background priority on the adapters. A sensor
+    that cannot be read is tried again after "min_interval" seconds,
+    doubled for every further failure up to "max_interval", but not before
+    the failure blackout of the retry policy of its poller is over.
+    """
+
+    def __init__(self, pollers=(), min_interval=60, max_interval=1800, temperature_step=0.2, humidity_step=1.0,
+                 low_battery=20, low_battery_factor=2, spacing=5, smoothing=0.5, max_wait=60):
+        """
+        Schedule the given pollers, "smoothing" is the weight of the newest
+        change rate. The thread wakes up at least every "max_wait" seconds
+        to pick up pollers added in the meantime.
+        """
+        super().__init__('mitemp-scheduler')
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.temperature_step = temperature_step
+        self.humidity_step = humidity_step
+        self.low_battery = low_battery
+        self.low_battery_factor = low_battery_factor
+        self.spacing = spacing
+        self.smoothing = smoothing
+        self._max_wait = max_wait
+        self._sensors = {}
+        self._lock = Lock()
+        for poller in pollers:
+            self.add(poller)
+
+    def add(self, poller):
+        """Schedule this poller as well, its first read is staggered with the others on its adapter."""
+        with self._lock:
+            if poller not in self._sensors:
+                self._sensors[poller] = _SensorState(self._free_slot(poller, datetime.now()))
+
+    def remove(self, poller):
+        """Stop reading this poller."""
+        with self._lock:
+            self._sensors.pop(poller, None)
+
+    def due(self, poller):
+        """Return when the poller is read next."""
+        with self._lock:
+            return self._sensors[poller].due
+
+    def interval(self, poller):
+        """Return the current read interval of the poller in seconds, None before it was read."""
+        with self._lock:
+            return self._sensors[poller].interval
+
+    def _free_slot(self, poller, due):
+        """Return the first time from "due" on that is "spacing" apart from the reads on the same adapter.
+
+        The lock must be held.
+        """
+        spacing = timedelta(seconds=self.spacing)
+        taken = sorted(state.due for other, state in self._sensors.items()
+                       if other is not poller and other.adapter == poller.adapter)
+        for other_due in taken:
+            if other_due - spacing < due < other_due + spacing:
+                due = other_due + spacing
+        return due
+
+    def _rate(self, old_rate, change, seconds):
+        """Return the smoothed change rate per second."""
+        rate = abs(change) / seconds
+        if old_rate is None:
+            return rate
+        return self.smoothing * rate + (1 - self.smoothing) * old_rate
+
+    def _observe(self, state, reading):
+        """Update the change rates with a new reading."""
+        previous, state.reading = state.reading, reading
+        if previous is None:
+            return
+        seconds = (reading.timestamp - previous.timestamp).total_seconds()
+        if seconds <= 0:
+            return
+        state.temperature_rate = self._rate(state.temperature_rate, reading.temperature - previous.temperature,
+                                            seconds)
+        state.humidity_rate = self._rate(state.humidity_rate, reading.humidity - previous.humidity, seconds)
+
+    def _next_interval(self, state):
+        """Return the seconds until the next read of a sensor."""
+        if state.temperature_rate is None:
+            # the change rate is measured from the first two readings
+            interval = self.min_interval
+        else:
+            interval = self.max_interval
+            if state.temperature_rate:
+                interval = min(interval, self.temperature_step / state.temperature_rate)
+            if state.humidity_rate:
+                interval = min(interval, self.humidity_step / state.humidity_rate)
+        if state.battery is not None and state.battery < self.low_battery:
+            interval *= self.low_battery_factor
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _failure_interval(self, poller, state):
+        """Return the seconds until a sensor that could not be read is tried again."""
+        interval = min(self.min_interval * 2 ** state.failures, self.max_interval)
+        # reads bypass the cache, so the blackout of the poller is kept here
+        return max(interval, poller.retry_policy.failure_blackout.total_seconds())
+
+    def _read(self, poller, state):
+        """Read one poller and plan its next read."""
+        _LOGGER.debug('Reading sensor %s', poller.mac)
+        start = datetime.now()
+        try:
+            with read_priority(PRIORITY_BACKGROUND):
+                reading = poller.reading(read_cached=False)
+                state.battery = poller.battery_level()
+            if reading.timestamp < start:
+                # invalid data clears the cache and raises, only a missing notification keeps the old reading
+                raise BluetoothBackendException('No new data from Mi Temp sensor %s' % poller.mac)
+        except BluetoothBackendException as exception:
+            interval = self._failure_interval(poller, state)
+            state.failures += 1
+            _LOGGER.debug('Reading sensor %s failed: %s, trying again in %d seconds', poller.mac, exception, interval)
+        else:
+            state.failures = 0
+            self._observe(state, reading)
+            interval = state.interval = self._next_interval(state)
+        with self._lock:
+            state.due = self._free_slot(poller, datetime.now() + timedelta(seconds=interval))
+
+    def read_due(self):
+        """Read all pollers that are due.
+
+        Returns the number of seconds until the next poller is due.
+        """
+        with self._lock:
+            sensors = list(self._sensors.items())
+        wait = self._max_wait
+        for poller, state in sensors:
+            if state.due <= datetime.now():
+                self._read(poller, state)
+            wait = min(wait, (state.due - datetime.now()).total_seconds())
+        return max(wait, 0)
+
+    def _run_once(self):
+        """Read what is due and wait for the next one."""
+        self._stop.wait(self.read_due())
@@ -0,0 +1,103 @@
+""""
+Cache of sensor readings shared between processes.
+
+Several processes on the same host polling the same sensors can share
+their readings through an SQLite database. A refresh lease per sensor makes
+sure that only one process at a time connects to a sensor, the others pick
+up its reading from the database.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from mitemp_bt.mitemp_bt_poller import Reading
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS readings '
+    '(mac TEXT PRIMARY KEY, temperature REAL, humidity REAL, timestamp REAL)',
+    'CREATE TABLE IF NOT EXISTS refresh_leases '
+    '(mac TEXT PRIMARY KEY, owner TEXT, expires REAL)',
+]
+
+
+class SharedReadingCache:
+    """"
+    Share readings of sensors through an SQLite database file.
+
+    A refresh lease expires after "lease_timeout" seconds, so a crashed
+    process does not block the sensor for the others. Pass an instance to
+    MiTempBtPoller as "shared_cache".
+    """
+
+    def __init__(self, path, lease_timeout=60, poll_interval=0.5):
+        self._path = path
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        with self._transaction() as database:
+            for statement in _SCHEMA:
+                database.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one transaction, holding the write lock of the database."""
+        database = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        try:
+            database.execute('BEGIN IMMEDIATE')
+            try:
+                yield database
+            except:  # noqa: E722
+                database.execute('ROLLBACK')
+                raise
+            database.execute('COMMIT')
+        finally:
+            database.close()
+
+    @staticmethod
+    def _owner():
+        """Identify the current process and thread as owner of a lease."""
+        return '{}-{}'.format(os.getpid(), threading.get_ident())
+
+    def get(self, mac):
+        """Return the last reading of a sensor or None."""
+        database = sqlite3.connect(self._path, timeout=30)
+        try:
+            row = database.execute('SELECT temperature, humidity, timestamp FROM readings WHERE mac = ?',
+                                   (mac.upper(),)).fetchone()
+        finally:
+            database.close()
+        if row is None:
+            return None
+        return Reading(row[0], row[1], datetime.fromtimestamp(row[2]))
+
+    def put(self, mac, reading):
+        """Store the reading of a sensor, unless a newer one is stored already."""
+        with self._transaction() as database:
+            database.execute('INSERT OR REPLACE INTO readings SELECT ?, ?, ?, ? WHERE NOT EXISTS '
+                             '(SELECT 1 FROM readings WHERE mac = ? AND timestamp >= ?)',
+                             (mac.upper(), reading.temperature, reading.humidity, reading.timestamp.timestamp(),
+                              mac.upper(), reading.timestamp.timestamp()))
+
+    def acquire_refresh(self, mac):
+        """Try to become the one refreshing a sensor, returns True on success."""
+        now = time.time()
+        owner = self._owner()
+        with self._transaction() as database:
+            row = database.execute('SELECT owner, expires FROM refresh_leases WHERE mac = ?',
+                                   (mac.upper(),)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            database.execute('INSERT OR REPLACE INTO refresh_leases VALUES (?, ?, ?)',
+                             (mac.upper(), owner, now + self.lease_timeout))
+        return True
+
+    def release_refresh(self, mac):
+        """Give up the refresh lease of a sensor."""
+        with self._transaction() as database:
+            database.execute('DELETE FROM refresh_leases WHERE mac = ? AND owner = ?',
+                             (mac.upper(), self._owner()))
@@ -0,0 +1,138 @@
+""""
+Opt-in tracing of the phases of each read, to find out where a slow read spends its time.
+
+Span names and fields follow OpenTelemetry conventions, but nothing
+depends on it. Pass a Tracer to MiTempBtPoller as "tracer": every call of
+a public read method produces a tree of spans (lock waits, connect, handle
+reads, notification wait, parse) which is handed to the exporter of the
+tracer when the call returns.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from threading import Lock, local
+import time
+
+
+class Span:
+    """A timed phase of a read with its sub-phases in "children"."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.status = 'OK'
+        self.start_time = time.time()
+        self.end_time = None
+
+    def set_attribute(self, key, value):
+        """Add an attribute to the span."""
+        self.attributes[key] = value
+
+    @property
+    def duration(self):
+        """Return the duration in seconds or None if the span is still running."""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def to_dict(self):
+        """Return the span and its children as dict, ready to be serialized as JSON."""
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'start_time_unix_nano': int(self.start_time * 1e9),
+            'end_time_unix_nano': None if self.end_time is None else int(self.end_time * 1e9),
+            'attributes': self.attributes,
+            'status': self.status,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class Tracer:  # pylint: disable=too-few-public-methods
+    """"
+    Create spans and export each finished tree.
+
+    "exporter" is called with the root Span once the outermost span of a
+    thread ends, e.g. a JsonLinesExporter.
+    """
+
+    def __init__(self, exporter):
+        self._exporter = exporter
+        self._local = local()
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        """Time the with block as a span, nested in the running span of this thread."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        if parent is None:
+            span = Span(name, os.urandom(16).hex(), attributes=attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+            parent.children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as exception:
+            span.status = 'ERROR'
+            span.set_attribute('exception.type', type(exception).__name__)
+            span.set_attribute('exception.message', str(exception))
+            raise
+        finally:
+            span.end_time = time.time()
+            stack.pop()
+            if parent is None:
+                self._exporter(span)
+
+
+class _NoopSpan:
+    """Span of the NOOP_TRACER, discarding everything.
+
+    One instance is its own context manager and is reused for every span,
+    so that reads without tracing don't pay for it.
+    """
+
+    def set_attribute(self, key, value):
+        """Ignore the attribute."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _NoopTracer:  # pylint: disable=too-few-public-methods
+    """Tracer used when tracing is off."""
+
+    _SPAN = _NoopSpan()
+
+    def span(self, name, attributes=None):  # pylint: disable=unused-argument
+        """Do nothing."""
+        return self._SPAN
+
+
+NOOP_TRACER = _NoopTracer()
+
+
+class JsonLinesExporter:  # pylint: disable=too-few-public-methods
+    """Append every trace as one line of JSON to a file."""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = Lock()
+
+    def __call__(self, span):
+        line = json.dumps(span.to_dict(), sort_keys=True)
+        with self._lock:
+            with open(self._path, 'a', encoding='utf-8') as trace_file:
+                trace_file.write(line + '\n')
@@ -0,0 +1,255 @@
+""""
+Run the Bluetooth communication in worker processes, so a hanging backend cannot freeze the caller.
+"""
+
+import logging
+import multiprocessing
+import os
+from queue import Empty, Queue
+import signal
+from threading import Lock
+from btlewrap.base import AbstractBackend, BluetoothBackendException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Collector:  # pylint: disable=too-few-public-methods
+    """Delegate keeping the payloads of all notifications in the worker."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def handleNotification(self, handle, raw_data):  # pylint: disable=unused-argument,invalid-name
+        """Keep the payload."""
+        self.payloads.append(raw_data)
+
+
+def _worker_main(backend, connection):
+    """Answer requests for backend operations until the pipe is closed."""
+    backends = {}
+    while True:
+        try:
+            operation, adapter, address_type, args = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            key = (adapter, address_type)
+            if key not in backends:
+                backends[key] = backend(adapter=adapter, address_type=address_type)
+            if operation == 'wait_for_notification':
+                collector = _Collector()
+                backends[key].wait_for_notification(args[0], collector, args[1])
+                result = collector.payloads
+            else:
+                result = getattr(backends[key], operation)(*args)
+            connection.send(('ok', result))
+        except BluetoothBackendException as exception:
+            connection.send(('error', str(exception)))
+        except Exception as exception:  # pylint: disable=broad-except
+            # any failure of the backend is reported instead of killing the worker
+            connection.send(('error', '{}: {}'.format(type(exception).__name__, exception)))
+
+
+class _WorkerLost(BluetoothBackendException):
+    """The worker did not answer in time or died, it was replaced."""
+
+
+class _Worker:
+    """A worker process and the pipe to talk to it."""
+
+    def __init__(self, context, backend, number):
+        self._connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(backend, child),
+                                       name='mitemp-worker-{}'.format(number), daemon=True)
+        self.process.start()
+        child.close()
+
+    def request(self, timeout, operation, adapter, address_type, *args):
+        """Send a request and return the result, raises _WorkerLost if there is none within "timeout"."""
+        try:
+            self._connection.send((operation, adapter, address_type, args))
+            if not self._connection.poll(timeout):
+                raise _WorkerLost('Worker {} did not answer {} within {} seconds'.format(
+                    self.process.pid, operation, timeout))
+            status, result = self._connection.recv()
+        except (EOFError, OSError) as exception:
+            raise _WorkerLost('Worker {} died during {}'.format(self.process.pid, operation)) from exception
+        if status == 'error':
+            raise BluetoothBackendException(result)
+        return result
+
+    def kill(self):
+        """Kill the process, no matter what it is doing."""
+        # Process.kill() is only available from Python 3.7 on
+        if self.process.is_alive():
+            os.kill(self.process.pid, signal.SIGKILL)
+        self.process.join()
+        self._connection.close()
+
+    def stop(self):
+        """Let the process end."""
+        self._connection.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class WorkerPool:
+    """"
+    Pool of worker processes doing the Bluetooth communication of a backend.
+
+    Pass WorkerPool(backend).backend to MiTempBtPoller instead of the
+    backend itself. Every connection to a sensor is handled by one worker
+    process. A request that is not answered within "request_timeout"
+    seconds, plus the notification timeout when waiting for sensor data,
+    kills the worker and starts a new one, so the caller never hangs. The
+    backend must be picklable, which classes defined in a module are.
+    Connections on the same adapter are queued by the adapter manager, so
+    give it a higher "max_connections" to use several workers per adapter.
+    """
+
+    def __init__(self, backend, workers=2, request_timeout=30, context=None):
+        self._backend = backend
+        self._size = workers
+        self.request_timeout = request_timeout
+        self._context = context if context is not None else multiprocessing.get_context()
+        self._idle = Queue()
+        self._workers = []
+        self._lock = Lock()
+        self._started = 0
+        self._closed = False
+        self.restarts = 0
+
+    @property
+    def backend(self):
+        """Return the backend class to pass to MiTempBtPoller."""
+        return type('Worker' + self._backend.__name__, (_WorkerBackend,), {'pool': self})
+
+    def _start_worker(self):
+        """Start a new worker process and make it available, while holding the lock."""
+        self._started += 1
+        worker = _Worker(self._context, self._backend, self._started)
+        self._workers.append(worker)
+        self._idle.put(worker)
+
+    def checkout(self, timeout):
+        """Return an idle worker, starting the workers on first use."""
+        with self._lock:
+            if self._closed:
+                raise BluetoothBackendException('Worker pool is closed')
+            if not self._workers:
+                for _ in range(self._size):
+                    self._start_worker()
+        try:
+            return self._idle.get(timeout=timeout)
+        except Empty:
+            raise BluetoothBackendException('No worker became available within {} seconds'.format(timeout)) from None
+
+    def checkin(self, worker):
+        """Make a worker available again, or stop it if the pool is closed."""
+        with self._lock:
+            if not self._closed:
+                self._idle.put(worker)
+                return
+            self._workers.remove(worker)
+        worker.stop()
+
+    def request(self, worker, timeout, *request):
+        """Send a request to a worker, replacing the worker if it does not answer."""
+        try:
+            return worker.request(self.request_timeout + timeout, *request)
+        except _WorkerLost as exception:
+            _LOGGER.warning('%s, restarting it', exception)
+            worker.kill()
+            with self._lock:
+                self._workers.remove(worker)
+                if not self._closed:
+                    self.restarts += 1
+                    self._start_worker()
+            raise
+
+    def close(self):
+        """Stop all idle workers, the others are stopped when they are checked in."""
+        workers = []
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    workers.append(self._idle.get_nowait())
+                except Empty:
+                    break
+            for worker in workers:
+                self._workers.remove(worker)
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _WorkerBackend(AbstractBackend):
+    """Backend forwarding every operation of a connection to a worker of the pool."""
+
+    pool = None
+
+    def __init__(self, adapter='hci0', address_type='public', **kwargs):
+        super().__init__(adapter, address_type, **kwargs)
+        self._worker = None
+
+    @staticmethod
+    def check_backend():
+        """The backend is checked in the workers."""
+        return True
+
+    @staticmethod
+    def supports_scanning():
+        """Scanning is not done in the workers."""
+        return False
+
+    def _request(self, timeout, operation, *args):
+        """Send a request to the worker of the connection."""
+        if self._worker is None:
+            raise BluetoothBackendException('Not connected')
+        try:
+            return self.pool.request(self._worker, timeout, operation, self.adapter, self.address_type, *args)
+        except _WorkerLost:
+            # the connection ended with the worker
+            self._worker = None
+            raise
+
+    def connect(self, mac):
+        self._worker = self.pool.checkout(self.pool.request_timeout)
+        worker = self._worker
+        try:
+            self._request(0, 'connect', mac)
+        except _WorkerLost:
+            # the worker was replaced already
+            raise
+        except BluetoothBackendException:
+            self._worker = None
+            self.pool.checkin(worker)
+            raise
+
+    def disconnect(self):
+        if self._worker is None:
+            return
+        worker = self._worker
+        try:
+            self._request(0, 'disconnect')
+        finally:
+            if self._worker is not None:
+                self._worker = None
+                self.pool.checkin(worker)
+
+    def read_handle(self, handle):
+        return self._request(0, 'read_handle', handle)
+
+    def write_handle(self, handle, value):
+        return self._request(0, 'write_handle', handle, value)
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        for raw_data in self._request(notification_timeout, 'wait_for_notification', handle, notification_timeout):
+            delegate.handleNotification(handle, raw_data)
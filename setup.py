@@ -23,5 +23,5 @@ setup(
     install_requires=['btlewrap>=0.0.8'],
     keywords='temperature and humidity sensor bluetooth low-energy ble',
     zip_safe=False,
-    extras_require={'testing': ['pytest']}
+    extras_require={'testing': ['pytest'], 'numpy': ['numpy']}
 )
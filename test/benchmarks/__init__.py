@@ -0,0 +1,72 @@
+"""Benchmarks, compared against a stored baseline.
+
+Run with "pytest test/benchmarks", add "--update-baseline" to store the
+results as new baseline. A benchmark fails if it is more than TOLERANCE
+slower than its baseline, so update the baseline on the machine that runs
+the benchmarks before relying on them.
+"""
+import json
+import os
+import time
+import unittest
+import pytest
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOLERANCE = 0.5
+ROUNDS = 3
+
+
+def measure(func, iterations, rounds=ROUNDS):
+    """Return the seconds per call of func, the best of "rounds" rounds."""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        seconds = (time.perf_counter() - start) / iterations
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+@pytest.mark.usefixtures("update_baseline")
+class BenchmarkCase(unittest.TestCase):
+    """Base class of benchmarks, comparing their results with the baseline."""
+
+    # pylint does not understand pytest fixtures, so we have to disable the warning
+    # pylint: disable=no-member
+
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results:
+            baseline = cls._baseline()
+            baseline.update(cls.results)
+            with open(BASELINE, 'w', encoding='utf-8') as baseline_file:
+                json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+
+    @staticmethod
+    def _baseline():
+        """Return the stored baseline, seconds keyed by benchmark name."""
+        try:
+            with open(BASELINE, encoding='utf-8') as baseline_file:
+                return json.load(baseline_file)
+        except FileNotFoundError:
+            return {}
+
+    def _compare(self, name, seconds):
+        """Compare a result with the baseline, or store it with --update-baseline."""
+        print('{}: {:.3g} s'.format(name, seconds))
+        if self.update_baseline:
+            self.results[name] = float('{:.4g}'.format(seconds))
+            return
+        baseline = self._baseline().get(name)
+        if baseline is None:
+            self.skipTest('no baseline for {}'.format(name))
+        self.assertLessEqual(seconds, baseline * (1 + TOLERANCE),
+                             '{} regressed from {:.3g} s to {:.3g} s'.format(name, baseline, seconds))
@@ -0,0 +1,86 @@
+"""Benchmarks of the hot paths of the poller."""
+import logging
+from threading import Thread
+from test.benchmarks import BenchmarkCase, measure
+from test.helper import LatencyMockBackend
+
+from mitemp_bt.batch import decode_payloads
+from mitemp_bt.fleet import MiTempBtFleet
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, parse_sensor_data
+from mitemp_bt.retry import RetryPolicy
+
+# latency of a fast sensor, scaled down so that the benchmarks finish quickly
+SENSOR = LatencyMockBackend.configured(connect_latency=0.01, notification_latency=0.02, jitter=0.002)
+
+
+class TestBenchmarks(BenchmarkCase):
+    """Benchmarks of the MiTempBtPoller with a latency-injecting mock backend."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    # pylint does not understand pytest fixtures, so we have to disable the warning
+    # pylint: disable=no-member
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # debug logging would dominate the fast paths
+        cls._log_level = logging.getLogger('mitemp_bt').level
+        logging.getLogger('mitemp_bt').setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.getLogger('mitemp_bt').setLevel(cls._log_level)
+        super().tearDownClass()
+
+    def test_cold_read(self):
+        """Read a sensor that has not been read before."""
+        def cold_read():
+            MiTempBtPoller(self.TEST_MAC, SENSOR).parameter_value(MI_TEMPERATURE)
+        self._compare('cold_read', measure(cold_read, 10))
+
+    def test_warm_read(self):
+        """Read a sensor from the cache."""
+        poller = MiTempBtPoller(self.TEST_MAC, SENSOR)
+        poller.parameter_value(MI_TEMPERATURE)
+        self._compare('warm_read', measure(lambda: poller.parameter_value(MI_TEMPERATURE), 20000))
+
+    def test_parse(self):
+        """Parse the raw sensor data."""
+        self._compare('parse', measure(lambda: parse_sensor_data(b'T=23.4 H=45.6\x00'), 100000))
+
+    def test_decode_batch(self):
+        """Decode a batch of raw sensor data, per payload."""
+        payloads = [b'T=23.4 H=45.6\x00', b'T=-1.2 H=99.9\x00', b'\xaa\xbb'] * 10000
+        self._compare('decode_batch', measure(lambda: decode_payloads(payloads), 3) / len(payloads))
+
+    def test_flaky_read(self):
+        """Read a sensor whose connections fail every now and then."""
+        backend = LatencyMockBackend.configured(connect_latency=0.01, notification_latency=0.02,
+                                                jitter=0.002, failure_rate=0.3, seed=1)
+        poller = MiTempBtPoller(self.TEST_MAC, backend, retry_policy=RetryPolicy(retries=10, backoff=0))
+        self._compare('flaky_read', measure(lambda: poller.parameter_value(MI_TEMPERATURE, read_cached=False), 10))
+
+    def test_lock_contention(self):
+        """Read the same sensor from many threads, while its cache expires."""
+        threads = 8
+
+        def contended_reads():
+            poller = MiTempBtPoller(self.TEST_MAC, SENSOR)
+            workers = [Thread(target=lambda: [poller.parameter_value(MI_TEMPERATURE) for _ in range(500)])
+                       for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            self.assertEqual(1, poller._bt_interface._backend.connect_count)  # pylint: disable=protected-access
+        self._compare('lock_contention_{}_threads'.format(threads), measure(contended_reads, 3))
+
+    def test_fleet_sweep(self):
+        """Read a fleet of sensors spread over several adapters."""
+        macs = ['11:22:33:44:55:{:02X}'.format(i) for i in range(12)]
+
+        def sweep():
+            fleet = MiTempBtFleet(macs, SENSOR, adapters=('hci0', 'hci1', 'hci2'))
+            self.assertEqual(12, len(fleet.sweep().readings))
+        self._compare('fleet_sweep_12_sensors_3_adapters', measure(sweep, 3))
@@ -0,0 +1,29 @@
+"""Benchmarks of the startup time of the library and the command line."""
+import os
+import subprocess
+import sys
+from test.benchmarks import BenchmarkCase, measure
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _run(*args):
+    """Run a fresh python interpreter with the given arguments."""
+    subprocess.run([sys.executable] + list(args), cwd=ROOT_DIR, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class TestStartup(BenchmarkCase):
+    """Benchmarks of the time from starting python until the library or CLI is ready."""
+
+    def test_import_poller(self):
+        """Import the poller."""
+        self._compare('startup_import_poller', measure(lambda: _run('-c', 'import mitemp_bt.mitemp_bt_poller'), 5))
+
+    def test_demo_help(self):
+        """Show the help of demo.py."""
+        self._compare('startup_demo_help', measure(lambda: _run('demo.py', '--help'), 5))
+
+    def test_demo_backends(self):
+        """List the backends with demo.py."""
+        self._compare('startup_demo_backends', measure(lambda: _run('demo.py', 'backends'), 5))
@@ -8,9 +8,12 @@ def pytest_addoption(parser):
 
     Changes:
         - Add command line parameter '--mac=<some mac>' to pytest.
+        - Add command line parameter '--update-baseline' for the benchmarks.
         - enable logging to console
     """
     parser.addoption("--mac", action="store", help="mac address of sensor to be used for testing")
+    parser.addoption("--update-baseline", action="store_true",
+                     help="store the benchmark results as new baseline instead of comparing them")
     logging.basicConfig(level=logging.DEBUG)
 
 
@@ -18,3 +21,9 @@ def pytest_addoption(parser):
 def mac(request):
     """Get command line parameter and store it in class"""
     request.cls.mac = request.config.getoption("--mac")
+
+
+@pytest.fixture(scope="class")
+def update_baseline(request):
+    """Get command line parameter and store it in class"""
+    request.cls.update_baseline = request.config.getoption("--update-baseline")
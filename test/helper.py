@@ -1,4 +1,6 @@
 """Helper functions for unit tests."""
+import random
+import time
 from test import _HANDLE_READ_BATTERY_LEVEL, _HANDLE_READ_FIRMWARE_VERSION, _HANDLE_READ_NAME
 from btlewrap.base import AbstractBackend, BluetoothBackendException
 
@@ -23,6 +25,7 @@ class MockBackend(AbstractBackend):
         self.expected_write_handles = set()
         self.override_read_handles = {}
         self.is_available = True
+        self.connect_count = 0
         self._handle_0x03_raw_set = False
         self._handle_0x03_raw = None
         self._handle_0x0010_raw_set = False
@@ -36,6 +39,10 @@ class MockBackend(AbstractBackend):
         """This backend is available when the field is set accordingly."""
         return self.is_available
 
+    def connect(self, mac):
+        """Count the connections, so tests can check how often we connect."""
+        self.connect_count += 1
+
     def set_version(self, version):
         """Sets the version number to be returned."""
         self._version = version
@@ -146,6 +153,50 @@ class MockBackend(AbstractBackend):
         self._handle_0x0024_raw = value
 
 
+class LatencyMockBackend(MockBackend):
+    """MockBackend that takes time like a real sensor and sometimes fails.
+
+    Connecting and waiting for the notification take the configured
+    latency in seconds plus a random jitter of up to "jitter" seconds.
+    "failure_rate" is the probability of a connection failing. Use
+    configured() to get a backend class with other settings.
+    """
+
+    connect_latency = 0.0
+    read_latency = 0.0
+    notification_latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+    seed = 0
+
+    def __init__(self, adapter='hci0', address_type: str = 'public'):
+        super().__init__(adapter, address_type)
+        self._random = random.Random(self.seed)
+
+    @classmethod
+    def configured(cls, **settings):
+        """Return a subclass with the given class attributes."""
+        return type(cls.__name__, (cls,), settings)
+
+    def _sleep(self, latency):
+        """Sleep for the latency plus jitter."""
+        time.sleep(latency + self.jitter * self._random.random())
+
+    def connect(self, mac):
+        super().connect(mac)
+        self._sleep(self.connect_latency)
+        if self._random.random() < self.failure_rate:
+            raise BluetoothBackendException('simulated connection failure')
+
+    def read_handle(self, handle):
+        self._sleep(self.read_latency)
+        return super().read_handle(handle)
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        self._sleep(self.notification_latency)
+        super().wait_for_notification(handle, delegate, notification_timeout)
+
+
 class ConnectExceptionBackend(AbstractBackend):
     """This backend always raises Exceptions."""
 
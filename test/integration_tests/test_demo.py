@@ -2,6 +2,7 @@
 
 This is also some end-to-end testing.
 """
+import json
 import subprocess
 import os
 import unittest
@@ -34,6 +35,18 @@ class TestDemoPy(unittest.TestCase):
         cmd = './demo.py --backend gatttool poll {}'.format(self.mac)
         subprocess.check_call(cmd, shell=True, cwd=self.root_dir)
 
+    @pytest.mark.usefixtures("mac")
+    def test_bulk_poll(self):
+        """Test polling several sensors with machine-readable output."""
+        self.assertIsNotNone(self.mac)
+        cmd = './demo.py --backend bluepy poll --format json {0} {0}'.format(self.mac)
+        stdout = subprocess.check_output(cmd, shell=True, cwd=self.root_dir)
+        records = [json.loads(line) for line in stdout.decode('utf-8').splitlines()]
+        self.assertEqual(2, len(records))
+        for record in records:
+            self.assertIsNone(record['error'])
+            self.assertIsNotNone(record['temperature'])
+
     def test_list_backends(self):
         """Test the list backends subcommand."""
         cmd = './demo.py backends'
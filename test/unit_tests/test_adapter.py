@@ -0,0 +1,168 @@
+"""Tests for the adapter module."""
+from threading import Thread
+import time
+import unittest
+from test.helper import LatencyMockBackend, MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import AdapterManager, AdapterQueue, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, \
+    current_priority, read_priority
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+
+
+class TestAdapterQueue(unittest.TestCase):
+    """Tests for the AdapterQueue class."""
+
+    @staticmethod
+    def _queue_up(queue, priorities, order):
+        """Let callers with the given priorities wait in the queue one after another.
+
+        The callers are numbered by their position in the queue and append
+        their number to "order" when it is their turn.
+        """
+        def connect(number, priority):
+            with read_priority(priority):
+                queue.acquire()
+            order.append(number)
+            queue.release()
+
+        threads = []
+        for number, priority in enumerate(priorities, queue.queue_depth):
+            threads.append(Thread(target=connect, args=(number, priority)))
+            threads[-1].start()
+            while queue.queue_depth <= number:
+                time.sleep(0.001)
+        return threads
+
+    def test_order(self):
+        """Waiting callers connect in the order they arrived."""
+        queue = AdapterQueue('hci0')
+        order = []
+
+        def connect(number):
+            queue.acquire()
+            order.append(number)
+            queue.release()
+
+        self.assertTrue(queue.acquire())
+        threads = []
+        for number in range(5):
+            threads.append(Thread(target=connect, args=(number,)))
+            threads[-1].start()
+            while queue.queue_depth <= number:
+                time.sleep(0.001)
+        queue.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(range(5)), order)
+
+        stats = queue.stats()
+        self.assertEqual(6, stats.connections)
+        self.assertEqual(0, stats.queue_depth)
+        self.assertEqual(0, stats.active)
+        self.assertGreater(stats.max_wait, 0)
+
+    def test_priority(self):
+        """Interactive callers connect before background callers that arrived earlier."""
+        queue = AdapterQueue('hci0')
+        self.assertTrue(queue.acquire())
+        order = []
+        threads = self._queue_up(queue, [PRIORITY_BACKGROUND, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+                                         PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE], order)
+        queue.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([2, 4, 0, 1, 3], order)
+
+    def test_aging(self):
+        """Background callers that waited long enough are not overtaken any more."""
+        queue = AdapterQueue('hci0', aging=0.1)
+        self.assertTrue(queue.acquire())
+        order = []
+        threads = self._queue_up(queue, [PRIORITY_BACKGROUND], order)
+        time.sleep(0.15)
+        threads += self._queue_up(queue, [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND], order)
+        queue.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 1, 2], order)
+
+    def test_read_priority(self):
+        """The priority of a thread is restored after the with block."""
+        self.assertEqual(PRIORITY_INTERACTIVE, current_priority())
+        with read_priority(PRIORITY_BACKGROUND):
+            self.assertEqual(PRIORITY_BACKGROUND, current_priority())
+        self.assertEqual(PRIORITY_INTERACTIVE, current_priority())
+
+    def test_max_connections(self):
+        """Several connections are open at once, if the adapter allows it."""
+        queue = AdapterQueue('hci0', max_connections=2)
+        self.assertTrue(queue.acquire(0))
+        self.assertTrue(queue.acquire(0))
+        self.assertFalse(queue.acquire(0))
+        self.assertEqual(2, queue.stats().active)
+
+    def test_timeout(self):
+        """A caller gives up when the timeout runs out."""
+        queue = AdapterQueue('hci0')
+        queue.acquire()
+        start = time.monotonic()
+        self.assertFalse(queue.acquire(0.05))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(0, queue.queue_depth)
+        self.assertEqual(1, queue.stats().timeouts)
+
+
+class TestAdapterManager(unittest.TestCase):
+    """Tests for the AdapterManager class."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def test_register(self):
+        """Pollers share the queue of their adapter."""
+        manager = AdapterManager()
+        pollers = [MiTempBtPoller(self.TEST_MAC, MockBackend, adapter=adapter, adapter_manager=manager)
+                   for adapter in ['hci0', 'hci0', 'hci1']]
+        for poller in pollers:
+            poller.parameter_value(MI_TEMPERATURE)
+        stats = manager.stats()
+        self.assertEqual(['hci0', 'hci1'], sorted(stats))
+        self.assertEqual(2, stats['hci0'].pollers)
+        self.assertEqual(2, stats['hci0'].connections)
+        self.assertEqual(1, stats['hci1'].connections)
+        manager.unregister(pollers[0])
+        self.assertEqual(1, manager.stats()['hci0'].pollers)
+
+    def test_deadline(self):
+        """A poller does not wait for a busy adapter beyond its timeout."""
+        manager = AdapterManager()
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, adapter_manager=manager)
+        manager.queue('hci0').acquire()
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_TEMPERATURE, timeout=0.05)
+        self.assertEqual(0, poller._bt_interface._backend.connect_count)  # pylint: disable=protected-access
+
+    def test_background_priority(self):
+        """An interactive read waits for the current connection only, not for queued background reads."""
+        backend = LatencyMockBackend.configured(connect_latency=0.05)
+        manager = AdapterManager()
+        pollers = [MiTempBtPoller('11:22:33:44:55:0{}'.format(i), backend, adapter_manager=manager)
+                   for i in range(8)]
+        poller = MiTempBtPoller(self.TEST_MAC, backend, adapter_manager=manager)
+
+        def refresh(background_poller):
+            with read_priority(PRIORITY_BACKGROUND):
+                background_poller.parameter_value(MI_TEMPERATURE, read_cached=False)
+
+        threads = [Thread(target=refresh, args=(background_poller,)) for background_poller in pollers]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.08)
+        start = time.monotonic()
+        poller.parameter_value(MI_TEMPERATURE, read_cached=False)
+        waited = time.monotonic() - start
+        self.assertGreater(manager.stats()['hci0'].queue_depth, 2)
+        for thread in threads:
+            thread.join()
+        # all background reads take 0.4 seconds
+        self.assertLess(waited, 0.2)
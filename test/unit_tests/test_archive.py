@@ -0,0 +1,94 @@
+"""Tests for the archive module."""
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import unittest
+from test.helper import MockBackend
+
+from mitemp_bt.archive import ArchiveReader, ArchiveWriter
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, Reading
+
+START = datetime(2021, 5, 1, 12, 0, 0)
+MACS = ['11:22:33:44:55:00', '11:22:33:44:55:01']
+
+
+def _reading(minute):
+    """Return a reading "minute" minutes after START."""
+    return Reading(20.0 + minute / 10, 40.0 - minute / 10, START + timedelta(minutes=minute))
+
+
+class TestArchive(unittest.TestCase):
+    """Tests for the ArchiveWriter and ArchiveReader classes."""
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _write(self, minutes, **kwargs):
+        with ArchiveWriter(self._directory, **kwargs) as writer:
+            for minute in minutes:
+                writer.append(MACS[minute % 2], _reading(minute))
+
+    def _read(self, **kwargs):
+        with ArchiveReader(self._directory) as reader:
+            return list(reader.readings(**kwargs))
+
+    def test_round_trip(self):
+        """Readings are read back in time order, across segments."""
+        self._write(range(10), segment_records=3)
+        self.assertEqual(4, len([name for name in os.listdir(self._directory) if name.startswith('segment-')]))
+        self.assertEqual([(MACS[minute % 2], _reading(minute)) for minute in range(10)], self._read())
+
+    def test_range(self):
+        """A range includes "since" and excludes "until"."""
+        self._write(range(20), segment_records=4)
+        readings = self._read(since=START + timedelta(minutes=5), until=START + timedelta(minutes=13))
+        self.assertEqual([_reading(minute) for minute in range(5, 13)], [reading for _, reading in readings])
+        self.assertEqual([], self._read(since=START + timedelta(hours=1)))
+        self.assertEqual([], self._read(until=START))
+
+    def test_macs(self):
+        """Queries can be limited to some sensors."""
+        self._write(range(6))
+        readings = self._read(macs=[MACS[1].lower()])
+        self.assertEqual([_reading(minute) for minute in (1, 3, 5)], [reading for _, reading in readings])
+        with ArchiveReader(self._directory) as reader:
+            self.assertEqual(MACS, reader.macs)
+
+    def test_order(self):
+        """Pending readings are sorted, readings older than the archive are dropped."""
+        with ArchiveWriter(self._directory, buffer_size=3) as writer:
+            self.assertTrue(writer.append(MACS[0], _reading(2)))
+            self.assertTrue(writer.append(MACS[0], _reading(1)))
+            self.assertTrue(writer.append(MACS[0], _reading(3)))
+            self.assertFalse(writer.append(MACS[0], _reading(0)))
+        self.assertEqual([_reading(minute) for minute in (1, 2, 3)], [reading for _, reading in self._read()])
+
+    def test_reopen(self):
+        """A new writer continues the archive, a reader sees readings written after it was opened."""
+        self._write(range(3), segment_records=5)
+        with ArchiveReader(self._directory) as reader:
+            self.assertEqual(3, len(list(reader.readings())))
+            self._write(range(3, 8), segment_records=5)
+            self.assertEqual([_reading(minute) for minute in range(8)],
+                             [reading for _, reading in reader.readings()])
+
+    def test_poller(self):
+        """The archive of a sensor takes the readings of its poller."""
+        with ArchiveWriter(self._directory) as writer:
+            poller = MiTempBtPoller(MACS[0], MockBackend, history=writer.sensor(MACS[0]))
+            poller._bt_interface._backend.temperature = 21.5  # pylint: disable=protected-access
+            poller.fill_cache()
+        readings = self._read()
+        self.assertEqual([MACS[0]], [mac for mac, _ in readings])
+        self.assertEqual(21.5, readings[0][1].temperature)
+
+    def test_broken_segment(self):
+        """Files that are not archive segments are rejected."""
+        with open(os.path.join(self._directory, 'segment-000000'), 'wb') as segment:
+            segment.write(b'\x00' * 50)
+        with self.assertRaises(ValueError):
+            self._read()
@@ -0,0 +1,164 @@
+"""Tests for the async_poller module."""
+import asyncio
+import time
+import unittest
+from test.helper import LatencyMockBackend, MockBackend, ConnectExceptionBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.async_poller import AsyncMiTempBtPoller
+from mitemp_bt.mitemp_bt_poller import MI_TEMPERATURE, MI_BATTERY
+
+
+# takes some time to deliver the sensor data
+SlowMockBackend = LatencyMockBackend.configured(notification_latency=0.1)
+
+
+class PatientMockBackend(MockBackend):
+    """MockBackend that takes some time to deliver the sensor data, sending nothing if the wait is shorter."""
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        time.sleep(min(notification_timeout, 0.1))
+        if notification_timeout >= 0.1:
+            super().wait_for_notification(handle, delegate, notification_timeout)
+
+
+class BrokenMockBackend(MockBackend):
+    """MockBackend failing with an exception that is not a BluetoothBackendException."""
+
+    def connect(self, mac):
+        raise RuntimeError('adapter vanished')
+
+
+class TestAsyncMiTempBtPoller(unittest.TestCase):
+    """Tests for the AsyncMiTempBtPoller class."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_read(self):
+        """Test reading values."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, MockBackend)
+        backend = poller.poller._bt_interface._backend  # pylint: disable=protected-access
+        backend.temperature = 12.3
+        backend.battery_level = 42
+
+        self.assertAlmostEqual(12.3, self.loop.run_until_complete(poller.parameter_value(MI_TEMPERATURE)),
+                               delta=0.01)
+        self.assertEqual(42, self.loop.run_until_complete(poller.parameter_value(MI_BATTERY)))
+        self.assertEqual('00.00.66', self.loop.run_until_complete(poller.firmware_version()))
+        self.assertEqual('MJ_HT_V1', self.loop.run_until_complete(poller.name()))
+        self.assertEqual(42, self.loop.run_until_complete(poller.battery_level()))
+        self.assertAlmostEqual(12.3, self.loop.run_until_complete(poller.read_all())[MI_TEMPERATURE],
+                               delta=0.01)
+
+    def test_shared_read(self):
+        """Concurrent callers share one read."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, SlowMockBackend)
+        backend = poller.poller._bt_interface._backend  # pylint: disable=protected-access
+
+        async def read_many():
+            return await asyncio.gather(*[poller.parameter_value(MI_TEMPERATURE, read_cached=False)
+                                          for _ in range(20)])
+
+        self.assertEqual([0.0] * 20, self.loop.run_until_complete(read_many()))
+        self.assertEqual(1, backend.connect_count)
+
+    def test_timeout(self):
+        """A timeout of one caller does not cancel the shared read."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, SlowMockBackend)
+
+        async def read_with_timeouts():
+            impatient = poller.parameter_value(MI_TEMPERATURE, timeout=0.01)
+            patient = poller.parameter_value(MI_TEMPERATURE, timeout=5)
+            return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+        impatient, patient = self.loop.run_until_complete(read_with_timeouts())
+        self.assertIsInstance(impatient, asyncio.TimeoutError)
+        self.assertAlmostEqual(0.0, patient, delta=0.01)
+
+    def test_shared_read_timeouts(self):
+        """Callers with different timeouts share one read."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, SlowMockBackend)
+        backend = poller.poller._bt_interface._backend  # pylint: disable=protected-access
+
+        async def read_many():
+            return await asyncio.gather(*[poller.parameter_value(MI_TEMPERATURE, read_cached=False, timeout=timeout)
+                                          for timeout in [5, None, 3]])
+
+        self.assertEqual([0.0] * 3, self.loop.run_until_complete(read_many()))
+        self.assertEqual(1, backend.connect_count)
+
+    def test_timeout_reads_again(self):
+        """A caller with a longer timeout reads again if the shared read runs out of time."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, PatientMockBackend, retries=0)
+
+        async def read_with_timeouts():
+            impatient = poller.parameter_value(MI_TEMPERATURE, timeout=0.05)
+            patient = poller.parameter_value(MI_TEMPERATURE, timeout=5)
+            return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+        impatient, patient = self.loop.run_until_complete(read_with_timeouts())
+        self.assertIsInstance(impatient, (asyncio.TimeoutError, BluetoothBackendException))
+        self.assertAlmostEqual(0.0, patient, delta=0.01)
+
+    def test_timeout_stops_thread(self):
+        """The read in the executor thread gives up when the timeout runs out."""
+        backend = LatencyMockBackend.configured(connect_latency=0.05, failure_rate=1.0)
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, backend, retries=20)
+        with self.assertRaises((asyncio.TimeoutError, BluetoothBackendException)):
+            self.loop.run_until_complete(poller.parameter_value(MI_TEMPERATURE, timeout=0.2))
+        # without the deadline the retries would keep the lock for many seconds
+        self.assertTrue(poller.poller.lock.acquire(timeout=0.5))  # pylint: disable=consider-using-with
+        poller.poller.lock.release()
+
+    def test_exception(self):
+        """Exceptions of the blocking poller are raised to the caller."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, ConnectExceptionBackend, retries=0)
+        with self.assertRaises(BluetoothBackendException):
+            self.loop.run_until_complete(poller.parameter_value(MI_TEMPERATURE))
+
+    def test_stream(self):
+        """Readings are streamed until the iteration stops."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, MockBackend)
+
+        async def first_readings():
+            readings = []
+            stream = poller.stream()
+            async for reading in stream:
+                readings.append(reading)
+                if len(readings) == 3:
+                    break
+            await stream.aclose()
+            return readings
+
+        self.assertEqual(3, len(self.loop.run_until_complete(first_readings())))
+        self.assertEqual(1, poller.poller._bt_interface._backend.connect_count)  # pylint: disable=protected-access
+
+    def test_stream_exception(self):
+        """A stream that cannot connect raises the exception."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, ConnectExceptionBackend, retries=0)
+
+        async def first_reading():
+            async for reading in poller.stream():
+                return reading
+            return None
+
+        with self.assertRaises(BluetoothBackendException):
+            self.loop.run_until_complete(first_reading())
+
+    def test_stream_other_exception(self):
+        """Exceptions that are no BluetoothBackendException end the stream as well."""
+        poller = AsyncMiTempBtPoller(self.TEST_MAC, BrokenMockBackend)
+
+        async def first_reading():
+            async for reading in poller.stream():
+                return reading
+            return None
+
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(asyncio.wait_for(first_reading(), 2))
@@ -0,0 +1,72 @@
+"""Tests for the batch module."""
+import math
+import unittest
+from test import INVALID_DATA
+
+from mitemp_bt.batch import decode_payloads
+from mitemp_bt.history import numpy_module
+from mitemp_bt.mitemp_bt_poller import parse_sensor_data
+
+# the payloads of test_parse.py
+PAYLOADS = [
+    b'T=25.6 H=23.6\x00',
+    b'T=2.3 H=3.6',
+    b'T=-9.3 H=36.6',
+    b'T=-11.3 H=37.6',
+    b'T=-11.3 H=53.0\x02',
+    INVALID_DATA,
+    b'T=25.6',
+    b'T=25.6 H=123.6',
+    None,
+    b'',
+    b'\x01T=1. H=2\x00T=3.0 H=4.0',
+    b'T=5.0 H=',
+    b'6.0 H=7.0',
+    b'T=1.5\xffH=2 T=3 H=4\xff',
+]
+
+
+class TestDecodePayloads(unittest.TestCase):
+    """Tests for decode_payloads()."""
+
+    def _assert_matches_parser(self, payloads, decoded):
+        """Every payload decodes to the values of parse_sensor_data()."""
+        self.assertEqual(len(payloads), len(decoded.temperature))
+        for payload, temperature, humidity, valid in zip(payloads, *decoded):
+            reading = None if payload is None else parse_sensor_data(payload)
+            if reading is None:
+                self.assertTrue(math.isnan(temperature) and math.isnan(humidity))
+                self.assertFalse(valid)
+            else:
+                self.assertEqual((reading.temperature, reading.humidity), (temperature, humidity))
+                self.assertEqual(reading.humidity <= 100, bool(valid))
+
+    def test_sequence(self):
+        """A sequence of payloads decodes like parse_sensor_data()."""
+        decoded = decode_payloads(PAYLOADS, use_numpy=False)
+        self._assert_matches_parser(PAYLOADS, decoded)
+        self.assertEqual([1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 1, 0, 0, 1], list(decoded.valid))
+        self.assertEqual([-11.3, 53.0], [decoded.temperature[4], decoded.humidity[4]])
+
+    def test_buffer(self):
+        """A buffer of fixed size records is decoded record by record."""
+        records = [b'T=25.6 H=23.6\x00\x00\x00', b'T=-9.3 H=36.6\x00\x00\x00', INVALID_DATA]
+        decoded = decode_payloads(bytearray(b''.join(records)), record_size=16, use_numpy=False)
+        self._assert_matches_parser(records, decoded)
+        # without padding the digits of one record continue in the next one
+        records = [b'T=1.0 H=2', b'3.0 H=4.0', b'T=5 H=6.0']
+        decoded = decode_payloads(b''.join(records), record_size=9, use_numpy=False)
+        self._assert_matches_parser(records, decoded)
+        with self.assertRaises(ValueError):
+            decode_payloads(b'T=25.6 H=23.6', record_size=16)
+
+    def test_empty(self):
+        """No payloads give empty columns."""
+        self.assertEqual(0, len(decode_payloads([], use_numpy=False).valid))
+
+    @unittest.skipIf(numpy_module() is None, 'numpy is not installed')
+    def test_numpy(self):
+        """numpy arrays hold the same values."""
+        decoded = decode_payloads(PAYLOADS, use_numpy=True)
+        self.assertEqual('bool', decoded.valid.dtype.name)
+        self._assert_matches_parser(PAYLOADS, decoded)
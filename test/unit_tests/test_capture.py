@@ -0,0 +1,102 @@
+"""Tests for the capture module."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from test.helper import LatencyMockBackend, MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.capture import RecordingBackend, ReplayBackend, read_capture
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_BATTERY, MI_HUMIDITY, MI_TEMPERATURE
+
+
+class GarbageMockBackend(MockBackend):
+    """MockBackend sending sensor data with trailing garbage, like some real sensors do."""
+
+    def __init__(self, adapter='hci0', address_type='public'):
+        super().__init__(adapter, address_type)
+        self.handle_0x0010_raw = b'T=23.4 H=45.6\x00\x02'
+        self.battery_level = 87
+
+
+class TestCapture(unittest.TestCase):
+    """Tests for recording and replaying Bluetooth traffic."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _record(self, backend, path):
+        """Read everything from a sensor with a recording backend."""
+        recording = RecordingBackend.wrap(backend, path)
+        poller = MiTempBtPoller(self.TEST_MAC, recording)
+        try:
+            return poller.read_all()
+        finally:
+            recording.close()
+
+    def test_record_replay(self):
+        """A replayed capture gives the same values as the recorded sensor."""
+        for name in ['capture.jsonl', 'capture.jsonl.gz']:
+            path = os.path.join(self.directory, name)
+            recorded = self._record(GarbageMockBackend, path)
+            self.assertAlmostEqual(23.4, recorded[MI_TEMPERATURE], delta=0.01)
+            self.assertEqual(['connect', 'read', 'read', 'read', 'notify'],
+                             [event['op'] for event in read_capture(path)])
+            self.assertEqual('543d32332e3420483d34352e360002', read_capture(path)[-1]['n'][0][1])
+
+            replayed = MiTempBtPoller(self.TEST_MAC, ReplayBackend.load(path, speed=0)).read_all()
+            self.assertEqual(recorded, replayed)
+            self.assertEqual(87, replayed[MI_BATTERY])
+
+    def test_exhausted(self):
+        """A sensor fails once its capture is used up, unless the capture loops."""
+        path = os.path.join(self.directory, 'capture.jsonl')
+        self._record(MockBackend, path)
+        poller = MiTempBtPoller(self.TEST_MAC, ReplayBackend.load(path, speed=0))
+        poller.parameter_value(MI_HUMIDITY)
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_HUMIDITY, read_cached=False)
+
+        poller = MiTempBtPoller(self.TEST_MAC, ReplayBackend.load(path, speed=0, loop=True))
+        for _ in range(3):
+            poller.parameter_value(MI_HUMIDITY, read_cached=False)
+
+    def test_failures(self):
+        """Recorded failures are raised again."""
+        path = os.path.join(self.directory, 'capture.jsonl')
+        recording = RecordingBackend.wrap(LatencyMockBackend.configured(failure_rate=1), path)
+        with self.assertRaises(BluetoothBackendException):
+            MiTempBtPoller(self.TEST_MAC, recording, retries=0).firmware_version()
+        recording.close()
+        self.assertEqual('simulated connection failure', read_capture(path)[0]['e'])
+        with self.assertRaises(BluetoothBackendException):
+            MiTempBtPoller(self.TEST_MAC, ReplayBackend.load(path, speed=0), retries=0).firmware_version()
+
+    def test_one_file(self):
+        """The capture file is opened once, a compressed one is a single gzip member."""
+        path = os.path.join(self.directory, 'capture.jsonl.gz')
+        recording = RecordingBackend.wrap(MockBackend, path)
+        with recording() as backend:
+            backend.connect(self.TEST_MAC)
+            for _ in range(3):
+                backend.read_handle(0x24)
+        with open(path, 'rb') as capture:
+            self.assertEqual(1, capture.read().count(b'\x1f\x8b\x08'))
+        self.assertEqual(['connect', 'read', 'read', 'read'], [event['op'] for event in read_capture(path)])
+
+    def test_speed(self):
+        """The capture is replayed as fast as it was recorded, divided by the speed."""
+        path = os.path.join(self.directory, 'capture.jsonl')
+        self._record(LatencyMockBackend.configured(notification_latency=0.2), path)
+        for speed, minimum, maximum in [(1, 0.2, 1), (10, 0, 0.1)]:
+            poller = MiTempBtPoller(self.TEST_MAC, ReplayBackend.load(path, speed=speed))
+            start = time.monotonic()
+            poller.parameter_value(MI_TEMPERATURE)
+            self.assertGreaterEqual(time.monotonic() - start, minimum)
+            self.assertLess(time.monotonic() - start, maximum)
@@ -0,0 +1,91 @@
+"""Tests for the command line of demo.py."""
+from argparse import ArgumentTypeError, Namespace
+from contextlib import redirect_stdout
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from test.helper import MockBackend, ConnectExceptionBackend
+
+import demo
+
+MACS = ['11:22:33:44:55:00', '11:22:33:44:55:01']
+
+
+class BrokenMockBackend(MockBackend):
+    """MockBackend failing with an exception that is not a BluetoothBackendException."""
+
+    def connect(self, mac):
+        raise OSError('adapter vanished')
+
+
+class TestReadMacs(unittest.TestCase):
+    """Tests for reading MAC addresses from a file."""
+
+    def _read(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as mac_file:
+            mac_file.write(content)
+        try:
+            return demo.read_macs(mac_file.name)
+        finally:
+            os.remove(mac_file.name)
+
+    def test_parse(self):
+        """Empty lines and comments are skipped."""
+        content = '# sensors\n{}  # living room\n\n   \n{}\n'.format(*MACS)
+        self.assertEqual(MACS, self._read(content))
+
+    def test_invalid(self):
+        """Lines that are no MAC address are rejected."""
+        with self.assertRaises(ArgumentTypeError):
+            self._read('{}\nliving room\n'.format(MACS[0]))
+
+
+class TestPollMany(unittest.TestCase):
+    """Tests for reading several sensors and printing their records."""
+
+    @staticmethod
+    def _poll(backend, output_format, macs=None, timeout=None):
+        """Return the exit code and output of poll_many()."""
+        args = Namespace(format=output_format, workers=2, adapter=['hci0'], timeout=timeout)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = demo.poll_many(macs or MACS, backend, args)
+        return code, output.getvalue()
+
+    def test_json(self):
+        """Every sensor gets one line of JSON with all fields."""
+        code, output = self._poll(MockBackend, 'json')
+        records = sorted((json.loads(line) for line in output.splitlines()), key=lambda record: record['mac'])
+        self.assertEqual(0, code)
+        self.assertEqual(MACS, [record['mac'] for record in records])
+        self.assertEqual(demo.FIELDS, list(records[0]))
+        self.assertEqual((0.0, 0.0, None), (records[0]['temperature'], records[0]['humidity'], records[0]['error']))
+
+    def test_csv(self):
+        """The CSV output has a header and one row per sensor."""
+        code, output = self._poll(MockBackend, 'csv')
+        rows = list(csv.DictReader(io.StringIO(output)))
+        self.assertEqual(0, code)
+        self.assertEqual(MACS, sorted(row['mac'] for row in rows))
+        self.assertEqual(['', ''], [row['error'] for row in rows])
+
+    def test_text(self):
+        """The text output has one line per sensor."""
+        code, output = self._poll(MockBackend, 'text')
+        self.assertEqual(0, code)
+        self.assertEqual(MACS, sorted(line.split(': ', 1)[0] for line in output.splitlines()))
+        self.assertIn('temperature=0.0 humidity=0.0', output)
+
+    def test_error(self):
+        """A failing sensor gets an error record and exit code 1."""
+        for backend, error in [(ConnectExceptionBackend, 'always raising exceptions'),
+                               (BrokenMockBackend, 'adapter vanished')]:
+            code, output = self._poll(backend, 'json', macs=MACS[:1], timeout=0.2)
+            record = json.loads(output)
+            self.assertEqual(1, code)
+            self.assertEqual(MACS[0], record['mac'])
+            self.assertIn(error, record['error'])
+            self.assertIsNone(record['temperature'])
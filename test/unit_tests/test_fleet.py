@@ -0,0 +1,99 @@
+"""Tests for the fleet module."""
+import unittest
+from threading import Lock
+from test.helper import LatencyMockBackend, MockBackend, ConnectExceptionBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.fleet import MiTempBtFleet
+from mitemp_bt.mitemp_bt_poller import MI_TEMPERATURE
+
+
+class TrackingMockBackend(LatencyMockBackend.configured(connect_latency=0.05)):
+    """LatencyMockBackend tracking parallel connections."""
+
+    active = {}
+    max_active = {}
+    max_total = [0]
+    _lock = Lock()
+
+    def connect(self, mac):
+        with self._lock:
+            self.active[self.adapter] = self.active.get(self.adapter, 0) + 1
+            self.max_active[self.adapter] = max(self.max_active.get(self.adapter, 0),
+                                                self.active[self.adapter])
+            self.max_total[0] = max(self.max_total[0], sum(self.active.values()))
+        super().connect(mac)
+
+    def disconnect(self):
+        with self._lock:
+            self.active[self.adapter] -= 1
+
+
+class BrokenMockBackend(MockBackend):
+    """MockBackend failing with an exception that is not a BluetoothBackendException for one sensor."""
+
+    broken_mac = '11:22:33:44:55:00'
+
+    def connect(self, mac):
+        if mac == self.broken_mac:
+            raise RuntimeError('adapter vanished')
+        super().connect(mac)
+
+
+class TestMiTempBtFleet(unittest.TestCase):
+    """Tests for the MiTempBtFleet class."""
+
+    MACS = ['11:22:33:44:55:0{}'.format(i) for i in range(6)]
+
+    def setUp(self):
+        TrackingMockBackend.active.clear()
+        TrackingMockBackend.max_active.clear()
+        TrackingMockBackend.max_total[0] = 0
+
+    def test_adapter_assignment(self):
+        """Sensors are spread evenly over the adapters."""
+        fleet = MiTempBtFleet(self.MACS, MockBackend, adapters=['hci0', 'hci1', 'hci2'])
+        adapters = [fleet.poller(mac).adapter for mac in self.MACS]
+        self.assertEqual(2, adapters.count('hci0'))
+        self.assertEqual(2, adapters.count('hci1'))
+        self.assertEqual(2, adapters.count('hci2'))
+
+        fleet.remove(self.MACS[0])
+        fleet.add('11:22:33:44:55:99')
+        self.assertEqual('hci0', fleet.poller('11:22:33:44:55:99').adapter)
+        self.assertEqual(6, len(fleet.macs))
+
+    def test_sweep(self):
+        """All sensors are read, with one connection at a time per adapter."""
+        fleet = MiTempBtFleet(self.MACS, TrackingMockBackend, adapters=['hci0', 'hci1'])
+        sweep = fleet.sweep()
+
+        self.assertEqual(self.MACS, list(sweep.readings))
+        self.assertEqual({}, dict(sweep.errors))
+        for values in sweep.readings.values():
+            self.assertAlmostEqual(0.0, values[MI_TEMPERATURE], delta=0.01)
+        self.assertEqual({'hci0': 1, 'hci1': 1}, TrackingMockBackend.max_active)
+        # both adapters were busy at the same time
+        self.assertEqual(2, TrackingMockBackend.max_total[0])
+
+    def test_sweep_errors(self):
+        """Failing sensors are reported as errors."""
+        fleet = MiTempBtFleet(self.MACS[:2], ConnectExceptionBackend, adapters=['hci0'], retries=0)
+        sweep = fleet.sweep()
+        self.assertEqual({}, dict(sweep.readings))
+        self.assertEqual(self.MACS[:2], list(sweep.errors))
+        self.assertIsInstance(sweep.errors[self.MACS[0]], BluetoothBackendException)
+
+    def test_sweep_unexpected_error(self):
+        """Other exceptions are reported as errors as well, the other sensors of the adapter are still read."""
+        fleet = MiTempBtFleet(self.MACS[:3], BrokenMockBackend, adapters=['hci0'], retries=0)
+        with self.assertLogs('mitemp_bt.fleet', 'ERROR'):
+            sweep = fleet.sweep()
+        self.assertEqual(self.MACS[1:3], list(sweep.readings))
+        self.assertEqual([self.MACS[0]], list(sweep.errors))
+        self.assertIsInstance(sweep.errors[self.MACS[0]], RuntimeError)
+
+    def test_no_adapters(self):
+        """A fleet needs at least one adapter."""
+        with self.assertRaises(ValueError):
+            MiTempBtFleet(self.MACS, MockBackend, adapters=[])
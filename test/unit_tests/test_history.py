@@ -0,0 +1,102 @@
+"""Tests for the history module."""
+from datetime import datetime, timedelta
+import unittest
+from test.helper import MockBackend
+
+from mitemp_bt.fleet import MiTempBtFleet
+from mitemp_bt.history import HistoryStore, ReadingHistory, numpy_module
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, Reading
+
+START = datetime(2021, 5, 1, 12, 0, 0)
+
+
+def _readings(count, start=0):
+    """Return "count" readings one minute apart."""
+    return [Reading(20.0 + i, 40.0 + 2 * i, START + timedelta(minutes=i)) for i in range(start, start + count)]
+
+
+class TestReadingHistory(unittest.TestCase):
+    """Tests for the ReadingHistory class."""
+
+    def _history(self, readings, capacity=10):
+        history = ReadingHistory(capacity, use_numpy=False)
+        for reading in readings:
+            history.append(reading)
+        return history
+
+    def test_append_and_last(self):
+        """The last readings are returned oldest first."""
+        history = self._history(_readings(3))
+        self.assertEqual(3, len(history))
+        self.assertEqual(_readings(3), history.last(5))
+        self.assertEqual(_readings(2, start=1), history.last(2))
+
+    def test_capacity(self):
+        """Only the newest "capacity" readings are kept."""
+        history = self._history(_readings(25), capacity=10)
+        self.assertEqual(10, len(history))
+        self.assertEqual(_readings(10, start=15), history.window())
+
+    def test_duplicates(self):
+        """Readings that are not newer than the last one are ignored."""
+        history = self._history(_readings(2))
+        self.assertFalse(history.append(_readings(1)[0]))
+        self.assertFalse(history.append(_readings(2)[1]))
+        self.assertEqual(2, len(history))
+
+    def test_window(self):
+        """The window includes "since" and excludes "until", also across the end of the ring."""
+        history = self._history(_readings(15), capacity=10)
+        window = history.window(since=START + timedelta(minutes=7), until=START + timedelta(minutes=12))
+        self.assertEqual(_readings(5, start=7), window)
+        self.assertEqual([], history.window(since=START + timedelta(hours=1)))
+        self.assertEqual([], history.window(until=START))
+
+    def test_aggregate(self):
+        """Minimum, maximum and mean are calculated over the window."""
+        history = self._history(_readings(15), capacity=10)
+        aggregate = history.aggregate(since=START + timedelta(minutes=10))
+        self.assertEqual(5, aggregate.count)
+        self.assertEqual((30.0, 34.0, 32.0), aggregate[1:4])
+        self.assertEqual((60.0, 68.0, 64.0), aggregate[4:7])
+        self.assertIsNone(history.aggregate(until=START))
+
+    @unittest.skipIf(numpy_module() is None, 'numpy is not installed')
+    def test_aggregate_numpy(self):
+        """numpy calculates the same aggregates."""
+        readings = _readings(15)
+        history = ReadingHistory(10, use_numpy=True)
+        for reading in readings:
+            history.append(reading)
+        self.assertEqual(self._history(readings).aggregate(), history.aggregate())
+
+    def test_invalid_capacity(self):
+        """A history needs room for at least one reading."""
+        with self.assertRaises(ValueError):
+            ReadingHistory(0)
+
+
+class TestHistoryIntegration(unittest.TestCase):
+    """Tests for keeping the history of pollers and fleets."""
+
+    def test_poller(self):
+        """Valid readings of a poller are added to its history."""
+        history = ReadingHistory(10)
+        poller = MiTempBtPoller('00:11:22:33:44:55', MockBackend, history=history)
+        backend = poller._bt_interface._backend  # pylint: disable=protected-access
+        backend.temperature = 21.5
+        poller.parameter_value(MI_TEMPERATURE)
+        backend.temperature = 22.0
+        poller.parameter_value(MI_TEMPERATURE, read_cached=False)
+        backend.humidity = 120.0
+        poller.fill_cache()
+        self.assertEqual([21.5, 22.0], [reading.temperature for reading in history.last(10)])
+
+    def test_fleet(self):
+        """Every sensor of a fleet gets its own history."""
+        store = HistoryStore(10)
+        macs = ['11:22:33:44:55:00', '11:22:33:44:55:01']
+        MiTempBtFleet(macs, MockBackend, history=store).sweep()
+        self.assertEqual(macs, sorted(store.macs()))
+        self.assertEqual(1, len(store.history(macs[0])))
+        self.assertIs(store.history(macs[0]), store.history(macs[0]))
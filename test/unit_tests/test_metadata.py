@@ -0,0 +1,97 @@
+"""Tests for the metadata module."""
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from test.helper import MockBackend
+
+from mitemp_bt.metadata import MetadataStore
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_BATTERY
+
+
+def _update_many(path, number):
+    """Update the store at "path" from another process."""
+    store = MetadataStore(path)
+    for i in range(20):
+        store.update(TestMetadataStore.TEST_MAC, **{'value{}_{}'.format(number, i): i})
+
+
+class TestMetadataStore(unittest.TestCase):
+    """Tests for the MetadataStore class."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metadata.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store(self):
+        """Values are merged and written to the file."""
+        store = MetadataStore(self.path)
+        self.assertEqual({}, store.get(self.TEST_MAC))
+        store.update(self.TEST_MAC, firmware='00.00.66')
+        MetadataStore(self.path).update(self.TEST_MAC.lower(), battery=99)
+        store.update('11:22:33:44:55:77', name='other')
+        self.assertEqual({'firmware': '00.00.66', 'battery': 99}, store.get(self.TEST_MAC))
+        with open(self.path, encoding='utf-8') as store_file:
+            self.assertEqual(['11:22:33:44:55:66', '11:22:33:44:55:77'], sorted(json.load(store_file)))
+        self.assertEqual(['metadata.json', 'metadata.json.lock'], sorted(os.listdir(self.directory)))
+
+    def test_permissions(self):
+        """The file keeps its permissions when it is replaced."""
+        store = MetadataStore(self.path)
+        store.update(self.TEST_MAC, firmware='00.00.66')
+        os.chmod(self.path, 0o664)
+        store.update(self.TEST_MAC, battery=99)
+        self.assertEqual(0o664, os.stat(self.path).st_mode & 0o777)
+
+    def test_concurrent_updates(self):
+        """Updates of several processes are not lost."""
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_update_many, args=(self.path, number)) for number in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        data = MetadataStore(self.path).get(self.TEST_MAC)
+        self.assertEqual({'value{}_{}'.format(p, i) for p in range(4) for i in range(20)}, set(data))
+
+    def test_broken_file(self):
+        """A broken file is treated as empty."""
+        with open(self.path, 'w', encoding='utf-8') as store_file:
+            store_file.write('{broken')
+        self.assertEqual({}, MetadataStore(self.path).get(self.TEST_MAC))
+
+    def test_warm_restart(self):
+        """A restarted poller does not read firmware, battery and name again."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, metadata_store=MetadataStore(self.path))
+        poller._bt_interface._backend.battery_level = 77
+        self.assertEqual('00.00.66', poller.firmware_version())
+        self.assertEqual('MJ_HT_V1', poller.name())
+        self.assertEqual(2, poller._bt_interface._backend.connect_count)
+
+        restarted = MiTempBtPoller(self.TEST_MAC, MockBackend, metadata_store=MetadataStore(self.path))
+        self.assertEqual('00.00.66', restarted.firmware_version())
+        self.assertEqual('MJ_HT_V1', restarted.name())
+        self.assertEqual(77, restarted.parameter_value(MI_BATTERY))
+        self.assertEqual(0, restarted._bt_interface._backend.connect_count)
+
+    def test_expired(self):
+        """Metadata older than 24h is read again."""
+        old = (datetime.now() - timedelta(hours=25)).timestamp()
+        MetadataStore(self.path).update(self.TEST_MAC, firmware='00.00.11', firmware_read=old,
+                                        battery=10, battery_read=old)
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, metadata_store=MetadataStore(self.path))
+        poller._bt_interface._backend.battery_level = 50
+        self.assertEqual(50, poller.battery_level())
+        self.assertEqual('00.00.66', poller.firmware_version())
+        self.assertEqual(1, poller._bt_interface._backend.connect_count)
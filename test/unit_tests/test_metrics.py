@@ -0,0 +1,96 @@
+"""Tests for the metrics module."""
+import unittest
+from urllib.request import urlopen
+from test import INVALID_DATA
+from test.helper import MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.metrics import MetricsRegistry, PollerMetrics, start_http_server
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+from mitemp_bt.retry import RetryPolicy
+
+
+class BrokenMockBackend(MockBackend):
+    """MockBackend failing every connection."""
+
+    def connect(self, mac):
+        super().connect(mac)
+        raise BluetoothBackendException('radio glitch')
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Tests for the MetricsRegistry class."""
+
+    def test_render(self):
+        """Counters and histograms are rendered in the Prometheus text format."""
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', 'A counter.')
+        histogram = registry.histogram('test_seconds', 'A histogram.', buckets=(1, 5))
+        counter.inc(mac='AA')
+        counter.inc(2, mac='A"B')
+        histogram.observe(0.5)
+        histogram.observe(3)
+        self.assertEqual('\n'.join([
+            '# HELP test_total A counter.',
+            '# TYPE test_total counter',
+            'test_total{mac="A\\"B"} 2.0',
+            'test_total{mac="AA"} 1.0',
+            '# HELP test_seconds A histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="1.0"} 1',
+            'test_seconds_bucket{le="5.0"} 2',
+            'test_seconds_bucket{le="+Inf"} 2',
+            'test_seconds_sum 3.5',
+            'test_seconds_count 2',
+        ]) + '\n', registry.render())
+
+    def test_http_server(self):
+        """The metrics are served over HTTP."""
+        registry = MetricsRegistry()
+        registry.counter('test_total', 'A counter.').inc()
+        server = start_http_server(0, 'localhost', registry)
+        try:
+            with urlopen('http://localhost:{}/metrics'.format(server.server_address[1])) as response:
+                self.assertEqual(registry.render(), response.read().decode('utf-8'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestPollerMetrics(unittest.TestCase):
+    """Tests for the metrics recorded by the MiTempBtPoller."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    def setUp(self):
+        self.metrics = PollerMetrics(MetricsRegistry())
+
+    def test_reads(self):
+        """Connections, handle reads, notifications and cache use are recorded."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, metrics=self.metrics)
+        poller.parameter_value(MI_TEMPERATURE)
+        poller.parameter_value(MI_TEMPERATURE)
+        self.assertEqual(1, self.metrics.connect_duration.count(mac=self.TEST_MAC))
+        self.assertEqual(1, self.metrics.read_handle_duration.count(mac=self.TEST_MAC, handle='0x18'))
+        self.assertEqual(1, self.metrics.notification_wait.count(mac=self.TEST_MAC))
+        self.assertEqual(1, self.metrics.cache_requests.value(mac=self.TEST_MAC, result='miss'))
+        self.assertEqual(1, self.metrics.cache_requests.value(mac=self.TEST_MAC, result='hit'))
+
+    def test_failures(self):
+        """Failures are counted by exception type."""
+        poller = MiTempBtPoller(self.TEST_MAC, BrokenMockBackend, metrics=self.metrics,
+                                retry_policy=RetryPolicy(retries=1, backoff=0))
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_TEMPERATURE)
+        self.assertEqual(2, self.metrics.failures.value(mac=self.TEST_MAC, exception='BluetoothBackendException'))
+        self.assertEqual(1, self.metrics.failure_blackouts.value(mac=self.TEST_MAC))
+
+    def test_rejected(self):
+        """Invalid sensor data is counted."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, metrics=self.metrics)
+        poller.handleNotification(0x0E, INVALID_DATA)
+        poller.handleNotification(0x0E, b'T=20.0 H=101.0')
+        self.assertEqual(2, self.metrics.rejected_readings.value(mac=self.TEST_MAC))
@@ -0,0 +1,138 @@
+"""Tests for the mibeacon module."""
+import unittest
+from test.helper import MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import AdapterManager
+from mitemp_bt.mibeacon import parse_service_data, MiBeaconListener
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY
+
+SENSOR_MAC = '4C:65:A8:D0:6C:1A'
+
+# service data of recorded advertisements, without the leading UUID 0xFE95
+ADV_TEMPERATURE_HUMIDITY = bytes.fromhex('5020aa015c1a6cd0a8654c0d1004e500b401')
+ADV_NEGATIVE_TEMPERATURE = bytes.fromhex('5020aa01601a6cd0a8654c0d10049bff5802')
+ADV_TEMPERATURE = bytes.fromhex('5020aa015d1a6cd0a8654c041002e600')
+ADV_HUMIDITY = bytes.fromhex('5020aa015e1a6cd0a8654c061002b001')
+ADV_BATTERY = bytes.fromhex('5020aa015f1a6cd0a8654c0a10015d')
+ADV_CAPABILITY = bytes.fromhex('7020aa01611a6cd0a8654c010d1004e500b401')
+ADV_NO_OBJECT = bytes.fromhex('3020aa01621a6cd0a8654c01')
+ADV_ENCRYPTED = bytes.fromhex('5820aa01631a6cd0a8654c0d1004e500b401')
+ADV_TRUNCATED = bytes.fromhex('5020aa015c1a6cd0a8654c0d1004e5')
+
+
+class FakeScanEntry:  # pylint: disable=too-few-public-methods
+    """Minimal replacement for bluepy's ScanEntry."""
+
+    def __init__(self, addr, service_data, rssi=-70):
+        self.addr = addr
+        self.rssi = rssi
+        self._service_data = service_data
+
+    def getValueText(self, adtype):  # pylint: disable=invalid-name
+        """Return the service data as hex string, like bluepy does."""
+        if adtype == 0x16:
+            return self._service_data.hex()
+        return None
+
+
+class TestMiBeacon(unittest.TestCase):
+    """Tests for parsing MiBeacon advertisements."""
+
+    def test_temperature_humidity(self):
+        """Frame with temperature and humidity."""
+        beacon = parse_service_data(ADV_TEMPERATURE_HUMIDITY)
+        self.assertEqual(SENSOR_MAC, beacon.mac)
+        self.assertEqual(0x01AA, beacon.product_id)
+        self.assertEqual(0x5C, beacon.frame_counter)
+        self.assertEqual({MI_TEMPERATURE: 22.9, MI_HUMIDITY: 43.6}, beacon.values)
+
+    def test_negative_temperature(self):
+        """Frame with a negative temperature."""
+        self.assertEqual({MI_TEMPERATURE: -10.1, MI_HUMIDITY: 60.0},
+                         parse_service_data(ADV_NEGATIVE_TEMPERATURE).values)
+
+    def test_single_values(self):
+        """Frames with only one value."""
+        self.assertEqual({MI_TEMPERATURE: 23.0}, parse_service_data(ADV_TEMPERATURE).values)
+        self.assertEqual({MI_HUMIDITY: 43.2}, parse_service_data(ADV_HUMIDITY).values)
+        self.assertEqual({MI_BATTERY: 93}, parse_service_data(ADV_BATTERY).values)
+
+    def test_capability(self):
+        """Frame with the capability byte."""
+        self.assertEqual({MI_TEMPERATURE: 22.9, MI_HUMIDITY: 43.6},
+                         parse_service_data(ADV_CAPABILITY).values)
+
+    def test_ignored_frames(self):
+        """Frames without usable values."""
+        self.assertIsNone(parse_service_data(ADV_NO_OBJECT))
+        self.assertIsNone(parse_service_data(ADV_ENCRYPTED))
+        self.assertIsNone(parse_service_data(ADV_TRUNCATED))
+        self.assertIsNone(parse_service_data(b'\x50\x20'))
+
+
+class TestMiBeaconListener(unittest.TestCase):
+    """Tests for filling the poller cache from advertisements."""
+
+    def test_fill_cache(self):
+        """Advertisements fill the cache without connecting to the sensor."""
+        poller = MiTempBtPoller(SENSOR_MAC, MockBackend)
+        backend = poller._bt_interface._backend  # pylint: disable=protected-access
+        received = []
+        listener = MiBeaconListener(callback=lambda mac, beacon, rssi: received.append((mac, rssi)))
+        listener.register(poller)
+
+        listener.handle_service_data(SENSOR_MAC, ADV_TEMPERATURE_HUMIDITY)
+        listener.handle_service_data(SENSOR_MAC, ADV_BATTERY)
+        self.assertAlmostEqual(22.9, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertAlmostEqual(43.6, poller.parameter_value(MI_HUMIDITY), delta=0.01)
+        self.assertEqual(93, poller.parameter_value(MI_BATTERY))
+
+        listener.handle_service_data(SENSOR_MAC, ADV_TEMPERATURE)
+        self.assertAlmostEqual(23.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertAlmostEqual(43.6, poller.parameter_value(MI_HUMIDITY), delta=0.01)
+        self.assertEqual(0, backend.connect_count)
+        self.assertEqual([(SENSOR_MAC, None)] * 3, received)
+
+    def test_partial_values(self):
+        """A single value is not enough to fill an empty cache."""
+        poller = MiTempBtPoller(SENSOR_MAC, MockBackend)
+        listener = MiBeaconListener()
+        listener.register(poller)
+        listener.handle_service_data(SENSOR_MAC, ADV_TEMPERATURE)
+        self.assertFalse(poller.cache_available())
+        listener.handle_service_data(SENSOR_MAC, ADV_HUMIDITY)
+        self.assertTrue(poller.cache_available())
+
+    def test_handle_discovery(self):
+        """Advertisements from the bluepy scanner."""
+        poller = MiTempBtPoller(SENSOR_MAC, MockBackend)
+        listener = MiBeaconListener()
+        listener.register(poller)
+        listener.handleDiscovery(FakeScanEntry(SENSOR_MAC.lower(), b'\x95\xfe' + ADV_TEMPERATURE_HUMIDITY),
+                                 True, True)
+        listener.handleDiscovery(FakeScanEntry(SENSOR_MAC.lower(), b'\x0a\x18\x00'), True, True)
+        self.assertAlmostEqual(22.9, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+
+        listener.unregister(poller)
+        listener.handle_service_data(SENSOR_MAC, ADV_NEGATIVE_TEMPERATURE)
+        self.assertAlmostEqual(22.9, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+
+    def test_adapter_queue(self):
+        """Listening holds the adapter and waits for it if it is busy."""
+        manager = AdapterManager()
+        active = []
+
+        class QueueListener(MiBeaconListener):
+            """Listener recording the open connections of the adapter instead of scanning."""
+
+            def _scan(self, timeout):
+                active.append(manager.stats()['hci0'].active)
+
+        listener = QueueListener(adapter_manager=manager)
+        listener.listen(0.05)
+        self.assertEqual([1], active)
+        manager.queue('hci0').acquire()
+        with self.assertRaises(BluetoothBackendException):
+            listener.listen(0.05)
+        self.assertEqual([1], active)
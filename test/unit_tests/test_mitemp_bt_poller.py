@@ -1,9 +1,29 @@
 """Tests for the miflora_poller module."""
+from threading import Event, Thread
 import unittest
-from test.helper import MockBackend, ConnectExceptionBackend, RWExceptionBackend
+from test.helper import LatencyMockBackend, MockBackend, ConnectExceptionBackend, RWExceptionBackend
 
 from btlewrap.base import BluetoothBackendException
-from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY
+from mitemp_bt.adapter import AdapterManager
+from mitemp_bt.retry import RetryPolicy
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY, MI_BATTERY, \
+    MI_FIRMWARE, MI_NAME
+
+
+class StreamingMockBackend(MockBackend):
+    """MockBackend sending a new temperature with every notification, dropping the link once."""
+
+    def __init__(self, adapter='hci0', address_type='public'):
+        super().__init__(adapter, address_type)
+        self.notifications = 0
+        self.drop_at = 3
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        self.notifications += 1
+        if self.notifications == self.drop_at:
+            raise BluetoothBackendException('link dropped')
+        self.temperature = float(self.notifications)
+        super().wait_for_notification(handle, delegate, notification_timeout)
 
 
 class TestMiTempBtPoller(unittest.TestCase):
@@ -47,6 +67,30 @@ class TestMiTempBtPoller(unittest.TestCase):
 
         self.assertAlmostEqual(backend.temperature, poller.parameter_value(MI_TEMPERATURE), delta=0.11)
 
+    def test_read_all(self):
+        """Test reading all values over a single connection."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend)
+        backend = self._get_backend(poller)
+        backend.temperature = 21.5
+        backend.humidity = 45.0
+        backend.battery_level = 87
+        backend.set_version('00.00.11')
+
+        result = poller.read_all()
+        self.assertEqual(1, backend.connect_count)
+        self.assertAlmostEqual(21.5, result[MI_TEMPERATURE], delta=0.01)
+        self.assertAlmostEqual(45.0, result[MI_HUMIDITY], delta=0.01)
+        self.assertEqual(87, result[MI_BATTERY])
+        self.assertEqual('00.00.11', result[MI_FIRMWARE])
+        self.assertEqual('MJ_HT_V1', result[MI_NAME])
+
+        # everything is cached now, no further connections
+        poller.firmware_version()
+        poller.name()
+        poller.parameter_value(MI_BATTERY)
+        poller.parameter_value(MI_HUMIDITY)
+        self.assertEqual(1, backend.connect_count)
+
     def test_name(self):
         """Check reading of the sensor name."""
         poller = MiTempBtPoller(self.TEST_MAC, MockBackend)
@@ -133,6 +177,99 @@ class TestMiTempBtPoller(unittest.TestCase):
         with self.assertRaises(BluetoothBackendException):
             poller.parameter_value(MI_HUMIDITY)
 
+    def test_stream(self):
+        """Readings are streamed over one connection, which is reconnected when it drops."""
+        poller = MiTempBtPoller(self.TEST_MAC, StreamingMockBackend, retry_policy=RetryPolicy(backoff=0))
+        backend = self._get_backend(poller)
+        stream = poller.stream()
+        self.assertEqual([1.0, 2.0], [next(stream).temperature for _ in range(2)])
+        self.assertEqual(1, backend.connect_count)
+        self.assertEqual([4.0, 5.0], [next(stream).temperature for _ in range(2)])
+        self.assertEqual(2, backend.connect_count)
+        self.assertAlmostEqual(5.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        stream.close()
+
+    def test_stream_failure(self):
+        """The stream fails after the retries of the retry policy."""
+        poller = MiTempBtPoller(self.TEST_MAC, ConnectExceptionBackend, retry_policy=RetryPolicy(retries=2, backoff=0))
+        with self.assertRaises(BluetoothBackendException):
+            next(poller.stream())
+
+    def test_stream_stop(self):
+        """The stream ends when stopped."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend)
+        stop = Event()
+        for count, _ in enumerate(poller.stream(stop)):
+            if count == 2:
+                stop.set()
+        self.assertEqual(1, self._get_backend(poller).connect_count)
+
+    def test_stream_shares_adapter(self):
+        """Other sensors on the adapter can be read while a stream is running."""
+        manager = AdapterManager()
+        streaming = MiTempBtPoller(self.TEST_MAC, MockBackend, adapter_manager=manager)
+        other = MiTempBtPoller('11:22:33:44:55:77', MockBackend, adapter_manager=manager)
+        stream = streaming.stream()
+        next(stream)
+        self.assertEqual(0, manager.stats()['hci0'].active)
+        self.assertAlmostEqual(0.0, other.parameter_value(MI_TEMPERATURE, timeout=1), delta=0.01)
+        next(stream)
+        stream.close()
+        self.assertEqual(1, self._get_backend(streaming).connect_count)
+        self.assertEqual(0, manager.stats()['hci0'].active)
+
+    def test_stream_owns_connection(self):
+        """Reads of the sensor wait while its stream holds the connection."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend)
+        backend = self._get_backend(poller)
+        stream = poller.stream()
+        next(stream)
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_TEMPERATURE, read_cached=False, timeout=0.2)
+        with self.assertRaises(BluetoothBackendException):
+            poller.firmware_version(timeout=0.2)
+        self.assertEqual(1, backend.connect_count)
+        stream.close()
+        self.assertAlmostEqual(0.0, poller.parameter_value(MI_TEMPERATURE, read_cached=False, timeout=1), delta=0.01)
+        self.assertEqual(2, backend.connect_count)
+
+    def test_single_flight(self):
+        """Concurrent reads of battery, firmware and name share one connection each."""
+        poller = MiTempBtPoller(self.TEST_MAC, LatencyMockBackend.configured(connect_latency=0.1))
+        backend = self._get_backend(poller)
+        backend.battery_level = 33
+        results = []
+        threads = [Thread(target=lambda method=method: results.append(method()))
+                   for method in [poller.battery_level, poller.firmware_version] * 4]
+        threads += [Thread(target=lambda: results.append(poller.name())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, backend.connect_count)
+        self.assertEqual({33, '00.00.66', 'MJ_HT_V1'}, set(results))
+
+    def test_single_flight_failure(self):
+        """Concurrent callers share the failure of the running read."""
+        poller = MiTempBtPoller(self.TEST_MAC, LatencyMockBackend.configured(connect_latency=0.1, failure_rate=1.0),
+                                retries=0)
+        backend = self._get_backend(poller)
+        errors = []
+
+        def read():
+            try:
+                poller.firmware_version()
+            except BluetoothBackendException as exception:
+                errors.append(exception)
+
+        threads = [Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(errors))
+        self.assertEqual(1, backend.connect_count)
+
     @staticmethod
     def _get_backend(poller):
         """Get the backend from a MiTempBtPoller object."""
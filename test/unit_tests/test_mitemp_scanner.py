@@ -0,0 +1,101 @@
+"""Tests for the mitemp_scanner module."""
+from datetime import datetime, timedelta
+from threading import Event
+import unittest
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt import mitemp_scanner
+from mitemp_bt.adapter import AdapterManager
+from mitemp_bt.mitemp_scanner import DeviceRegistry, ContinuousScanner
+
+
+class ScanBackend:  # pylint: disable=too-few-public-methods
+    """Backend returning a fixed scan result."""
+
+    devices = [('4c:65:a8:d0:6c:1a', 'MJ_HT_V1'),
+               ('11:22:33:44:55:66', 'MJ_HT_V1'),
+               ('4C:65:A8:00:00:01', None),
+               ('C4:7C:8D:00:00:02', 'Flower care')]
+
+    @classmethod
+    def scan_for_devices(cls, timeout, adapter=None):  # pylint: disable=unused-argument
+        """Return the fixed scan result."""
+        return cls.devices
+
+
+class TestScan(unittest.TestCase):
+    """Tests for scanning."""
+
+    def test_scan(self):
+        """Only Mi Temp sensors are returned."""
+        self.assertEqual(['4C:65:A8:D0:6C:1A', '11:22:33:44:55:66', '4C:65:A8:00:00:01'],
+                         mitemp_scanner.scan(ScanBackend, 1))
+
+    def test_continuous_scanner(self):
+        """A scan updates the registry."""
+        scanner = ContinuousScanner(ScanBackend, timeout=1)
+        self.assertEqual(3, len(scanner.scan_once()))
+        self.assertEqual(3, len(scanner.registry))
+        self.assertIn('4c:65:a8:d0:6c:1a', scanner.registry)
+
+    def test_adapter_queue(self):
+        """A scan holds the adapter and waits for it if it is busy."""
+        manager = AdapterManager()
+        active = []
+
+        class QueueScanBackend(ScanBackend):  # pylint: disable=too-few-public-methods
+            """ScanBackend recording the open connections of the adapter."""
+
+            @classmethod
+            def scan_for_devices(cls, timeout, adapter=None):
+                active.append(manager.stats()[adapter].active)
+                return super().scan_for_devices(timeout, adapter)
+
+        scanner = ContinuousScanner(QueueScanBackend, timeout=1, interval=0.05, adapter_manager=manager)
+        scanner.scan_once()
+        self.assertEqual([1], active)
+        manager.queue('hci0').acquire()
+        with self.assertRaises(BluetoothBackendException):
+            scanner.scan_once()
+        self.assertEqual([1], active)
+
+    def test_background_scan(self):
+        """Scanning in the background thread."""
+        found = Event()
+        registry = DeviceRegistry(on_new=lambda mac: found.set())
+        scanner = ContinuousScanner(ScanBackend, registry, timeout=1, interval=60)
+        scanner.start()
+        self.assertTrue(found.wait(5))
+        scanner.stop()
+        self.assertEqual(3, len(registry))
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    """Tests for the DeviceRegistry class."""
+
+    def test_new_and_vanished(self):
+        """Callbacks are called for new and vanished sensors."""
+        new = []
+        vanished = []
+        registry = DeviceRegistry(expiry=60, on_new=new.append, on_vanished=vanished.append)
+        now = datetime.now()
+
+        self.assertTrue(registry.seen('4c:65:a8:d0:6c:1a', rssi=-70, when=now - timedelta(seconds=90)))
+        self.assertTrue(registry.seen('4C:65:A8:00:00:01', when=now - timedelta(seconds=30)))
+        self.assertFalse(registry.seen('4C:65:A8:00:00:01', rssi=-60, when=now))
+        self.assertEqual(['4C:65:A8:D0:6C:1A', '4C:65:A8:00:00:01'], new)
+
+        devices = registry.devices()
+        self.assertEqual(['4C:65:A8:00:00:01', '4C:65:A8:D0:6C:1A'], [d.mac for d in devices])
+        self.assertEqual(-60, devices[0].rssi)
+
+        self.assertEqual(['4C:65:A8:D0:6C:1A'], registry.expire(now))
+        self.assertEqual(['4C:65:A8:D0:6C:1A'], vanished)
+        self.assertNotIn('4C:65:A8:D0:6C:1A', registry)
+        self.assertEqual(1, len(registry))
+
+    def test_handle_beacon(self):
+        """The registry can be fed by a MiBeaconListener."""
+        registry = DeviceRegistry()
+        registry.handle_beacon('4C:65:A8:D0:6C:1A', None, -55)
+        self.assertEqual(-55, registry.devices()[0].rssi)
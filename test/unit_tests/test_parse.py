@@ -3,9 +3,9 @@
 """
 
 import unittest
-from datetime import datetime
+from test import _HANDLE_READ_WRITE_SENSOR_DATA, INVALID_DATA
 from test.helper import MockBackend
-from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE, MI_HUMIDITY, parse_sensor_data
 
 
 class KNXConversionTest(unittest.TestCase):
@@ -16,49 +16,66 @@ class KNXConversionTest(unittest.TestCase):
     def test_parsing1(self):
         """Does the Mi TEMP BT data parser works correctly for positive double digit values? Value: 'T=25.6 H=23.6'"""
         poller = MiTempBtPoller(None, MockBackend)
-        data = bytearray([0x54, 0x3d, 0x32, 0x35, 0x2e, 0x36, 0x20,
-                          0x48, 0x3d, 0x32, 0x33, 0x2e, 0x36, 0x00]).decode("utf-8").strip(' \n\t')
-        poller._cache = data
-        poller._last_read = datetime.now()
+        data = bytes([0x54, 0x3d, 0x32, 0x35, 0x2e, 0x36, 0x20,
+                      0x48, 0x3d, 0x32, 0x33, 0x2e, 0x36, 0x00])
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, data)
         self.assertEqual(poller._parse_data()[MI_TEMPERATURE], 25.6)
         self.assertEqual(poller._parse_data()[MI_HUMIDITY], 23.6)
 
     def test_parsing2(self):
         """Does the Mi TEMP BT data parser works correctly for positive single digit values? Value: T=2.3 H=3.6"""
         poller = MiTempBtPoller(None, MockBackend)
-        data = bytearray([0x54, 0x3d, 0x32, 0x2e, 0x33, 0x20,
-                          0x48, 0x3d, 0x33, 0x2e, 0x36]).decode("utf-8").strip(' \n\t')
-        poller._cache = data
-        poller._last_read = datetime.now()
+        data = bytes([0x54, 0x3d, 0x32, 0x2e, 0x33, 0x20,
+                      0x48, 0x3d, 0x33, 0x2e, 0x36])
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, data)
         self.assertEqual(poller._parse_data()[MI_TEMPERATURE], 2.3)
         self.assertEqual(poller._parse_data()[MI_HUMIDITY], 3.6)
 
     def test_parsing3(self):
         """Does the Mi TEMP BT data parser works correctly for negative single digit values? Value: T=-9.3 H=36.6"""
         poller = MiTempBtPoller(None, MockBackend)
-        data = bytearray([0x54, 0x3d, 0x2d, 0x39, 0x2e, 0x33, 0x20,
-                          0x48, 0x3d, 0x33, 0x36, 0x2e, 0x36]).decode("utf-8").strip(' \n\t')
-        poller._cache = data
-        poller._last_read = datetime.now()
+        data = bytes([0x54, 0x3d, 0x2d, 0x39, 0x2e, 0x33, 0x20,
+                      0x48, 0x3d, 0x33, 0x36, 0x2e, 0x36])
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, data)
         self.assertEqual(poller._parse_data()[MI_TEMPERATURE], -9.3)
         self.assertEqual(poller._parse_data()[MI_HUMIDITY], 36.6)
 
     def test_parsing4(self):
         """Does the Mi TEMP BT data parser works correctly for negative double digit values? Value: T=-11.3 H=37.6"""
         poller = MiTempBtPoller(None, MockBackend)
-        data = bytearray([0x54, 0x3d, 0x2d, 0x31, 0x31, 0x2e, 0x33, 0x20,
-                          0x48, 0x3d, 0x33, 0x37, 0x2e, 0x36]).decode("utf-8").strip(' \n\t')
-        poller._cache = data
-        poller._last_read = datetime.now()
+        data = bytes([0x54, 0x3d, 0x2d, 0x31, 0x31, 0x2e, 0x33, 0x20,
+                      0x48, 0x3d, 0x33, 0x37, 0x2e, 0x36])
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, data)
         self.assertEqual(poller._parse_data()[MI_TEMPERATURE], -11.3)
         self.assertEqual(poller._parse_data()[MI_HUMIDITY], 37.6)
 
     def test_parsing5(self):
         """Does the Mi TEMP BT data parser works correctly with spurious binary data? Value: T=-11.3 H=53.0\x02"""
         poller = MiTempBtPoller(None, MockBackend)
-        data = bytearray([0x54, 0x3d, 0x2d, 0x31, 0x31, 0x2e, 0x33, 0x20,
-                          0x48, 0x3d, 0x35, 0x33, 0x2e, 0x30, 0x02]).decode("utf-8").strip(' \n\t')
-        poller._cache = data
-        poller._last_read = datetime.now()
+        data = bytes([0x54, 0x3d, 0x2d, 0x31, 0x31, 0x2e, 0x33, 0x20,
+                      0x48, 0x3d, 0x35, 0x33, 0x2e, 0x30, 0x02])
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, data)
         self.assertEqual(poller._parse_data()[MI_TEMPERATURE], -11.3)
         self.assertEqual(poller._parse_data()[MI_HUMIDITY], 53.0)
+
+    def test_parsing_invalid(self):
+        """Does the Mi TEMP BT data parser reject data without temperature and humidity?"""
+        self.assertIsNone(parse_sensor_data(INVALID_DATA))
+        self.assertIsNone(parse_sensor_data(b'T=25.6'))
+        poller = MiTempBtPoller(None, MockBackend)
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, INVALID_DATA)
+        self.assertFalse(poller.cache_available())
+
+    def test_parsing_humidity_over_100(self):
+        """Is a humidity over 100% rejected? Value: T=25.6 H=123.6"""
+        poller = MiTempBtPoller(None, MockBackend)
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, b'T=25.6 H=123.6')
+        self.assertFalse(poller.cache_available())
+
+    def test_reading(self):
+        """Is the whole reading available at once?"""
+        poller = MiTempBtPoller(None, MockBackend)
+        poller.handleNotification(_HANDLE_READ_WRITE_SENSOR_DATA, b'T=25.6 H=23.6\x00')
+        reading = poller.reading()
+        self.assertEqual((25.6, 23.6), (reading.temperature, reading.humidity))
+        self.assertIsNotNone(reading.timestamp)
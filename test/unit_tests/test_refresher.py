@@ -0,0 +1,136 @@
+"""Tests for stale-while-revalidate reads and the refresher module."""
+from datetime import datetime, timedelta
+from threading import Thread
+import time
+import unittest
+from test.helper import LatencyMockBackend, MockBackend, ConnectExceptionBackend
+
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+from mitemp_bt.refresher import BackgroundRefresher
+from mitemp_bt.retry import RetryPolicy
+
+
+# takes some time to deliver the sensor data
+SlowMockBackend = LatencyMockBackend.configured(notification_latency=0.2)
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    """Tests for reading an expired cache while it is refreshed."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    def test_stale_read(self):
+        """An expired cache is returned immediately and refreshed in the background."""
+        poller = MiTempBtPoller(self.TEST_MAC, SlowMockBackend, cache_timeout=60, stale_while_revalidate=True)
+        backend = poller._bt_interface._backend
+        backend.temperature = 1.0
+        self.assertIsNone(poller.cache_age())
+        self.assertAlmostEqual(1.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+
+        # let the cache expire
+        poller._last_read -= timedelta(seconds=120)
+        poller._cache = poller._cache._replace(timestamp=poller._last_read)
+        backend.temperature = 2.0
+
+        start = time.time()
+        self.assertAlmostEqual(1.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertAlmostEqual(1.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertLess(time.time() - start, 0.1)
+        self.assertGreaterEqual(poller.cache_age(), timedelta(seconds=120))
+
+        # the refresh is done once the lock is free again
+        with poller.lock:
+            pass
+        self.assertAlmostEqual(2.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertLess(poller.cache_age(), timedelta(seconds=10))
+        self.assertEqual(2, backend.connect_count)
+
+    def test_fresh_read_during_refresh(self):
+        """A valid cache is returned immediately while a refresh holds the lock."""
+        poller = MiTempBtPoller(self.TEST_MAC, SlowMockBackend, cache_timeout=60, stale_while_revalidate=True)
+        poller.parameter_value(MI_TEMPERATURE)
+        refresh = Thread(target=poller.reading, kwargs={'read_cached': False})
+        refresh.start()
+        while not poller.lock.locked():
+            time.sleep(0.001)
+        start = time.time()
+        self.assertAlmostEqual(0.0, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertLess(time.time() - start, 0.1)
+        refresh.join()
+        self.assertEqual(2, poller._bt_interface._backend.connect_count)
+
+
+class TestBackgroundRefresher(unittest.TestCase):
+    """Tests for the BackgroundRefresher class."""
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    def test_refresh_due(self):
+        """Only pollers close to expiry are refreshed."""
+        fresh = MiTempBtPoller('11:22:33:44:55:01', MockBackend, cache_timeout=600)
+        expiring = MiTempBtPoller('11:22:33:44:55:02', MockBackend, cache_timeout=600)
+        empty = MiTempBtPoller('11:22:33:44:55:03', MockBackend, cache_timeout=600)
+        fresh.parameter_value(MI_TEMPERATURE)
+        expiring.parameter_value(MI_TEMPERATURE)
+        expiring._last_read = datetime.now() - timedelta(seconds=570)
+
+        refresher = BackgroundRefresher([fresh, expiring], margin=60)
+        refresher.add(empty)
+        wait = refresher.refresh_due()
+        self.assertEqual(1, fresh._bt_interface._backend.connect_count)
+        self.assertEqual(2, expiring._bt_interface._backend.connect_count)
+        self.assertEqual(1, empty._bt_interface._backend.connect_count)
+        self.assertTrue(empty.cache_available())
+        self.assertLessEqual(wait, 60)
+
+        refresher.remove(empty)
+        refresher.refresh_due()
+        self.assertEqual(2, expiring._bt_interface._backend.connect_count)
+
+    def test_failing_sensor(self):
+        """A failing sensor is not retried immediately."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', ConnectExceptionBackend, retries=0)
+        refresher = BackgroundRefresher([poller], margin=400, max_wait=600)
+        self.assertGreater(refresher.refresh_due(), 200)
+
+    def test_failure_backoff(self):
+        """A failing sensor is tried again after its failure blackout, doubled for every further failure."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', ConnectExceptionBackend,
+                                retry_policy=RetryPolicy(retries=0, failure_blackout=120))
+        refresher = BackgroundRefresher([poller], max_wait=60, max_backoff=400)
+        waits = []
+        for _ in range(4):
+            refresher._refresh(poller)
+            waits.append(round((refresher._due(poller) - datetime.now()).total_seconds()))
+        self.assertEqual([120, 240, 400, 400], waits)
+
+    def test_invalid_data(self):
+        """Invalid data of the sensor is a failure as well."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', MockBackend, cache_timeout=600,
+                                retry_policy=RetryPolicy(retries=0, failure_blackout=300))
+        refresher = BackgroundRefresher([poller], margin=60)
+        refresher.refresh_due()
+        poller._bt_interface._backend.humidity = 120.0
+        refresher._refresh(poller)
+        self.assertFalse(poller.cache_available())
+        self.assertEqual(1, refresher._failures[poller])
+        self.assertGreater(refresher._due(poller), datetime.now() + timedelta(seconds=290))
+        poller._bt_interface._backend.humidity = 50.0
+        refresher._refresh(poller)
+        self.assertGreater(refresher._due(poller), datetime.now() + timedelta(seconds=530))
+
+    def test_thread(self):
+        """The background thread refreshes the pollers."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', MockBackend)
+        refresher = BackgroundRefresher([poller])
+        refresher.start()
+        for _ in range(50):
+            if poller.cache_available():
+                break
+            time.sleep(0.01)
+        refresher.stop()
+        self.assertTrue(poller.cache_available())
@@ -0,0 +1,127 @@
+"""Tests for the retry module."""
+from datetime import datetime
+import time
+import unittest
+from test.helper import MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+from mitemp_bt.retry import RetryPolicy, deadline_from_timeout
+
+
+class FlakyMockBackend(MockBackend):
+    """MockBackend failing the first connections."""
+
+    failures = 2
+
+    def __init__(self, adapter='hci0', address_type='public'):
+        super().__init__(adapter, address_type)
+        self.notification_timeouts = []
+
+    def connect(self, mac):
+        super().connect(mac)
+        if self.connect_count <= self.failures:
+            raise BluetoothBackendException('radio glitch')
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        self.notification_timeouts.append(notification_timeout)
+        super().wait_for_notification(handle, delegate, notification_timeout)
+
+
+class Flaky:  # pylint: disable=too-few-public-methods
+    """Callable failing a number of times."""
+
+    def __init__(self, failures, exception=BluetoothBackendException):
+        self.failures = failures
+        self.exception = exception
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exception('failure {}'.format(self.calls))
+        return 'result'
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Tests for the RetryPolicy class."""
+
+    def test_retries(self):
+        """Failures are retried up to the configured number."""
+        policy = RetryPolicy(retries=2, backoff=0)
+        flaky = Flaky(2)
+        self.assertEqual('result', policy.call(flaky))
+        self.assertEqual(3, flaky.calls)
+
+        flaky = Flaky(3)
+        with self.assertRaises(BluetoothBackendException):
+            policy.call(flaky)
+        self.assertEqual(3, flaky.calls)
+
+    def test_retry_on(self):
+        """Only the configured exceptions are retried."""
+        flaky = Flaky(1, ValueError)
+        with self.assertRaises(ValueError):
+            RetryPolicy(retries=2, backoff=0).call(flaky)
+        self.assertEqual(1, flaky.calls)
+
+        flaky = Flaky(1, ValueError)
+        self.assertEqual('result', RetryPolicy(retries=2, backoff=0, retry_on=[ValueError]).call(flaky))
+
+    def test_delay(self):
+        """Backoff grows exponentially up to the maximum, reduced by the jitter."""
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=0.5)
+        for attempt, maximum in enumerate([1, 2, 4, 5, 5]):
+            delay = policy.delay(attempt)
+            self.assertLessEqual(delay, maximum)
+            self.assertGreaterEqual(delay, maximum / 2)
+        self.assertEqual(4, RetryPolicy(backoff=1, jitter=0).delay(2))
+
+    def test_deadline(self):
+        """No retry is started if its backoff exceeds the deadline."""
+        flaky = Flaky(1)
+        start = time.monotonic()
+        with self.assertRaises(BluetoothBackendException):
+            RetryPolicy(retries=3, backoff=10, jitter=0).call(flaky, deadline_from_timeout(1))
+        self.assertEqual(1, flaky.calls)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class TestPollerRetries(unittest.TestCase):
+    """Tests for retries of the MiTempBtPoller."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    def test_transient_failures(self):
+        """Transient failures are retried within the same read."""
+        poller = MiTempBtPoller(self.TEST_MAC, FlakyMockBackend, retry_policy=RetryPolicy(retries=2, backoff=0))
+        poller._bt_interface._backend.temperature = 11.1
+        self.assertAlmostEqual(11.1, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertEqual(3, poller._bt_interface._backend.connect_count)
+
+    def test_failure_blackout(self):
+        """After all retries failed, the sensor is not contacted for the blackout."""
+        poller = MiTempBtPoller(self.TEST_MAC, FlakyMockBackend, cache_timeout=600,
+                                retry_policy=RetryPolicy(retries=1, backoff=0, failure_blackout=60))
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_TEMPERATURE)
+        self.assertEqual(2, poller._bt_interface._backend.connect_count)
+        self.assertAlmostEqual(60, (poller.cache_expiry() - datetime.now()).total_seconds(), delta=1)
+
+    def test_timeout(self):
+        """The wait for the sensor data is cut short by the timeout."""
+        poller = MiTempBtPoller(self.TEST_MAC, FlakyMockBackend, retry_policy=RetryPolicy(retries=2, backoff=0))
+        poller.parameter_value(MI_TEMPERATURE, timeout=3)
+        self.assertLessEqual(poller._bt_interface._backend.notification_timeouts[0], 3)
+
+    def test_timeout_exceeded(self):
+        """Nothing is read once the timeout is exceeded."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend)
+        with self.assertRaises(BluetoothBackendException):
+            poller.parameter_value(MI_TEMPERATURE, timeout=0)
+        self.assertEqual(0, poller._bt_interface._backend.connect_count)
+        # running out of time is not the fault of the sensor, so there is no blackout
+        self.assertIsNone(poller.cache_expiry())
@@ -0,0 +1,148 @@
+"""Tests for the scheduler module."""
+from datetime import datetime, timedelta
+import unittest
+from test.helper import MockBackend, ConnectExceptionBackend
+
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, Reading
+from mitemp_bt.retry import RetryPolicy
+from mitemp_bt.scheduler import AdaptiveScheduler, _SensorState
+
+START = datetime(2021, 5, 1, 12, 0, 0)
+
+
+class TestAdaptiveScheduler(unittest.TestCase):
+    """Tests for the AdaptiveScheduler class."""
+
+    # access to protected members is fine in testing
+    # pylint: disable = protected-access
+
+    @staticmethod
+    def _state(scheduler, temperatures, humidity=50.0, minutes=10):
+        """Return the state of a sensor after readings "minutes" apart."""
+        state = _SensorState(START)
+        for i, temperature in enumerate(temperatures):
+            scheduler._observe(state, Reading(temperature, humidity, START + timedelta(minutes=minutes * i)))
+        return state
+
+    def test_interval(self):
+        """Stable sensors are read rarely, changing ones often."""
+        scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, temperature_step=0.2)
+        self.assertEqual(60, scheduler._next_interval(self._state(scheduler, [20.0])))
+        self.assertEqual(1800, scheduler._next_interval(self._state(scheduler, [20.0, 20.0, 20.0])))
+        # 0.1 degrees in 10 minutes: 0.2 degrees in 20 minutes
+        self.assertAlmostEqual(1200, scheduler._next_interval(self._state(scheduler, [20.0, 20.1])))
+        self.assertEqual(60, scheduler._next_interval(self._state(scheduler, [20.0, 25.0])))
+
+    def test_smoothing(self):
+        """A single jump shortens the interval, but not down to what the jump alone suggests."""
+        scheduler = AdaptiveScheduler(min_interval=10, max_interval=1800, temperature_step=0.2, smoothing=0.5)
+        state = self._state(scheduler, [20.0, 20.0, 20.0, 20.6])
+        # 0.6 degrees in 10 minutes alone would give 200 seconds
+        self.assertAlmostEqual(400, scheduler._next_interval(state))
+
+    def test_humidity(self):
+        """A changing humidity shortens the interval as well."""
+        scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, humidity_step=1.0)
+        state = self._state(scheduler, [20.0, 20.0])
+        scheduler._observe(state, Reading(20.0, 52.0, START + timedelta(minutes=20)))
+        self.assertAlmostEqual(600, scheduler._next_interval(state))
+
+    def test_low_battery(self):
+        """Sensors with a low battery are read less often."""
+        scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, low_battery=20, low_battery_factor=2)
+        state = self._state(scheduler, [20.0, 20.1])
+        state.battery = 50
+        self.assertAlmostEqual(1200, scheduler._next_interval(state))
+        state.battery = 10
+        self.assertAlmostEqual(1800, scheduler._next_interval(state))
+        state = self._state(scheduler, [20.0, 20.2])
+        state.battery = 10
+        self.assertAlmostEqual(1200, scheduler._next_interval(state))
+
+    def test_fewer_connections(self):
+        """Over a day, fewer reads than a fixed interval keep every sensor as fresh."""
+        scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, temperature_step=0.2)
+        # a stable room and a greenhouse, in degrees per second
+        rates = [0.1 / 3600, 1.0 / 600]
+        reads = 0
+        for rate in rates:
+            state = _SensorState(START)
+            seconds = 0
+            while seconds < 24 * 3600:
+                scheduler._observe(state, Reading(20.0 + rate * seconds, 50.0, START + timedelta(seconds=seconds)))
+                seconds += scheduler._next_interval(state)
+                reads += 1
+        # a fixed interval needs to be short enough for the greenhouse: 0.2 degrees at 1 degree per 10 minutes
+        fixed_reads = len(rates) * 24 * 3600 / 120
+        self.assertLess(reads, 0.6 * fixed_reads)
+
+    def test_stagger(self):
+        """The first reads of sensors on the same adapter are spaced out."""
+        pollers = [MiTempBtPoller('11:22:33:44:55:0{}'.format(i), MockBackend) for i in range(3)]
+        other = MiTempBtPoller('11:22:33:44:55:10', MockBackend, adapter='hci1')
+        scheduler = AdaptiveScheduler(pollers + [other], spacing=5)
+        dues = [scheduler.due(poller) for poller in pollers]
+        self.assertEqual([timedelta(seconds=5)] * 2, [dues[1] - dues[0], dues[2] - dues[1]])
+        self.assertLess(abs(scheduler.due(other) - dues[0]), timedelta(seconds=1))
+
+    def test_read_due(self):
+        """Due sensors are read and planned again."""
+        pollers = [MiTempBtPoller('11:22:33:44:55:0{}'.format(i), MockBackend) for i in range(2)]
+        pollers[0]._bt_interface._backend.battery_level = 80
+        scheduler = AdaptiveScheduler(pollers, min_interval=60, spacing=0)
+        wait = scheduler.read_due()
+        self.assertTrue(all(poller.cache_available() for poller in pollers))
+        # the battery of the second sensor is empty
+        self.assertEqual([60, 120], [scheduler.interval(poller) for poller in pollers])
+        self.assertGreater(wait, 50)
+        scheduler.read_due()
+        self.assertEqual(1, pollers[0]._bt_interface._backend.connect_count)
+        scheduler.remove(pollers[0])
+        with self.assertRaises(KeyError):
+            scheduler.due(pollers[0])
+
+    def test_failing_sensor(self):
+        """A failing sensor is tried again after the minimum interval."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', ConnectExceptionBackend, retries=0)
+        scheduler = AdaptiveScheduler([poller], min_interval=120, max_wait=600)
+        self.assertGreater(scheduler.read_due(), 100)
+        self.assertIsNone(scheduler.interval(poller))
+        self.assertGreater(scheduler.due(poller), datetime.now() + timedelta(seconds=100))
+
+    def test_failure_backoff(self):
+        """A failing sensor is tried again less and less often, up to the maximum interval."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', ConnectExceptionBackend,
+                                retry_policy=RetryPolicy(retries=0, failure_blackout=0))
+        scheduler = AdaptiveScheduler([poller], min_interval=60, max_interval=300)
+        state = scheduler._sensors[poller]
+        intervals = []
+        for _ in range(5):
+            scheduler._read(poller, state)
+            intervals.append(round((state.due - datetime.now()).total_seconds()))
+        self.assertEqual([60, 120, 240, 300, 300], intervals)
+
+    def test_failure_blackout(self):
+        """A failing sensor is not read before the failure blackout of its poller is over."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', MockBackend,
+                                retry_policy=RetryPolicy(retries=0, failure_blackout=900))
+        poller._bt_interface._backend.battery_level = 80
+        scheduler = AdaptiveScheduler([poller], min_interval=60, max_interval=300)
+        scheduler.read_due()
+        self.assertEqual(60, scheduler.interval(poller))
+        # the sensor sends invalid data, the poller clears its cache and raises
+        poller._bt_interface._backend.humidity = 120.0
+        scheduler._read(poller, scheduler._sensors[poller])
+        self.assertFalse(poller.cache_available())
+        self.assertEqual(1, scheduler._sensors[poller].failures)
+        self.assertGreater(scheduler.due(poller), datetime.now() + timedelta(seconds=890))
+
+    def test_no_new_data(self):
+        """A sensor sending no data is a failure, although the poller keeps the old reading."""
+        poller = MiTempBtPoller('11:22:33:44:55:01', MockBackend,
+                                retry_policy=RetryPolicy(retries=0, failure_blackout=0))
+        scheduler = AdaptiveScheduler([poller], min_interval=60, max_interval=300)
+        scheduler.read_due()
+        poller._bt_interface._backend.handle_0x0010_raw = None
+        scheduler._read(poller, scheduler._sensors[poller])
+        self.assertTrue(poller.cache_available())
+        self.assertEqual(1, scheduler._sensors[poller].failures)
@@ -0,0 +1,79 @@
+"""Tests for the shared_cache module."""
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+from threading import Thread
+import unittest
+from test.helper import MockBackend
+
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, Reading, MI_TEMPERATURE
+from mitemp_bt.shared_cache import SharedReadingCache
+
+
+class TestSharedReadingCache(unittest.TestCase):
+    """Tests for the SharedReadingCache class."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        """Only newer readings replace stored ones."""
+        cache = SharedReadingCache(self.path)
+        self.assertIsNone(cache.get(self.TEST_MAC))
+        now = datetime.now().replace(microsecond=0)
+        cache.put(self.TEST_MAC, Reading(20.5, 40.0, now))
+        cache.put(self.TEST_MAC, Reading(19.0, 41.0, now - timedelta(seconds=10)))
+        self.assertEqual(Reading(20.5, 40.0, now), cache.get(self.TEST_MAC.lower()))
+
+    def test_refresh_lease(self):
+        """Only one thread or process may hold the lease of a sensor."""
+        cache = SharedReadingCache(self.path)
+        self.assertTrue(cache.acquire_refresh(self.TEST_MAC))
+        self.assertTrue(cache.acquire_refresh(self.TEST_MAC))
+
+        results = []
+        other = Thread(target=lambda: results.append(SharedReadingCache(self.path).acquire_refresh(self.TEST_MAC)))
+        other.start()
+        other.join()
+        self.assertEqual([False], results)
+
+        cache.release_refresh(self.TEST_MAC)
+        other = Thread(target=lambda: results.append(SharedReadingCache(self.path).acquire_refresh(self.TEST_MAC)))
+        other.start()
+        other.join()
+        self.assertEqual([False, True], results)
+
+    def test_expired_lease(self):
+        """An expired lease can be taken over."""
+        cache = SharedReadingCache(self.path, lease_timeout=-1)
+        self.assertTrue(cache.acquire_refresh(self.TEST_MAC))
+        results = []
+        other = Thread(target=lambda: results.append(SharedReadingCache(self.path).acquire_refresh(self.TEST_MAC)))
+        other.start()
+        other.join()
+        self.assertEqual([True], results)
+
+    def test_pollers(self):
+        """A reading of one poller is reused by another one."""
+        first = MiTempBtPoller(self.TEST_MAC, MockBackend, shared_cache=SharedReadingCache(self.path))
+        second = MiTempBtPoller(self.TEST_MAC, MockBackend, shared_cache=SharedReadingCache(self.path))
+        first._bt_interface._backend.temperature = 23.4  # pylint: disable=protected-access
+
+        self.assertAlmostEqual(23.4, first.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertAlmostEqual(23.4, second.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertEqual(1, first._bt_interface._backend.connect_count)  # pylint: disable=protected-access
+        self.assertEqual(0, second._bt_interface._backend.connect_count)  # pylint: disable=protected-access
+
+        # a forced read goes to the sensor and is shared again
+        second._bt_interface._backend.temperature = 25.0  # pylint: disable=protected-access
+        self.assertAlmostEqual(25.0, second.parameter_value(MI_TEMPERATURE, read_cached=False), delta=0.01)
+        first.clear_cache()
+        self.assertAlmostEqual(25.0, first.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertEqual(1, first._bt_interface._backend.connect_count)  # pylint: disable=protected-access
@@ -0,0 +1,94 @@
+"""Tests for the tracing module."""
+import json
+import os
+import shutil
+import tempfile
+from threading import Timer
+import unittest
+from test.helper import MockBackend
+
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+from mitemp_bt.tracing import JsonLinesExporter, Tracer
+
+
+def _names(span):
+    """Return the span tree as nested (name, children) tuples."""
+    return span['name'], [_names(child) for child in span['children']]
+
+
+class TestTracing(unittest.TestCase):
+    """Tests for tracing the MiTempBtPoller."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def setUp(self):
+        self.traces = []
+        self.tracer = Tracer(lambda span: self.traces.append(span.to_dict()))
+
+    def test_nesting(self):
+        """Spans are nested per thread and the tree is exported when the root ends."""
+        with self.tracer.span('root') as root:
+            with self.tracer.span('child', {'key': 1}):
+                pass
+            self.assertEqual([], self.traces)
+        self.assertEqual(1, len(self.traces))
+        child = self.traces[0]['children'][0]
+        self.assertEqual(root.trace_id, child['trace_id'])
+        self.assertEqual(root.span_id, child['parent_span_id'])
+        self.assertEqual({'key': 1}, child['attributes'])
+        self.assertLessEqual(root.start_time, root.end_time)
+
+    def test_error(self):
+        """Exceptions mark the span as failed."""
+        with self.assertRaises(ValueError):
+            with self.tracer.span('root'):
+                raise ValueError('broken')
+        self.assertEqual('ERROR', self.traces[0]['status'])
+        self.assertEqual('ValueError', self.traces[0]['attributes']['exception.type'])
+
+    def test_poll(self):
+        """A cold read traces all phases."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, tracer=self.tracer)
+        poller.parameter_value(MI_TEMPERATURE)
+        self.assertEqual(
+            ('mitemp.parameter_value', [('mitemp.reading', [
+                ('mitemp.refresh', [
+                    ('mitemp.lock_wait', []),
+                    ('mitemp.connect', []),
+                    ('mitemp.read_firmware', [('mitemp.read_handle', []), ('mitemp.read_handle', [])]),
+                    ('mitemp.read_handle', []),
+                    ('mitemp.notification_wait', [('mitemp.parse', [])]),
+                ]),
+            ])]),
+            _names(self.traces[0]))
+        self.assertEqual(self.TEST_MAC, self.traces[0]['attributes']['mitemp.mac'])
+
+        poller.parameter_value(MI_TEMPERATURE)
+        self.assertEqual(('mitemp.parameter_value', [('mitemp.reading', [])]), _names(self.traces[1]))
+
+    def test_lock_wait(self):
+        """Only waiting for a running read of the poller is traced as lock wait."""
+        poller = MiTempBtPoller(self.TEST_MAC, MockBackend, tracer=self.tracer)
+        poller.parameter_value(MI_TEMPERATURE)
+        poller.lock.acquire()  # pylint: disable=consider-using-with
+        timer = Timer(0.05, poller.lock.release)
+        timer.start()
+        poller.parameter_value(MI_TEMPERATURE)
+        timer.join()
+        self.assertEqual(('mitemp.parameter_value', [('mitemp.reading', [('mitemp.lock_wait', [])])]),
+                         _names(self.traces[1]))
+
+    def test_json_lines(self):
+        """Every trace is written as one line."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trace.jsonl')
+            poller = MiTempBtPoller(self.TEST_MAC, MockBackend, tracer=Tracer(JsonLinesExporter(path)))
+            poller.parameter_value(MI_TEMPERATURE)
+            poller.firmware_version()
+            with open(path, encoding='utf-8') as trace_file:
+                traces = [json.loads(line) for line in trace_file]
+            self.assertEqual(['mitemp.parameter_value', 'mitemp.firmware_version'],
+                             [trace['name'] for trace in traces])
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,136 @@
+"""Tests for the worker_pool module."""
+import os
+from threading import Barrier, Thread
+import time
+import unittest
+from test.helper import MockBackend
+
+from btlewrap.base import BluetoothBackendException
+from mitemp_bt.adapter import AdapterManager
+from mitemp_bt.mitemp_bt_poller import MiTempBtPoller, MI_TEMPERATURE
+from mitemp_bt.retry import RetryPolicy
+from mitemp_bt.worker_pool import WorkerPool
+
+HANG_MAC = '11:22:33:44:55:01'
+CRASH_MAC = '11:22:33:44:55:02'
+
+
+class MisbehavingMockBackend(MockBackend):
+    """MockBackend in a worker that hangs or crashes for some sensors."""
+
+    def __init__(self, adapter='hci0', address_type='public'):
+        super().__init__(adapter, address_type)
+        self.temperature = 21.5
+
+    def connect(self, mac):
+        super().connect(mac)
+        if mac == HANG_MAC:
+            time.sleep(60)
+        if mac == CRASH_MAC:
+            os._exit(1)  # pylint: disable=protected-access
+
+
+class SlowMockBackend(MockBackend):
+    """MockBackend taking some time to deliver the sensor data."""
+
+    def wait_for_notification(self, handle, delegate, notification_timeout):
+        time.sleep(0.3)
+        super().wait_for_notification(handle, delegate, notification_timeout)
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Tests for the WorkerPool class."""
+
+    TEST_MAC = '11:22:33:44:55:66'
+
+    def setUp(self):
+        self.pool = WorkerPool(MisbehavingMockBackend, workers=1, request_timeout=0.5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _poller(self, mac, **kwargs):
+        """Return a poller using the pool, without retries."""
+        return MiTempBtPoller(mac, self.pool.backend, retry_policy=RetryPolicy(retries=0),
+                              adapter_manager=AdapterManager(), **kwargs)
+
+    def test_read(self):
+        """Values are read in the worker processes."""
+        poller = self._poller(self.TEST_MAC)
+        self.assertAlmostEqual(21.5, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+        self.assertEqual('00.00.66', poller.firmware_version())
+        self.assertEqual('MJ_HT_V1', poller.name())
+
+    def test_hang(self):
+        """A hanging worker is killed after the request timeout and replaced."""
+        start = time.monotonic()
+        with self.assertRaises(BluetoothBackendException):
+            self._poller(HANG_MAC).parameter_value(MI_TEMPERATURE)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(1, self.pool.restarts)
+        self.assertAlmostEqual(21.5, self._poller(self.TEST_MAC).parameter_value(MI_TEMPERATURE), delta=0.01)
+
+    def test_crash(self):
+        """A crashed worker is replaced."""
+        with self.assertRaises(BluetoothBackendException):
+            self._poller(CRASH_MAC).parameter_value(MI_TEMPERATURE)
+        self.assertEqual(1, self.pool.restarts)
+        self.assertAlmostEqual(21.5, self._poller(self.TEST_MAC).parameter_value(MI_TEMPERATURE), delta=0.01)
+
+    def test_backend_error(self):
+        """Exceptions of the backend are raised in the caller and the worker is kept."""
+        poller = self._poller(self.TEST_MAC)
+        with self.assertRaises(BluetoothBackendException):
+            with poller._connect() as connection:  # pylint: disable=protected-access
+                connection.read_handle(0x99)
+        self.assertEqual(0, self.pool.restarts)
+        self.assertAlmostEqual(21.5, poller.parameter_value(MI_TEMPERATURE), delta=0.01)
+
+    def test_concurrent_checkout(self):
+        """Workers are started once, even if the first checkouts are concurrent."""
+        pool = WorkerPool(MisbehavingMockBackend, workers=2)
+        barrier = Barrier(2)
+        workers = []
+
+        def checkout():
+            barrier.wait()
+            workers.append(pool.checkout(5))
+
+        threads = [Thread(target=checkout) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, len(set(workers)))
+        self.assertEqual(2, pool._started)  # pylint: disable=protected-access
+        for worker in workers:
+            pool.checkin(worker)
+        pool.close()
+
+    def test_close(self):
+        """Closing the pool stops the idle workers and those checked in later."""
+        pool = WorkerPool(MisbehavingMockBackend, workers=2)
+        busy = pool.checkout(5)
+        pool.close()
+        with self.assertRaises(BluetoothBackendException):
+            pool.checkout(5)
+        self.assertTrue(busy.process.is_alive())
+        pool.checkin(busy)
+        self.assertFalse(busy.process.is_alive())
+        self.assertEqual([], pool._workers)  # pylint: disable=protected-access
+
+    def test_parallel(self):
+        """Several workers read sensors on the same adapter at once, if the adapter allows it."""
+        manager = AdapterManager(max_connections=2)
+        with WorkerPool(SlowMockBackend, workers=2) as pool:
+            pollers = [MiTempBtPoller('11:22:33:44:55:{:02X}'.format(i), pool.backend, adapter_manager=manager)
+                       for i in range(2)]
+            pollers[0].firmware_version()
+            pollers[1].firmware_version()
+            start = time.monotonic()
+            threads = [Thread(target=poller.parameter_value, args=(MI_TEMPERATURE,)) for poller in pollers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLess(time.monotonic() - start, 0.55)